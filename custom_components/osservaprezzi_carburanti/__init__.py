@@ -1,23 +1,59 @@
 """Integrazione Osservaprezzi Carburanti.
 
 Inizializzazione minima: salva la configurazione YAML (se presente) in
-`hass.data` affinché le piattaforme possano leggerla.
+`hass.data` affinché le piattaforme possano leggerla e acquisisce dal registro
+condiviso i coordinator degli impianti di ogni config entry.
 """
 from __future__ import annotations
 
 from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
 
-from .const import DOMAIN, DATA_COORDINATORS
+from .const import (
+    CONF_ADAPTIVE,
+    CONF_LONG_TERM_STATISTICS,
+    CONF_OPENDATA_PATH,
+    CONF_REFRESH_CONCURRENCY,
+    CONF_REFRESH_MODE,
+    CONF_REFRESH_WINDOW,
+    DEFAULT_ADAPTIVE,
+    DEFAULT_REFRESH_MODE,
+    DEFAULT_SCAN_INTERVAL,
+    DOMAIN,
+)
+from .coordinator import async_get_registry, entry_stations
+from .longterm import LongTermStatistics
+from .services import async_setup_services
+from .views import BrandLogoView
+from .websocket import async_setup_websocket
 
 
 async def async_setup(hass: HomeAssistant, config: dict) -> bool:
     """Set up the osservaprezzi_carburanti component from YAML configuration."""
     hass.data.setdefault(DOMAIN, {})
-    hass.data.setdefault(DATA_COORDINATORS, {})
+    registry = async_get_registry(hass)
+    hass.http.register_view(BrandLogoView(hass))
+    async_setup_services(hass)
+    async_setup_websocket(hass)
+    # loghi dalla cache su disco prima di qualsiasi refresh (altrimenti il primo refresh
+    # li riscaricherebbe); il download, se la cache manca o è scaduta, resta in background
+    await registry.logo_loader.async_load()
+    # ultimi payload validi: i coordinator partono da qui invece che vuoti
+    await registry.payload_cache.async_load()
+    await registry.history.async_load()
 
     if DOMAIN in config:
         hass.data[DOMAIN]["yaml_config"] = config[DOMAIN]
+        registry.scheduler.configure(
+            window=config[DOMAIN].get(CONF_REFRESH_WINDOW),
+            concurrency=config[DOMAIN].get(CONF_REFRESH_CONCURRENCY),
+        )
+        # file open data locali (es. scaricati da un cron) invece del download dal sito MIMIT
+        registry.opendata.path = config[DOMAIN].get(CONF_OPENDATA_PATH)
+        if config[DOMAIN].get(CONF_LONG_TERM_STATISTICS):
+            # prezzi come statistiche orarie: i sensori si possono escludere dal recorder
+            registry.statistics = LongTermStatistics(hass, registry)
+            await registry.statistics.async_start()
 
     return True
 
@@ -25,12 +61,20 @@ async def async_setup(hass: HomeAssistant, config: dict) -> bool:
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up a config entry (forward to platforms)."""
     hass.data.setdefault(DOMAIN, {})
-    hass.data.setdefault(DATA_COORDINATORS, {})
+    registry = async_get_registry(hass)
 
     # store entry data for platforms to read
     hass.data[DOMAIN].setdefault("entries", {})
     hass.data[DOMAIN]["entries"][entry.entry_id] = entry.data
 
+    # un coordinator condiviso per impianto, prima che le piattaforme lo cerchino
+    data = entry.data or {}
+    scan_interval = data.get("scan_interval") or DEFAULT_SCAN_INTERVAL
+    mode = data.get(CONF_REFRESH_MODE, DEFAULT_REFRESH_MODE)
+    adaptive = bool(data.get(CONF_ADAPTIVE, DEFAULT_ADAPTIVE))
+    for station in entry_stations(data):
+        registry.acquire(station["id"], entry.entry_id, scan_interval, mode, adaptive)
+
     # forward setup to sensor platform
     await hass.config_entries.async_forward_entry_setups(entry, ["sensor", "binary_sensor"])
 
@@ -40,11 +84,8 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry and its platforms."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, ["sensor", "binary_sensor"])
-    # remove coordinators associated with this entry if any
-    coordinators = hass.data.get(DATA_COORDINATORS, {})
-    to_remove = [k for k in coordinators.keys() if isinstance(k, tuple) and k[0] == entry.entry_id]
-    for k in to_remove:
-        coordinators.pop(k, None)
+    # release this entry's coordinators; shared ones stay alive for the other subscribers
+    await async_get_registry(hass).async_release(entry.entry_id)
 
     hass.data.get(DOMAIN, {}).get("entries", {}).pop(entry.entry_id, None)
     return unload_ok
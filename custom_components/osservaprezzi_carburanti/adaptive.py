@@ -0,0 +1,122 @@
+"""Polling adattivo per l'integrazione Osservaprezzi Carburanti.
+
+Ogni impianto ha uno `UpdatePattern` che ricorda gli istanti in cui MIMIT ha
+registrato un cambio (il `validityDate` più recente dei carburanti, altrimenti
+`insertDate`). Dall'intervallo tipico tra i cambi e dall'orario tipico in cui
+avvengono si stima il prossimo cambio: il fetch viene pianificato poco dopo,
+mentre gli impianti che cambiano di rado vengono interrogati sempre meno spesso.
+"""
+from __future__ import annotations
+
+import statistics
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from .const import ADAPTIVE_HISTORY, ADAPTIVE_MAX_INTERVAL, ADAPTIVE_MIN_INTERVAL
+
+DAY = 86400
+# i timestamp MIMIT senza fuso sono in ora italiana
+MIMIT_TZ = ZoneInfo("Europe/Rome")
+
+
+def mimit_timestamp(value: Any) -> Optional[float]:
+    """Epoch in secondi da un timestamp MIMIT (millisecondi o stringa ISO)."""
+    if value is None or value == "":
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            return float(value) / 1000
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=MIMIT_TZ)
+        return dt.timestamp()
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def change_marker(data: Optional[Dict[str, Any]]) -> Optional[float]:
+    """Istante dell'ultimo cambio noto del payload: max `validityDate`, altrimenti `insertDate`."""
+    if not data:
+        return None
+    marks: List[float] = []
+    fuels = data.get("fuels") or data.get("carburanti") or []
+    if isinstance(fuels, list):
+        for fuel in fuels:
+            if isinstance(fuel, dict):
+                ts = mimit_timestamp(fuel.get("validityDate") or fuel.get("validity_date"))
+                if ts is not None:
+                    marks.append(ts)
+    if marks:
+        return max(marks)
+    return mimit_timestamp(data.get("insertDate"))
+
+
+class UpdatePattern:
+    """Storico dei cambi di un impianto e stima del prossimo fetch."""
+
+    def __init__(self, changes: Optional[List[float]] = None) -> None:
+        self.changes: List[float] = sorted(changes or [])[-ADAPTIVE_HISTORY:]
+        # fetch consecutivi senza cambi
+        self.misses = 0
+
+    def observe(self, data: Optional[Dict[str, Any]]) -> bool:
+        """Registra il payload ricevuto; True se contiene un cambio non ancora visto."""
+        marker = change_marker(data)
+        if marker is None or (self.changes and marker <= self.changes[-1]):
+            self.misses += 1
+            return False
+        self.changes.append(marker)
+        del self.changes[:-ADAPTIVE_HISTORY]
+        self.misses = 0
+        return True
+
+    @property
+    def typical_gap(self) -> Optional[float]:
+        """Intervallo mediano (s) tra due cambi, se lo storico è sufficiente."""
+        if len(self.changes) < 2:
+            return None
+        gaps = [b - a for a, b in zip(self.changes, self.changes[1:]) if b > a]
+        return statistics.median(gaps) if gaps else None
+
+    @property
+    def typical_time_of_day(self) -> Optional[float]:
+        """Secondo del giorno (UTC) in cui avvengono di solito i cambi."""
+        if len(self.changes) < 2:
+            return None
+        return statistics.median(ts % DAY for ts in self.changes)
+
+    def expected_change(self) -> Optional[float]:
+        """Istante stimato del prossimo cambio, allineato all'orario tipico se i cambi sono giornalieri o più rari."""
+        gap = self.typical_gap
+        if gap is None:
+            return None
+        expected = self.changes[-1] + gap
+        time_of_day = self.typical_time_of_day
+        if gap >= DAY and time_of_day is not None:
+            expected = expected - expected % DAY + time_of_day
+        return expected
+
+    def next_interval(self, now: float, default: float) -> float:
+        """Secondi fino al prossimo fetch."""
+        expected = self.expected_change()
+        if expected is None:
+            return default
+        if expected > now:
+            interval = expected - now
+        else:
+            # cambio in ritardo: si riprova dopo un tempo pari al ritardo accumulato,
+            # cioè a +15 min, +30 min, +1 h, ... dall'istante atteso
+            interval = now - expected
+        return float(min(max(interval, ADAPTIVE_MIN_INTERVAL), ADAPTIVE_MAX_INTERVAL))
+
+    def as_dict(self) -> Dict[str, Any]:
+        expected = self.expected_change()
+        return {
+            "changes": len(self.changes),
+            "typical_gap": round(self.typical_gap) if self.typical_gap is not None else None,
+            "expected_change": (
+                datetime.fromtimestamp(expected, timezone.utc).isoformat() if expected is not None else None
+            ),
+            "misses": self.misses,
+        }
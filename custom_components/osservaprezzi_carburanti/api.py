@@ -1,129 +1,425 @@
-"""API Client for Osservaprezzi Carburanti."""
+"""API Client for Osservaprezzi Carburanti.
+
+Tutte le richieste passano da `OsservaprezziAPI._request`: retry con backoff
+esponenziale e jitter per 429/5xx/timeout (rispettando `Retry-After`), un circuit
+breaker che smette di interrogare MIMIT quando è giù e contatori di latenza ed
+errori per endpoint, esposti nella diagnostica. Le richieste `servicearea/{id}`
+possono essere condizionali: `If-None-Match`/`If-Modified-Since` quando il server
+fornisce i validatori e, in ogni caso, hash del corpo per saltare la decodifica JSON
+di una risposta identica alla precedente.
+"""
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
 import logging
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
 from typing import Any, Dict, List, Optional
 
 import aiohttp
 
 from .const import (
+    API_BACKOFF_BASE,
+    API_BACKOFF_MAX,
+    API_BASE_URL,
     API_BRAND_LOGOS_URL,
+    API_CIRCUIT_RESET,
+    API_CIRCUIT_THRESHOLD,
+    API_CONNECTION_LIMIT,
+    API_MAX_RETRIES,
+    API_PROVINCES_URL,
+    API_REGIONS_URL,
     API_SEARCH_AREA_URL,
+    API_SEARCH_ZONE_URL,
+    API_TOWNS_URL,
     API_URL_TEMPLATE,
     REQUEST_TIMEOUT,
 )
+from .logos import LogoStore
 
 _LOGGER = logging.getLogger(__name__)
 
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Ritornato da `_request` quando una richiesta condizionale non ha dati nuovi
+NOT_MODIFIED = object()
+
+
+class OsservaprezziError(Exception):
+    """Errore generico dell'API Osservaprezzi."""
+
+
+class OsservaprezziConnectionError(OsservaprezziError):
+    """Timeout o errore di rete."""
+
+
+class OsservaprezziHTTPError(OsservaprezziError):
+    """Risposta HTTP con stato diverso da 200."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class OsservaprezziDataError(OsservaprezziError):
+    """Risposta non decodificabile o con un formato inatteso."""
+
+
+class OsservaprezziCircuitOpenError(OsservaprezziError):
+    """Circuit breaker aperto: nessuna richiesta finché MIMIT non torna raggiungibile."""
+
+
+# header predefiniti della sessione creata per MIMIT (vedi `CoordinatorRegistry`)
+SESSION_HEADERS = {"Accept": "application/json", "Accept-Encoding": "gzip, deflate"}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Secondi indicati da `Retry-After` (numero di secondi o data HTTP)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class CircuitBreaker:
+    """Apre il circuito dopo `threshold` errori consecutivi; riprova dopo `reset_timeout` secondi.
+
+    Da aperto lascia passare una sola richiesta di prova (half-open): se riesce il
+    circuito si richiude, altrimenti resta aperto per un altro `reset_timeout`.
+    """
+
+    def __init__(self, threshold: int = API_CIRCUIT_THRESHOLD, reset_timeout: float = API_CIRCUIT_RESET) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.open_count = 0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_request(self) -> bool:
+        """Solleva `OsservaprezziCircuitOpenError` se la richiesta non deve partire.
+
+        Ritorna True se la richiesta è la prova half-open: solo lei dovrà chiamare `release`.
+        """
+        if self.opened_at is None:
+            return False
+        if self._probing or time.monotonic() - self.opened_at < self.reset_timeout:
+            raise OsservaprezziCircuitOpenError("MIMIT non raggiungibile, circuit breaker aperto")
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or (self.opened_at is None and self.failures >= self.threshold):
+            if self.opened_at is None:
+                self.open_count += 1
+                _LOGGER.warning("MIMIT non risponde (%s errori consecutivi): richieste sospese", self.failures)
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self) -> None:
+        """Libera lo slot di prova se la richiesta è terminata senza esito (es. annullata)."""
+        self._probing = False
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "open_count": self.open_count,
+        }
+
+
+@dataclass
+class Validators:
+    """Validatori HTTP e hash del corpo dell'ultima risposta 200 di un URL."""
+
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    digest: Optional[bytes] = None
+
+    def headers(self) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+@dataclass
+class EndpointStats:
+    """Contatori di un endpoint: chiamate, retry, errori e latenza."""
+
+    requests: int = 0
+    retries: int = 0
+    failures: int = 0
+    rejected: int = 0
+    not_modified: int = 0
+    unchanged: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    last_latency: Optional[float] = None
+    last_error: Optional[str] = None
+
+    def record(self, latency: float) -> None:
+        self.requests += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.last_latency = latency
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "not_modified": self.not_modified,
+            "unchanged": self.unchanged,
+            "avg_latency": round(self.total_latency / self.requests, 3) if self.requests else None,
+            "max_latency": round(self.max_latency, 3),
+            "last_latency": round(self.last_latency, 3) if self.last_latency is not None else None,
+            "last_error": self.last_error,
+        }
+
 
 class OsservaprezziAPI:
     """Client for Osservaprezzi API."""
 
-    def __init__(self, session: aiohttp.ClientSession) -> None:
-        """Initialize the API client."""
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        base_url: str = API_BASE_URL,
+        max_retries: int = API_MAX_RETRIES,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        """Initialize the API client.
+
+        `base_url` permette di puntare il client verso un server locale (es. nei test).
+        """
         self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.stats: Dict[str, EndpointStats] = {}
+        self._validators: Dict[int, Validators] = {}
+        # connessioni contemporanee verso MIMIT: il connettore della sessione è quello di Home Assistant
+        self._connections = asyncio.Semaphore(API_CONNECTION_LIMIT)
+
+    def _url(self, url: str) -> str:
+        """Rebase one of the API_* constants on the configured base URL."""
+        if self.base_url == API_BASE_URL:
+            return url
+        return self.base_url + url[len(API_BASE_URL):]
+
+    def diagnostics(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.as_dict(),
+            "endpoints": {name: stats.as_dict() for name, stats in sorted(self.stats.items())},
+        }
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, API_BACKOFF_MAX)
+        # full jitter: evita che più istanze riprovino tutte nello stesso istante
+        return random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt))
+
+    async def _request(
+        self,
+        endpoint: str,
+        method: str,
+        url: str,
+        validators: Optional[Validators] = None,
+        conditional: bool = False,
+        **kwargs: Any,
+    ) -> Any:
+        """Esegue la richiesta con retry e circuit breaker e ritorna il JSON decodificato.
+
+        Con `validators` la risposta 200 aggiorna ETag, Last-Modified e hash del corpo;
+        con `conditional` vengono anche inviati gli header condizionali e, per una
+        risposta 304 o con corpo identico, ritorna `NOT_MODIFIED` senza decodificare.
+        """
+        stats = self.stats.setdefault(endpoint, EndpointStats())
+        try:
+            probe = self.breaker.before_request()
+        except OsservaprezziCircuitOpenError:
+            stats.rejected += 1
+            raise
+        try:
+            return await self._request_with_retry(endpoint, stats, method, url, validators, conditional, **kwargs)
+        finally:
+            # una richiesta normale non deve liberare la prova di un'altra ancora in volo
+            if probe:
+                self.breaker.release()
+
+    async def _request_with_retry(
+        self,
+        endpoint: str,
+        stats: EndpointStats,
+        method: str,
+        url: str,
+        validators: Optional[Validators],
+        conditional: bool,
+        **kwargs: Any,
+    ) -> Any:
+        conditional = conditional and validators is not None and validators.digest is not None
+        if conditional:
+            kwargs["headers"] = {**kwargs.get("headers", {}), **validators.headers()}
+        attempt = 0
+        while True:
+            retry_after: Optional[float] = None
+            start = time.monotonic()
+            try:
+                async with self._connections, self.session.request(
+                    method, url, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT), **kwargs
+                ) as resp:
+                    if resp.status == 304 and conditional:
+                        stats.record(time.monotonic() - start)
+                        stats.not_modified += 1
+                        self.breaker.record_success()
+                        return NOT_MODIFIED
+                    if resp.status == 200:
+                        body = await resp.read()
+                        stats.record(time.monotonic() - start)
+                        self.breaker.record_success()
+                        if validators is None:
+                            return self._decode(endpoint, body)
+                        digest = hashlib.blake2b(body, digest_size=16).digest()
+                        validators.etag = resp.headers.get("ETag")
+                        validators.last_modified = resp.headers.get("Last-Modified")
+                        if conditional and digest == validators.digest:
+                            stats.unchanged += 1
+                            return NOT_MODIFIED
+                        data = self._decode(endpoint, body)
+                        validators.digest = digest
+                        return data
+                    try:
+                        text = await resp.text()
+                    except UnicodeDecodeError as err:
+                        raise OsservaprezziDataError(
+                            f"{endpoint}: HTTP {resp.status} con corpo non decodificabile"
+                        ) from err
+                    error: OsservaprezziError = OsservaprezziHTTPError(
+                        resp.status, f"{endpoint}: HTTP {resp.status} - {text[:200]}"
+                    )
+                    retryable = resp.status in RETRY_STATUSES
+                    retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            except OsservaprezziDataError as err:
+                stats.failures += 1
+                stats.last_error = str(err)
+                raise
+            except (asyncio.TimeoutError, aiohttp.ClientError) as err:
+                error = OsservaprezziConnectionError(f"{endpoint}: {err.__class__.__name__} {err}".strip())
+                retryable = True
+            stats.record(time.monotonic() - start)
+
+            if not retryable:
+                # 4xx: l'API risponde, il problema è la richiesta (es. impianto inesistente)
+                self.breaker.record_success()
+                stats.failures += 1
+                stats.last_error = str(error)
+                raise error
+            if attempt >= self.max_retries:
+                self.breaker.record_failure()
+                stats.failures += 1
+                stats.last_error = str(error)
+                raise error
+
+            delay = self._backoff(attempt, retry_after)
+            attempt += 1
+            stats.retries += 1
+            _LOGGER.debug("%s fallita (%s), tentativo %s tra %.1fs", endpoint, error, attempt, delay)
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _decode(endpoint: str, body: bytes) -> Any:
+        try:
+            return json.loads(body)
+        except ValueError as err:
+            raise OsservaprezziDataError(f"{endpoint}: risposta non JSON") from err
 
     async def get_station_details(self, station_id: int) -> Dict[str, Any]:
         """Fetch details and prices for a specific station."""
-        url = API_URL_TEMPLATE.format(id=station_id)
-        async with self.session.get(url, timeout=REQUEST_TIMEOUT) as resp:
-            if resp.status != 200:
-                text = await resp.text()
-                raise Exception(f"Error fetching station {station_id}: HTTP {resp.status} - {text}")
-            
-            data = await resp.json()
-            if not isinstance(data, dict):
-                raise Exception(f"Unexpected data format for station {station_id}")
-            
-            return data
+        return await self._get_station(station_id, conditional=False)
 
-    async def get_all_logos(self) -> Dict[str | int, str]:
-        """Fetch all brand logos and return a map of Brand ID/Name -> Base64 Image."""
+    async def get_station_details_if_changed(self, station_id: int) -> Optional[Dict[str, Any]]:
+        """Come `get_station_details`, ma ritorna None se il payload non è cambiato dall'ultima richiesta."""
+        data = await self._get_station(station_id, conditional=True)
+        return None if data is NOT_MODIFIED else data
+
+    async def _get_station(self, station_id: int, conditional: bool) -> Any:
+        url = self._url(API_URL_TEMPLATE.format(id=station_id))
+        validators = self._validators.setdefault(station_id, Validators())
+        data = await self._request("servicearea", "GET", url, validators, conditional)
+        if data is not NOT_MODIFIED and not isinstance(data, dict):
+            validators.digest = None
+            raise OsservaprezziDataError(f"Unexpected data format for station {station_id}")
+        return data
+
+    def forget_station(self, station_id: int) -> None:
+        """Dimentica i validatori di un impianto non più seguito."""
+        self._validators.pop(station_id, None)
+
+    async def get_all_logos(self) -> LogoStore:
+        """Fetch all brand logos, decoded once and deduplicated by content hash."""
         try:
-            async with self.session.get(API_BRAND_LOGOS_URL, timeout=REQUEST_TIMEOUT) as resp:
-                if resp.status != 200:
-                    _LOGGER.warning("Failed to fetch brand logos: HTTP %s", resp.status)
-                    return {}
-                
-                payload = await resp.json()
-                # Structure: { "loghi": [ { "bandieraId": 123, "bandiera": "Name", "logoMarkerList": [...] }, ... ] }
-                if not isinstance(payload, dict):
-                    return {}
-                
-                data = payload.get("loghi")
-                if not isinstance(data, list):
-                    return {}
-                
-                logos_map: Dict[str | int, str] = {}
-                for item in data:
-                    brand_id = item.get("bandieraId")
-                    brand_name = item.get("bandiera")
-                    
-                    # logoMarkerList is a list of logo objects
-                    markers = item.get("logoMarkerList")
-                    if isinstance(markers, list) and markers:
-                        # Pick the first one
-                        logo_obj = markers[0]
-                        content = logo_obj.get("content")
-                        ext = logo_obj.get("estensione", "png")
-                        
-                        if content:
-                            if not content.startswith("data:"):
-                                content = f"data:image/{ext};base64,{content}"
-                            
-                            # Map by ID
-                            if brand_id:
-                                logos_map[brand_id] = content
-                                logos_map[str(brand_id)] = content
-                            
-                            # Map by Name
-                            if brand_name:
-                                logos_map[brand_name] = content
-                                # Also key by normalized/lowercase just in case
-                                logos_map[brand_name.lower()] = content
-
-                return logos_map
-        except Exception as err:
+            payload = await self._request("alllogos", "GET", self._url(API_BRAND_LOGOS_URL))
+        except OsservaprezziError as err:
             _LOGGER.warning("Error fetching brand logos: %s", err)
-            return {}
+            return LogoStore()
+        return LogoStore.from_payload(payload)
 
-    async def get_regions(self) -> List[Dict[str, Any]]:
-        """Fetch list of regions."""
-        url = "https://carburanti.mise.gov.it/ospzApi/registry/region"
+    async def _get_results(self, endpoint: str, url: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         try:
-            async with self.session.get(url, timeout=REQUEST_TIMEOUT) as resp:
-                if resp.status != 200:
-                    return []
-                data = await resp.json()
-                return data.get("results", [])
-        except Exception:
+            data = await self._request(endpoint, "GET", url, params=params)
+        except OsservaprezziError as err:
+            _LOGGER.debug("Richiesta %s fallita: %s", endpoint, err)
             return []
+        return data.get("results", []) if isinstance(data, dict) else []
+
+    async def get_regions(self) -> List[Dict[str, Any]]:
+        """Fetch list of regions."""
+        return await self._get_results("region", self._url(API_REGIONS_URL))
 
     async def get_provinces(self, region_id: int) -> List[Dict[str, Any]]:
         """Fetch list of provinces for a region."""
-        url = "https://carburanti.mise.gov.it/ospzApi/registry/province"
-        params = {"regionId": region_id}
-        try:
-            async with self.session.get(url, params=params, timeout=REQUEST_TIMEOUT) as resp:
-                if resp.status != 200:
-                    return []
-                data = await resp.json()
-                return data.get("results", [])
-        except Exception:
-            return []
+        return await self._get_results("province", self._url(API_PROVINCES_URL), {"regionId": region_id})
 
     async def get_towns(self, province_id: str) -> List[Dict[str, Any]]:
         """Fetch list of towns for a province."""
-        url = "https://carburanti.mise.gov.it/ospzApi/registry/town"
-        params = {"province": province_id}
-        try:
-            async with self.session.get(url, params=params, timeout=REQUEST_TIMEOUT) as resp:
-                if resp.status != 200:
-                    return []
-                data = await resp.json()
-                return data.get("results", [])
-        except Exception:
-            return []
+        return await self._get_results("town", self._url(API_TOWNS_URL), {"province": province_id})
+
+    @staticmethod
+    def _search_results(data: Any) -> List[Dict[str, Any]]:
+        # API usually returns a list of stations directly or wrapped
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            return data.get("results", [])
+        raise OsservaprezziDataError("Unexpected search response format")
 
     async def search_by_area(self, region_id: int, province_id: str, town_id: str) -> List[Dict[str, Any]]:
         """Search stations by geographical area (Regione -> Provincia -> Comune)."""
@@ -133,13 +429,29 @@ class OsservaprezziAPI:
             "town": town_id,
         }
         try:
-            async with self.session.post(API_SEARCH_AREA_URL, json=payload, timeout=REQUEST_TIMEOUT) as resp:
-                resp.raise_for_status()
-                data = await resp.json()
-                # API usually returns a list of stations directly or wrapped
-                if isinstance(data, list):
-                    return data
-                return data.get("results", [])
-        except Exception as err:
+            data = await self._request("search_area", "POST", self._url(API_SEARCH_AREA_URL), json=payload)
+            return self._search_results(data)
+        except OsservaprezziError as err:
             _LOGGER.error("Search failed for area %s-%s-%s: %s", region_id, province_id, town_id, err)
             raise
+
+    async def search_by_zone(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        fuel_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Search stations within `radius_km` of a point (ricerca per zona)."""
+        payload: Dict[str, Any] = {
+            "points": [{"lat": latitude, "lng": longitude}],
+            "radius": radius_km,
+        }
+        if fuel_type:
+            payload["fuelType"] = fuel_type
+        try:
+            data = await self._request("search_zone", "POST", self._url(API_SEARCH_ZONE_URL), json=payload)
+            return self._search_results(data)
+        except OsservaprezziError as err:
+            _LOGGER.debug("Zone search failed around %s,%s (%s km): %s", latitude, longitude, radius_km, err)
+            raise
@@ -0,0 +1,132 @@
+"""Aggiornamento batch degli impianti tramite ricerca per zona.
+
+Gli impianti configurati vengono raggruppati per vicinanza geografica e aggiornati
+con una sola ricerca per zona per gruppo; `servicearea/{id}` viene usato solo per
+gli impianti che la risposta bulk non copre.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+from .api import OsservaprezziAPI, OsservaprezziError
+from .const import BATCH_DETAIL_CONCURRENCY, BATCH_ZONE_RADIUS_KM
+from .helpers import find_coordinates, group_by_proximity
+
+_LOGGER = logging.getLogger(__name__)
+
+# Campi della risposta per zona che aggiornano il payload completo dell'impianto
+ZONE_UPDATED_FIELDS = ("fuels", "insertDate")
+
+
+@dataclass
+class BatchRefreshResult:
+    """Esito di un ciclo di aggiornamento batch."""
+
+    data: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    errors: Dict[int, Exception] = field(default_factory=dict)
+    zone_requests: int = 0
+    detail_requests: int = 0
+
+    @property
+    def total_requests(self) -> int:
+        return self.zone_requests + self.detail_requests
+
+
+def merge_zone_result(base: Optional[Dict[str, Any]], row: Dict[str, Any]) -> Dict[str, Any]:
+    """Applica una riga della ricerca per zona all'ultimo payload completo noto.
+
+    La ricerca per zona non riporta contatti, servizi e orari: vengono mantenuti
+    quelli dell'ultimo `servicearea/{id}`, aggiornando solo prezzi e date.
+    """
+    if not base:
+        return dict(row)
+    merged = dict(base)
+    for key in ZONE_UPDATED_FIELDS:
+        if row.get(key) is not None:
+            merged[key] = row[key]
+    return merged
+
+
+def _row_station_id(row: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int(row.get("id"))
+    except (TypeError, ValueError):
+        return None
+
+
+class BatchRefreshEngine:
+    """Aggiorna un insieme di impianti con il minor numero di richieste possibile."""
+
+    def __init__(
+        self,
+        api: OsservaprezziAPI,
+        radius_km: float = BATCH_ZONE_RADIUS_KM,
+        detail_concurrency: int = BATCH_DETAIL_CONCURRENCY,
+    ) -> None:
+        self.api = api
+        self.radius_km = radius_km
+        self.detail_concurrency = max(1, detail_concurrency)
+        self.last_result: Optional[BatchRefreshResult] = None
+
+    async def async_refresh(
+        self,
+        station_ids: Iterable[int],
+        known: Mapping[int, Dict[str, Any]],
+    ) -> BatchRefreshResult:
+        """Aggiorna `station_ids`; `known` contiene l'ultimo payload completo per impianto."""
+        result = BatchRefreshResult()
+        pending = set(station_ids)
+
+        points = {}
+        for sid in pending:
+            coords = find_coordinates(known.get(sid) or {})
+            if coords:
+                points[sid] = coords
+
+        # Una ricerca per zona costa quanto una servicearea: conviene solo per i gruppi
+        for (lat, lon), members in group_by_proximity(points, self.radius_km):
+            if len(members) < 2:
+                continue
+            result.zone_requests += 1
+            try:
+                rows = await self.api.search_by_zone(lat, lon, self.radius_km)
+            except OsservaprezziError as err:
+                _LOGGER.debug("Ricerca per zona fallita, fallback per %s impianti: %s", len(members), err)
+                continue
+            by_id = {}
+            for row in rows:
+                if isinstance(row, dict):
+                    rid = _row_station_id(row)
+                    if rid is not None:
+                        by_id[rid] = row
+            for sid in members:
+                row = by_id.get(sid)
+                if row is not None:
+                    result.data[sid] = merge_zone_result(known.get(sid), row)
+                    pending.discard(sid)
+
+        if pending:
+            semaphore = asyncio.Semaphore(self.detail_concurrency)
+
+            async def _fetch(sid: int) -> None:
+                async with semaphore:
+                    result.detail_requests += 1
+                    try:
+                        result.data[sid] = await self.api.get_station_details(sid)
+                    except OsservaprezziError as err:
+                        result.errors[sid] = err
+
+            await asyncio.gather(*(_fetch(sid) for sid in sorted(pending)))
+
+        _LOGGER.debug(
+            "Aggiornamento batch: %s impianti, %s ricerche per zona, %s servicearea, %s errori",
+            len(result.data) + len(result.errors),
+            result.zone_requests,
+            result.detail_requests,
+            len(result.errors),
+        )
+        self.last_result = result
+        return result
@@ -1,7 +1,10 @@
 """Sensori binari per i servizi della stazione."""
 from __future__ import annotations
 
+from functools import partial
+
 from homeassistant.components.binary_sensor import (
+    BinarySensorDeviceClass,
     BinarySensorEntity,
     BinarySensorEntityDescription,
 )
@@ -9,45 +12,52 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
-from .const import DATA_COORDINATORS, DOMAIN
+from .const import DOMAIN
+from .coordinator import async_get_registry, entry_stations
+from .entity import EntityReconciler, OpeningHoursEntity, OsservaprezziEntity
+from .helpers import normalize_name
 
 async def async_setup_entry(
     hass: HomeAssistant,
     entry: ConfigEntry,
     async_add_entities: AddEntitiesCallback,
 ) -> None:
-    """Configura i sensori binari da una config entry."""
-    coordinators = hass.data.get(DATA_COORDINATORS, {})
-    
-    # Trova i coordinator associati a questa entry
-    entry_coordinators = [
-        c for k, c in coordinators.items() 
-        if isinstance(k, tuple) and k[0] == entry.entry_id
+    """Configura i sensori binari da una config entry.
+
+    Non legge i dati dei coordinator al momento del setup: ogni impianto ha un
+    riconciliatore che crea i sensori dei servizi quando i dati sono disponibili
+    (subito se già presenti, anche dalla cache) e li allinea agli aggiornamenti
+    successivi, qualunque sia l'ordine di avvio delle piattaforme. Nessun fetch.
+    """
+    registry = async_get_registry(hass)
+    # i coordinator sono acquisiti in __init__.async_setup_entry prima delle piattaforme
+    coordinators = [
+        coordinator
+        for coordinator in (registry.get(station["id"]) for station in entry_stations(entry.data or {}))
+        if coordinator is not None
     ]
 
-    entities = []
-    for coordinator in entry_coordinators:
-        # Recupera dati stazione
-        data = coordinator.data or {}
-        # I servizi potrebbero essere una lista di stringhe o oggetti
-        services = data.get("services") or []
-        
-        # Se servizi è una lista di dict/objects con 'description', adattalo
-        # Assumiamo per ora sia una lista di nomi o oggetti semplici
-        if services:
-             for service in services:
-                 # Gestione fallback se service è dict o str
-                 svc_name = service if isinstance(service, str) else service.get("name") or service.get("description")
-                 if svc_name:
-                     entities.append(StationServiceSensor(coordinator, svc_name, entry.entry_id))
+    # aperto/chiuso dagli orari compilati, anche se i dati arrivano dopo
+    async_add_entities([StationOpenBinarySensor(coordinator, entry.entry_id) for coordinator in coordinators])
+
+    for coordinator in coordinators:
+        entry.async_on_unload(
+            EntityReconciler(
+                hass,
+                coordinator,
+                lambda c: c.snapshot.services.keys(),
+                partial(_create_service_sensor, coordinator, entry.entry_id),
+                async_add_entities,
+            ).async_start()
+        )
 
-    if entities:
-        async_add_entities(entities)
 
+def _create_service_sensor(coordinator, entry_id: str, service_key: str) -> "StationServiceSensor":
+    return StationServiceSensor(coordinator, coordinator.snapshot.services[service_key], entry_id)
 
-class StationServiceSensor(CoordinatorEntity, BinarySensorEntity):
+
+class StationServiceSensor(OsservaprezziEntity, BinarySensorEntity):
     """Sensore binario che indica la presenza di un servizio."""
 
     def __init__(self, coordinator, service_name, entry_id):
@@ -56,19 +66,23 @@ class StationServiceSensor(CoordinatorEntity, BinarySensorEntity):
         self.entry_id = entry_id
         self.station_id = coordinator.station_id
         
-        # Normalizza nome per ID
-        friendly_id = "".join(c if c.isalnum() else "_" for c in service_name.lower())
-        
-        self._unique_id = f"{DOMAIN}_{entry_id}_{self.station_id}_service_{friendly_id}"
+        self.service_key = normalize_name(service_name)
+
+        self._unique_id = f"{DOMAIN}_{entry_id}_{self.station_id}_service_{self.service_key}"
+        self._attr_unique_id = self._unique_id
         self._attr_has_entity_name = True
         self._attr_name = f"Servizio {service_name}"
         self._name = self._attr_name
-        self._attr_is_on = True # Se è nella lista, è attivo
-        
+
     @property
     def name(self):
         return self._attr_name
 
+    @property
+    def is_on(self):
+        # dal set precalcolato nello snapshot
+        return self.service_key in self.coordinator.snapshot.services
+
     @property
     def device_info(self) -> DeviceInfo:
         # Link allo stesso device della stazione
@@ -84,3 +98,46 @@ class StationServiceSensor(CoordinatorEntity, BinarySensorEntity):
             name=dev_name,
             manufacturer="Osservaprezzi / MIMIT",
         )
+
+
+class StationOpenBinarySensor(OpeningHoursEntity, BinarySensorEntity):
+    """Sensore binario acceso quando l'impianto è aperto secondo `orariapertura`."""
+
+    _attr_device_class = BinarySensorDeviceClass.OPENING
+    _attr_icon = "mdi:store-clock-outline"
+    _attr_has_entity_name = True
+    _attr_name = "Aperto"
+
+    def __init__(self, coordinator, entry_id):
+        super().__init__(coordinator)
+        self.entry_id = entry_id
+        self.station_id = coordinator.station_id
+        self._attr_unique_id = f"{DOMAIN}_{entry_id}_{self.station_id}_open"
+
+    @property
+    def is_on(self):
+        is_open, _, _ = self._opening_state()
+        return is_open
+
+    @property
+    def extra_state_attributes(self):
+        _, next_opening, next_closing = self._opening_state()
+        return {
+            "next_opening": next_opening.isoformat() if next_opening else None,
+            "next_closing": next_closing.isoformat() if next_closing else None,
+        }
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        identifier = f"{self.entry_id}_{self.station_id}"
+        data = self.coordinator.data or {}
+        dev_name = data.get("name") or f"Stazione {self.station_id}"
+        brand = data.get("brand")
+        if brand:
+            dev_name = f"{dev_name} - {brand}"
+
+        return DeviceInfo(
+            identifiers={(DOMAIN, identifier)},
+            name=dev_name,
+            manufacturer="Osservaprezzi / MIMIT",
+        )
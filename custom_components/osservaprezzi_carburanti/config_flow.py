@@ -4,6 +4,7 @@ Modulo minimo del Config Flow; fornito come scheletro estendibile.
 """
 from __future__ import annotations
 
+import asyncio
 import logging
 from typing import Any
 
@@ -11,10 +12,21 @@ from homeassistant import config_entries
 from homeassistant.core import HomeAssistant
 import voluptuous as vol
 
-from .const import DOMAIN, API_URL_TEMPLATE, REQUEST_TIMEOUT
+from .const import (
+    CONF_ADAPTIVE,
+    CONF_INCLUDE_RAW,
+    CONF_REFRESH_MODE,
+    CONFIG_FLOW_CONCURRENCY,
+    DEFAULT_ADAPTIVE,
+    DEFAULT_INCLUDE_RAW,
+    DEFAULT_REFRESH_MODE,
+    DOMAIN,
+    REFRESH_MODES,
+)
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
-from .helpers import build_station_preview
-from .api import OsservaprezziAPI
+from .helpers import async_run_bounded, build_station_preview
+from .api import OsservaprezziAPI, OsservaprezziDataError
+from .coordinator import async_get_registry
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -62,6 +74,10 @@ class OsservaPrezziConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         """Initialize the flow."""
         self._search_data = {}
         self._found_stations = []
+        self._stations: list[dict] = []
+        # ID impianto -> payload verificato, in cache solo alla creazione della entry
+        self._payloads: dict[int, dict] = {}
+        self._validate_task: asyncio.Task | None = None
 
     async def async_step_user(self, user_input: dict[str, Any] | None = None):
         """Step iniziale: scelta metodo di configurazione."""
@@ -78,14 +94,12 @@ class OsservaPrezziConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     async def async_step_region(self, user_input: dict[str, Any] | None = None):
         """Scelta della regione."""
-        session = async_get_clientsession(self.hass)
-        api = OsservaprezziAPI(session)
-        
         if user_input is not None:
             self._search_data["region"] = user_input["region"]
             return await self.async_step_province()
 
-        regions = await api.get_regions()
+        # elenchi condivisi tra i flow e persistiti: istantanei dopo il primo uso
+        regions = await async_get_registry(self.hass).areas.async_regions()
         # regions is list of {id, description}
         options = {r["id"]: r.get("description", r.get("name")) for r in regions}
         # Sort by name
@@ -98,15 +112,12 @@ class OsservaPrezziConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     async def async_step_province(self, user_input: dict[str, Any] | None = None):
         """Scelta della provincia."""
-        session = async_get_clientsession(self.hass)
-        api = OsservaprezziAPI(session)
-
         if user_input is not None:
             self._search_data["province"] = user_input["province"]
             return await self.async_step_town()
 
         region_id = self._search_data["region"]
-        provinces = await api.get_provinces(region_id)
+        provinces = await async_get_registry(self.hass).areas.async_provinces(region_id)
         options = {p["id"]: p.get("description", p.get("name")) for p in provinces}
         sorted_options = dict(sorted(options.items(), key=lambda item: item[1]))
 
@@ -117,15 +128,12 @@ class OsservaPrezziConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     async def async_step_town(self, user_input: dict[str, Any] | None = None):
         """Scelta del comune."""
-        session = async_get_clientsession(self.hass)
-        api = OsservaprezziAPI(session)
-
         if user_input is not None:
             self._search_data["town"] = user_input["town"]
             return await self.async_step_select_station()
 
         province_id = self._search_data["province"]
-        towns = await api.get_towns(province_id)
+        towns = await async_get_registry(self.hass).areas.async_towns(province_id)
         options = {t["id"]: t.get("description", t.get("name")) for t in towns}
         sorted_options = dict(sorted(options.items(), key=lambda item: item[1]))
 
@@ -169,6 +177,8 @@ class OsservaPrezziConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     self._search_data["town"]
                 )
                 self._found_stations = results
+                # i risultati alimentano anche l'indice per le ricerche per posizione
+                async_get_registry(self.hass).directory.add_rows(results)
             except Exception:
                 errors["base"] = "search_failed"
 
@@ -205,6 +215,9 @@ class OsservaPrezziConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 {
                     vol.Required("stations", default="48524"): str,
                     vol.Optional("scan_interval", default=3600): int,
+                    vol.Optional(CONF_REFRESH_MODE, default=DEFAULT_REFRESH_MODE): vol.In(REFRESH_MODES),
+                    vol.Optional(CONF_ADAPTIVE, default=DEFAULT_ADAPTIVE): bool,
+                    vol.Optional(CONF_INCLUDE_RAW, default=DEFAULT_INCLUDE_RAW): bool,
                     vol.Optional("title", default="Stazioni Osservaprezzi"): str,
                 }
             )
@@ -219,65 +232,119 @@ class OsservaPrezziConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         stations = _parse_stations_field(stations_raw)
         if not stations:
             errors["stations"] = "invalid_stations"
-
-        if not errors:
-            session = async_get_clientsession(self.hass)
-            invalid_ids: list[int] = []
-            valid_stations: list[dict] = []
-            preview_lines: list[str] = []
-
-            for st in stations:
-                sid = st.get("id")
-                url = API_URL_TEMPLATE.format(id=sid)
-                try:
-                    async with session.get(url, timeout=REQUEST_TIMEOUT) as resp:
-                        if resp.status != 200:
-                            invalid_ids.append(sid)
-                            continue
-                        payload = await resp.json()
-                        if not isinstance(payload, dict) or ("id" not in payload and "Id" not in payload):
-                            invalid_ids.append(sid)
-                            continue
-
-                        preview_line, station_entry = build_station_preview(payload, sid, st.get("name"))
-                        preview_lines.append(preview_line)
-                        valid_stations.append(station_entry)
-                except Exception:
-                    invalid_ids.append(sid)
-
-            if invalid_ids:
-                invalid_list = ", ".join(str(i) for i in invalid_ids)
-                self._valid_stations = valid_stations
-                self._invalid_ids = invalid_ids
-                self._pending_scan_interval = int(user_input.get("scan_interval") or 3600)
-                self._pending_title = user_input.get("title") or "Stazioni Osservaprezzi"
-                self._preview_text = "\n".join(preview_lines)
-
-                data_schema = vol.Schema({vol.Required("proceed", default=True): bool})
-                return self.async_show_form(
-                    step_id="confirm",
-                    data_schema=data_schema,
-                    description_placeholders={
-                        "invalid_ids": invalid_list,
-                        "valid_count": str(len(self._valid_stations)),
-                        "preview": self._preview_text,
-                    },
-                )
         if errors:
             return self.async_show_form(step_id="manual", data_schema=None, errors=errors)
 
+        self._stations = stations
+        self._pending_scan_interval = int(user_input.get("scan_interval") or 3600)
+        self._pending_refresh_mode = user_input.get(CONF_REFRESH_MODE) or DEFAULT_REFRESH_MODE
+        self._pending_adaptive = bool(user_input.get(CONF_ADAPTIVE, DEFAULT_ADAPTIVE))
+        self._pending_include_raw = bool(user_input.get(CONF_INCLUDE_RAW, DEFAULT_INCLUDE_RAW))
+        self._pending_title = user_input.get("title") or "Stazioni Osservaprezzi"
+        return await self.async_step_validate()
+
+    async def _async_validate_stations(self) -> None:
+        """Verifica gli impianti in parallelo (al massimo `CONFIG_FLOW_CONCURRENCY` richieste).
+
+        Usa l'API condivisa del registry (retry, circuit breaker, validatori). I payload
+        validi restano nel flow e vanno nella cache solo alla creazione della entry.
+        """
+        registry = async_get_registry(self.hass)
+
+        async def _fetch(station: dict) -> dict:
+            payload = await registry.api.get_station_details(station["id"])
+            if "id" not in payload and "Id" not in payload:
+                raise OsservaprezziDataError(f"Unexpected data format for station {station['id']}")
+            return payload
+
+        results = await async_run_bounded(self._stations, _fetch, CONFIG_FLOW_CONCURRENCY)
+
+        self._payloads = {}
+        invalid_ids: list[int] = []
+        valid_stations: list[dict] = []
+        preview_lines: list[str] = []
+        for st, payload in zip(self._stations, results):
+            sid = st.get("id")
+            if isinstance(payload, BaseException):
+                _LOGGER.debug("Impianto %s non valido: %s", sid, payload)
+                invalid_ids.append(sid)
+                continue
+            self._payloads[sid] = payload
+            preview_line, station_entry = build_station_preview(payload, sid, st.get("name"))
+            preview_lines.append(preview_line)
+            valid_stations.append(station_entry)
+
+        self._valid_stations = valid_stations
+        self._invalid_ids = invalid_ids
+        self._preview_text = "\n".join(preview_lines)
+
+    async def _async_seed_payload_cache(self, stations: list[dict]) -> None:
+        """Mette in cache i payload verificati degli impianti della entry.
+
+        Il coordinator creato con la entry parte da quelli e il primo refresh è una
+        richiesta condizionale; un flow annullato non lascia nulla in cache.
+        """
+        payload_cache = async_get_registry(self.hass).payload_cache
+        await payload_cache.async_load()
+        for station in stations:
+            payload = self._payloads.get(station["id"])
+            if payload is not None:
+                payload_cache.async_put(station["id"], payload)
+
+    async def async_step_validate(self, user_input: dict[str, Any] | None = None):
+        """Verifica degli impianti inseriti, con avanzamento invece di un form bloccato."""
+        if self._validate_task is None:
+            self._validate_task = self.hass.async_create_task(self._async_validate_stations())
+        if not self._validate_task.done():
+            return self.async_show_progress(
+                step_id="validate",
+                progress_action="validate_stations",
+                progress_task=self._validate_task,
+                description_placeholders={"count": str(len(self._stations))},
+            )
+        task, self._validate_task = self._validate_task, None
+        try:
+            task.result()
+        except Exception:
+            _LOGGER.exception("Verifica degli impianti non riuscita")
+            return self.async_show_progress_done(next_step_id="validation_failed")
+        return self.async_show_progress_done(next_step_id="validated")
+
+    async def async_step_validation_failed(self, user_input: dict[str, Any] | None = None):
+        return self.async_abort(reason="validation_failed")
+
+    async def async_step_validated(self, user_input: dict[str, Any] | None = None):
+        """Crea la entry o, se alcuni ID non sono validi, chiede conferma."""
+        valid_stations = self._valid_stations
+        if self._invalid_ids:
+            invalid_list = ", ".join(str(i) for i in self._invalid_ids)
+            data_schema = vol.Schema({vol.Required("proceed", default=True): bool})
+            return self.async_show_form(
+                step_id="confirm",
+                data_schema=data_schema,
+                description_placeholders={
+                    "invalid_ids": invalid_list,
+                    "valid_count": str(len(valid_stations)),
+                    "preview": self._preview_text,
+                },
+            )
+
         data = {
-            "stations": stations,
-            "scan_interval": int(user_input.get("scan_interval") or 3600),
-            "title": user_input.get("title") or "Osservaprezzi stations",
+            "stations": self._stations,
+            "scan_interval": self._pending_scan_interval,
+            CONF_REFRESH_MODE: self._pending_refresh_mode,
+            CONF_ADAPTIVE: self._pending_adaptive,
+            CONF_INCLUDE_RAW: self._pending_include_raw,
+            "title": self._pending_title,
         }
-        
+
         if len(valid_stations) == 1:
             company = valid_stations[0].get("company")
             name = valid_stations[0].get("name")
             title = company or name or data["title"]
         else:
             title = data["title"]
+        await self._async_seed_payload_cache(self._stations)
         return self.async_create_entry(title=title, data=data)
 
     async def async_step_confirm(self, user_input: dict[str, Any] | None = None):
@@ -308,7 +375,10 @@ class OsservaPrezziConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         data = {
             "stations": stations,
             "scan_interval": getattr(self, "_pending_scan_interval", 3600),
-            "title": getattr(self, "_pending_title", "Osservaprezzi stations"),
+            CONF_REFRESH_MODE: getattr(self, "_pending_refresh_mode", DEFAULT_REFRESH_MODE),
+            CONF_ADAPTIVE: getattr(self, "_pending_adaptive", DEFAULT_ADAPTIVE),
+            CONF_INCLUDE_RAW: getattr(self, "_pending_include_raw", DEFAULT_INCLUDE_RAW),
+            "title": getattr(self, "_pending_title", "Stazioni Osservaprezzi"),
         }
         # Se viene creata una sola stazione valida, prediligi il company come titolo
         if len(stations) == 1:
@@ -317,6 +387,7 @@ class OsservaPrezziConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             title = company or name or data["title"]
         else:
             title = data["title"]
+        await self._async_seed_payload_cache(stations)
         return self.async_create_entry(title=title, data=data)
 
 
@@ -5,9 +5,14 @@ from datetime import timedelta
 
 DOMAIN = "osservaprezzi_carburanti"
 DEFAULT_SCAN_INTERVAL = 3600  # seconds
-API_URL_TEMPLATE = "https://carburanti.mise.gov.it/ospzApi/registry/servicearea/{id}"
-API_BRAND_LOGOS_URL = "https://carburanti.mise.gov.it/ospzApi/registry/alllogos"
-API_SEARCH_AREA_URL = "https://carburanti.mise.gov.it/ospzApi/search/area"
+API_BASE_URL = "https://carburanti.mise.gov.it/ospzApi"
+API_URL_TEMPLATE = f"{API_BASE_URL}/registry/servicearea/{{id}}"
+API_BRAND_LOGOS_URL = f"{API_BASE_URL}/registry/alllogos"
+API_REGIONS_URL = f"{API_BASE_URL}/registry/region"
+API_PROVINCES_URL = f"{API_BASE_URL}/registry/province"
+API_TOWNS_URL = f"{API_BASE_URL}/registry/town"
+API_SEARCH_AREA_URL = f"{API_BASE_URL}/search/area"
+API_SEARCH_ZONE_URL = f"{API_BASE_URL}/search/zone"
 
 # Map brand names (as they may appear in API) to asset filenames in assets/brands/
 BRAND_LOGOS = {
@@ -27,8 +32,109 @@ BRAND_LOGOS = {
 # Default request timeout
 REQUEST_TIMEOUT = 10
 
+# Trasporto HTTP verso MIMIT: richieste contemporanee, retry con backoff e circuit breaker
+API_CONNECTION_LIMIT = 8
+API_MAX_RETRIES = 3
+API_BACKOFF_BASE = 1.0
+API_BACKOFF_MAX = 30.0
+API_CIRCUIT_THRESHOLD = 5
+API_CIRCUIT_RESET = 300
+
+# Modalità di aggiornamento: una chiamata per impianto oppure ricerche per zona raggruppate
+CONF_REFRESH_MODE = "refresh_mode"
+REFRESH_MODE_STATION = "station"
+REFRESH_MODE_BATCH = "batch"
+REFRESH_MODE_OPENDATA = "opendata"
+REFRESH_MODES = [REFRESH_MODE_STATION, REFRESH_MODE_BATCH, REFRESH_MODE_OPENDATA]
+DEFAULT_REFRESH_MODE = REFRESH_MODE_STATION
+
+# Raggio (km) di ogni ricerca per zona e parallelismo del fallback su servicearea/{id}
+BATCH_ZONE_RADIUS_KM = 5.0
+BATCH_DETAIL_CONCURRENCY = 4
+
+# File open data giornalieri MIMIT (modalità "opendata"); `opendata_path` per leggerli da disco
+OPENDATA_REGISTRY_FILE = "anagrafica_impianti_attivi.csv"
+OPENDATA_PRICES_FILE = "prezzo_alle_8.csv"
+OPENDATA_REGISTRY_URL = f"https://www.mimit.gov.it/images/exportCSV/{OPENDATA_REGISTRY_FILE}"
+OPENDATA_PRICES_URL = f"https://www.mimit.gov.it/images/exportCSV/{OPENDATA_PRICES_FILE}"
+OPENDATA_MAX_AGE = timedelta(hours=6)
+OPENDATA_RETRY_INTERVAL = 1800
+CONF_OPENDATA_PATH = "opendata_path"
+
+# Scheduler centrale: slot giornaliero, finestra di distribuzione (s) e richieste parallele
+DAILY_REFRESH_TIME = (8, 30)
+CONF_REFRESH_WINDOW = "refresh_window"
+CONF_REFRESH_CONCURRENCY = "refresh_concurrency"
+DEFAULT_REFRESH_WINDOW = 600
+DEFAULT_REFRESH_CONCURRENCY = 4
+
+# Polling adattivo: intervallo stimato dallo storico di validityDate/insertDate
+CONF_ADAPTIVE = "adaptive_polling"
+DEFAULT_ADAPTIVE = False
+ADAPTIVE_HISTORY = 14
+ADAPTIVE_MIN_INTERVAL = 900
+ADAPTIVE_MAX_INTERVAL = 24 * 3600
+
+# Refresh iniziali eseguiti in parallelo durante il setup
+CONF_SETUP_CONCURRENCY = "setup_concurrency"
+DEFAULT_SETUP_CONCURRENCY = 8
+
+# Verifiche parallele degli ID inseriti nel config flow manuale
+CONFIG_FLOW_CONCURRENCY = 8
+
+# Entità di un carburante/servizio assente dai dati: non disponibile, tolta da HA dopo
+# questo numero di aggiornamenti consecutivi (la voce del registro resta)
+ENTITY_REMOVE_AFTER_UPDATES = 3
+
+# Attributi `raw`/`raw_fuel` con il payload completo (mai registrati nel recorder)
+CONF_INCLUDE_RAW = "include_raw"
+DEFAULT_INCLUDE_RAW = True
+
+# Loghi brand serviti localmente invece che come data URI base64 negli attributi
+LOGO_URL_TEMPLATE = f"/api/{DOMAIN}/logo/{{key}}"
+
+# Cache su disco (helpers.storage.Store)
+STORAGE_VERSION = 1
+LOGO_STORAGE_KEY = f"{DOMAIN}.logos"
+LOGO_CACHE_TTL = timedelta(days=7)
+
+# Ultimo payload valido di ogni impianto, usato all'avvio prima del refresh live
+PAYLOAD_STORAGE_KEY = f"{DOMAIN}.payloads"
+PAYLOAD_SAVE_DELAY = 60
+PAYLOAD_CACHE_MAX_AGE = timedelta(days=30)
+# Gli impianti avviati dalla cache vengono riaggiornati entro questa finestra (secondi)
+STARTUP_REVALIDATE_WINDOW = 60
+
+# Regioni/province/comuni per la ricerca del config flow: cambiano di rado
+AREA_STORAGE_KEY = f"{DOMAIN}.areas"
+AREA_CACHE_TTL = timedelta(days=30)
+AREA_SAVE_DELAY = 10
+
+# Storico compatto dei prezzi (un cambio per riga) per la card di confronto
+HISTORY_STORAGE_KEY = f"{DOMAIN}.history"
+HISTORY_SAVE_DELAY = 300
+HISTORY_MAX_AGE = timedelta(days=400)
+
+# Prezzi come statistiche esterne orarie del recorder (YAML)
+CONF_LONG_TERM_STATISTICS = "long_term_statistics"
+STATISTICS_STORAGE_KEY = f"{DOMAIN}.statistics"
+STATISTICS_FLUSH_DELAY = 120
+
+# Sensori "più economico nelle vicinanze" (YAML): segue una zona/device_tracker
+CONF_CHEAPEST_NEARBY = "cheapest_nearby"
+DEFAULT_NEARBY_RADIUS_KM = 5.0
+
+# Sensori classifica per carburante/modalità (YAML): primi k impianti e statistiche
+CONF_FUEL_RANKINGS = "fuel_rankings"
+DEFAULT_RANKING_SIZE = 5
+
+# Servizi
+SERVICE_FIND_STATIONS = "find_stations"
+SERVICE_FIND_ALONG_ROUTE = "find_along_route"
+
 # Data keys stored in hass.data
 DATA_COORDINATORS = f"{DOMAIN}_coordinators"
+DATA_LOGOS = f"{DOMAIN}_logos"
 
 # Default device class/icon (icona carburante)
 DEFAULT_ICON = "mdi:fuel"
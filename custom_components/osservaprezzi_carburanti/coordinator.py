@@ -0,0 +1,406 @@
+"""Coordinator e registro condiviso per l'integrazione Osservaprezzi Carburanti.
+
+Ogni impianto ha un solo `StationDataUpdateCoordinator` per processo, anche se
+compare in più config entry o nella configurazione YAML: il registro salvato in
+`hass.data[DATA_COORDINATORS]` conta i sottoscrittori e rilascia il coordinator
+quando l'ultimo viene scaricato.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
+from homeassistant.helpers.update_coordinator import (
+    DataUpdateCoordinator,
+    UpdateFailed,
+)
+
+from .adaptive import UpdatePattern
+from .api import SESSION_HEADERS, OsservaprezziAPI, OsservaprezziError
+from .const import (
+    DATA_COORDINATORS,
+    DATA_LOGOS,
+    DEFAULT_SCAN_INTERVAL,
+    REFRESH_MODE_BATCH,
+    REFRESH_MODE_OPENDATA,
+    REFRESH_MODE_STATION,
+    STARTUP_REVALIDATE_WINDOW,
+)
+from .directory import StationDirectory
+from .longterm import LongTermStatistics
+from .opendata import OpenDataError, OpenDataLoader, merge_opendata
+from .scheduler import RefreshScheduler
+from .snapshot import StationSnapshot, build_snapshot
+from .storage import AreaCache, LogoLoader, PayloadCache, PriceHistoryStore
+
+_LOGGER = logging.getLogger(__name__)
+
+# Sottoscrittore usato per gli impianti configurati via YAML
+YAML_OWNER = "yaml"
+
+
+def entry_stations(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Ritorna gli impianti di una config entry come lista di {"id": int, "name": str}."""
+    stations = data.get("stations")
+    if not stations:
+        station_id = data.get("station_id") or data.get("id")
+        if station_id is None:
+            return []
+        stations = [{"id": station_id, "name": data.get("name") or ""}]
+
+    result: List[Dict[str, Any]] = []
+    for st in stations:
+        try:
+            result.append({"id": int(st.get("id")), "name": st.get("name")})
+        except (TypeError, ValueError):
+            continue
+    return result
+
+
+class StationDataUpdateCoordinator(DataUpdateCoordinator):
+    """Coordinator per ottenere i dati dell'impianto dall'API Osservaprezzi.
+
+    Non ha un proprio `update_interval`: gli aggiornamenti sono pilotati da `RefreshScheduler`.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        api: OsservaprezziAPI,
+        station_id: int,
+        logo_loader: Optional[LogoLoader] = None,
+        payload_cache: Optional[PayloadCache] = None,
+    ):
+        self.api = api
+        self.station_id = station_id
+        self.logo_loader = logo_loader
+        self.payload_cache = payload_cache
+        # impostato dal registro quando tutti i sottoscrittori usano la modalità "opendata"
+        self.opendata: Optional[OpenDataLoader] = None
+        # istante del payload letto dalla cache su disco; None dopo il primo refresh live
+        self.cached_at: Optional[datetime] = None
+        # storico dei cambi MIMIT per il polling adattivo
+        self.pattern = UpdatePattern(payload_cache.changes(station_id) if payload_cache else None)
+        # scritture di stato evitate dalle entità perché nulla era cambiato
+        self.suppressed_writes = 0
+        # fetch eseguiti e quanti hanno trovato il payload invariato (304 o stesso hash)
+        self.fetches = 0
+        self.unchanged_fetches = 0
+        self._snapshot: Optional[StationSnapshot] = None
+        self._snapshot_source: Tuple[Any, Any] = (None, None)
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=f"osservaprezzi_{station_id}",
+            update_interval=None,
+            # payload invariato: nessuna notifica ai listener
+            always_update=False,
+        )
+
+    @property
+    def snapshot(self) -> StationSnapshot:
+        """Snapshot dei dati correnti, ricostruito una sola volta per aggiornamento."""
+        logos = self.hass.data.get(DATA_LOGOS)
+        source_data, source_logos = self._snapshot_source
+        if self._snapshot is None or source_data is not self.data or source_logos is not logos:
+            self._snapshot = build_snapshot(self.data, logos)
+            self._snapshot_source = (self.data, logos)
+        return self._snapshot
+
+    @property
+    def hit_ratio(self) -> Optional[float]:
+        """Quota dei fetch che hanno trovato il payload invariato."""
+        if not self.fetches:
+            return None
+        return round(self.unchanged_fetches / self.fetches, 3)
+
+    @property
+    def is_cached(self) -> bool:
+        """I dati correnti vengono dalla cache su disco e non sono ancora stati riconfermati."""
+        return self.cached_at is not None and self.data is not None
+
+    @callback
+    def async_seed(self, data: Dict[str, Any], fetched_at: datetime) -> None:
+        """Popola il coordinator con un payload in cache, prima che esistano entità."""
+        self.data = data
+        self.cached_at = fetched_at
+        self.pattern.observe(data)
+
+    @callback
+    def _async_store(self, data: Dict[str, Any]) -> None:
+        if self.cached_at is not None:
+            self.cached_at = None
+            # fine della cache: le entità tolgono `cached` anche se il payload è invariato
+            self.hass.loop.call_soon(self.async_update_listeners)
+        self.pattern.observe(data)
+        if self.payload_cache is not None:
+            self.payload_cache.async_put(self.station_id, data, self.pattern.changes)
+
+    @callback
+    def async_set_updated_data(self, data: Dict[str, Any]) -> None:
+        # percorso batch: i dati arrivano dal motore e non da _async_update_data, e
+        # `async_set_updated_data` notifica sempre: il payload invariato va riconosciuto qui
+        self.fetches += 1
+        if self.data is not None and data == self.data:
+            self.unchanged_fetches += 1
+            self._async_store(self.data)
+            if not self.last_update_success:
+                # dopo un errore l'aggiornamento riuscito rende di nuovo disponibili le entità
+                super().async_set_updated_data(self.data)
+            return
+        self._async_store(data)
+        super().async_set_updated_data(data)
+
+    async def _async_update_from_opendata(self) -> Dict[str, Any]:
+        """Dati dalla tabella open data condivisa: nessuna richiesta per impianto."""
+        try:
+            table = await self.opendata.async_get_table()
+        except OpenDataError as err:
+            raise UpdateFailed(str(err)) from err
+        payload = table.payload(self.station_id)
+        if payload is None:
+            raise UpdateFailed(f"Impianto {self.station_id} non presente negli open data MIMIT")
+        data = merge_opendata(self.data, payload)
+        if data == self.data:
+            # stessa estrazione: stesso oggetto, nessuna notifica
+            data = self.data
+        self._async_store(data)
+        return data
+
+    async def _async_update_data(self) -> Dict[str, Any]:
+        """Recupera i dati dall'API e ritorna il JSON."""
+        if self.opendata is not None:
+            return await self._async_update_from_opendata()
+        try:
+            # Fetch station data: con dati già presenti la richiesta è condizionale
+            self.fetches += 1
+            if self.data is None:
+                data = await self.api.get_station_details(self.station_id)
+            else:
+                data = await self.api.get_station_details_if_changed(self.station_id)
+                if data is None:
+                    # stesso oggetto: snapshot riusato e listener non notificati
+                    self.unchanged_fetches += 1
+                    data = self.data
+
+            # Loghi: download in background (al massimo uno in volo), mai bloccante
+            if self.logo_loader is not None:
+                self.logo_loader.async_ensure()
+
+            _LOGGER.debug("Fetched data for %s: %s", self.station_id, data.keys())
+            self._async_store(data)
+            return data
+        except OsservaprezziError as err:
+            # errore atteso (rete, HTTP, circuit breaker): il coordinator lo registra una volta, senza traceback
+            raise UpdateFailed(f"Impianto {self.station_id}: {err}") from err
+
+
+class CoordinatorRegistry:
+    """Registro con conteggio dei riferimenti: un coordinator per ID impianto."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        # sessione dedicata sul connettore di Home Assistant, che la chiude alla chiusura
+        self.session = async_create_clientsession(hass, headers=SESSION_HEADERS)
+        self.api = OsservaprezziAPI(self.session)
+        self.scheduler = RefreshScheduler(hass, self)
+        self.logo_loader = LogoLoader(hass, self.api)
+        self.logo_loader.async_add_listener(self._async_logos_updated)
+        self.payload_cache = PayloadCache(hass)
+        # regioni/province/comuni per la ricerca dei config flow, caricati al primo uso
+        self.areas = AreaCache(hass, self.api)
+        self.history = PriceHistoryStore(hass)
+        # statistiche a lungo termine, se abilitate da YAML
+        self.statistics: Optional[LongTermStatistics] = None
+        self.opendata = OpenDataLoader(self.session, executor=hass.async_add_executor_job)
+        self.directory = StationDirectory()
+        self._coordinators: Dict[int, StationDataUpdateCoordinator] = {}
+        # listener di tutti i coordinator: ricevono l'ID dell'impianto aggiornato o rilasciato
+        self._station_listeners: List[Callable[[int], None]] = []
+        self._unsub_coordinators: Dict[int, Callable[[], None]] = {}
+        # station_id -> {sottoscrittore: (scan_interval, modalità di aggiornamento, polling adattivo)}
+        self._owners: Dict[int, Dict[str, Tuple[int, str, bool]]] = {}
+
+    def __contains__(self, station_id: int) -> bool:
+        return station_id in self._coordinators
+
+    def __len__(self) -> int:
+        return len(self._coordinators)
+
+    def get(self, station_id: int) -> Optional[StationDataUpdateCoordinator]:
+        return self._coordinators.get(station_id)
+
+    def coordinators(self) -> List[StationDataUpdateCoordinator]:
+        return list(self._coordinators.values())
+
+    def for_owner(self, owner: str) -> List[StationDataUpdateCoordinator]:
+        """Coordinator sottoscritti da una config entry (o da YAML)."""
+        return [
+            self._coordinators[sid]
+            for sid, owners in self._owners.items()
+            if owner in owners
+        ]
+
+    def subscribers(self, station_id: int) -> int:
+        return len(self._owners.get(station_id, {}))
+
+    def interval(self, station_id: int) -> int:
+        """Intervallo effettivo: il più breve tra quelli richiesti dai sottoscrittori."""
+        intervals = [i for i, _, _ in self._owners.get(station_id, {}).values() if i]
+        return min(intervals) if intervals else DEFAULT_SCAN_INTERVAL
+
+    def mode(self, station_id: int) -> str:
+        """Modalità di aggiornamento: batch o opendata solo se tutti i sottoscrittori la richiedono."""
+        modes = {mode for _, mode, _ in self._owners.get(station_id, {}).values()}
+        return modes.pop() if len(modes) == 1 else REFRESH_MODE_STATION
+
+    def is_batch(self, station_id: int) -> bool:
+        return self.mode(station_id) == REFRESH_MODE_BATCH
+
+    def is_opendata(self, station_id: int) -> bool:
+        return self.mode(station_id) == REFRESH_MODE_OPENDATA
+
+    def is_adaptive(self, station_id: int) -> bool:
+        """Polling adattivo solo se tutti i sottoscrittori lo richiedono."""
+        owners = self._owners.get(station_id)
+        return bool(owners) and all(adaptive for _, _, adaptive in owners.values())
+
+    def next_interval(self, station_id: int, now: datetime) -> float:
+        """Secondi fino al prossimo aggiornamento: fissi o stimati dallo storico dei cambi."""
+        interval = self.interval(station_id)
+        coordinator = self._coordinators.get(station_id)
+        if coordinator is None or not self.is_adaptive(station_id):
+            return interval
+        return coordinator.pattern.next_interval(now.timestamp(), interval)
+
+    def acquire(
+        self,
+        station_id: int,
+        owner: str,
+        scan_interval: int,
+        mode: str = REFRESH_MODE_STATION,
+        adaptive: bool = False,
+    ) -> StationDataUpdateCoordinator:
+        """Ritorna il coordinator condiviso dell'impianto, creandolo se necessario."""
+        self._owners.setdefault(station_id, {})[owner] = (scan_interval, mode, adaptive)
+
+        coordinator = self._coordinators.get(station_id)
+        if coordinator is None:
+            coordinator = StationDataUpdateCoordinator(
+                self.hass, self.api, station_id, self.logo_loader, self.payload_cache
+            )
+            self._coordinators[station_id] = coordinator
+            self._unsub_coordinators[station_id] = coordinator.async_add_listener(
+                partial(self._async_station_updated, station_id)
+            )
+            cached = self.payload_cache.get(station_id)
+            if cached is not None:
+                # stale-while-revalidate: entità subito con l'ultimo payload, refresh live a breve
+                coordinator.async_seed(cached[1], cached[0])
+                self._update_source(station_id)
+                self.scheduler.async_track(station_id)
+                self.scheduler.async_expedite(station_id, STARTUP_REVALIDATE_WINDOW)
+                return coordinator
+        self._update_source(station_id)
+        self.scheduler.async_track(station_id)
+        return coordinator
+
+    @callback
+    def async_add_station_listener(self, update_callback: Callable[[int], None]) -> Callable[[], None]:
+        """Richiamato con l'ID dell'impianto a ogni aggiornamento di un qualsiasi coordinator.
+
+        Dopo il rilascio di un impianto il callback riceve il suo ID e `get()` ritorna None.
+        """
+        self._station_listeners.append(update_callback)
+
+        @callback
+        def _remove() -> None:
+            if update_callback in self._station_listeners:
+                self._station_listeners.remove(update_callback)
+
+        return _remove
+
+    @callback
+    def _async_station_updated(self, station_id: int) -> None:
+        coordinator = self._coordinators.get(station_id)
+        if coordinator is not None and coordinator.data:
+            # solo i prezzi cambiati aggiungono righe allo storico
+            self.history.async_record(station_id, coordinator.snapshot)
+        for update_callback in list(self._station_listeners):
+            update_callback(station_id)
+
+    async def async_get_directory(self, use_opendata: bool = True, wait: bool = True) -> StationDirectory:
+        """Elenco geografico aggiornato con gli impianti configurati e, se richiesto, con gli open data.
+
+        Con `wait=False` si usa la tabella open data già caricata (se c'è) e l'eventuale
+        caricamento avviene in background: la chiamata non attende il download.
+        """
+        if use_opendata and not wait:
+            if self.opendata.is_stale and not self.opendata.is_loading:
+                self.hass.async_create_task(self._async_load_opendata())
+            if self.opendata.table is not None:
+                self.directory.add_table(self.opendata.table)
+        elif use_opendata:
+            try:
+                self.directory.add_table(await self.opendata.async_get_table())
+            except OpenDataError as err:
+                _LOGGER.debug("Open data non disponibili per la ricerca per posizione: %s", err)
+        for coordinator in self._coordinators.values():
+            if coordinator.data:
+                self.directory.add_payload(coordinator.data)
+        return self.directory
+
+    async def _async_load_opendata(self) -> None:
+        try:
+            self.directory.add_table(await self.opendata.async_get_table())
+        except OpenDataError as err:
+            _LOGGER.debug("Open data non disponibili per la ricerca lungo il percorso: %s", err)
+
+    def _update_source(self, station_id: int) -> None:
+        coordinator = self._coordinators.get(station_id)
+        if coordinator is not None:
+            coordinator.opendata = self.opendata if self.is_opendata(station_id) else None
+
+    @callback
+    def _async_logos_updated(self) -> None:
+        # nuovi loghi: le entità ricalcolano brand_logo senza attendere il prossimo fetch
+        for coordinator in self._coordinators.values():
+            if coordinator.data is not None:
+                coordinator.async_update_listeners()
+
+    async def async_release(self, owner: str) -> List[int]:
+        """Rimuove il sottoscrittore e chiude i coordinator rimasti senza riferimenti."""
+        removed: List[int] = []
+        for station_id in list(self._owners):
+            owners = self._owners[station_id]
+            if owners.pop(owner, None) is None:
+                continue
+            if owners:
+                # la modalità dipende dai sottoscrittori rimasti
+                self._update_source(station_id)
+                continue
+            self._owners.pop(station_id)
+            self.scheduler.async_untrack(station_id)
+            unsub = self._unsub_coordinators.pop(station_id, None)
+            if unsub is not None:
+                unsub()
+            coordinator = self._coordinators.pop(station_id, None)
+            self.api.forget_station(station_id)
+            self.directory.discard(station_id)
+            if coordinator is not None:
+                await coordinator.async_shutdown()
+            self._async_station_updated(station_id)
+            removed.append(station_id)
+        return removed
+
+
+def async_get_registry(hass: HomeAssistant) -> CoordinatorRegistry:
+    """Ritorna il registro dei coordinator, creandolo al primo utilizzo."""
+    registry = hass.data.get(DATA_COORDINATORS)
+    if not isinstance(registry, CoordinatorRegistry):
+        registry = hass.data[DATA_COORDINATORS] = CoordinatorRegistry(hass)
+    return registry
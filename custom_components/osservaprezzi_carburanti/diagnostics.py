@@ -0,0 +1,41 @@
+"""Diagnostica per l'integrazione Osservaprezzi Carburanti."""
+from __future__ import annotations
+
+from typing import Any, Dict
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .coordinator import async_get_registry
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> Dict[str, Any]:
+    """Stato dello scheduler e dei coordinator della config entry."""
+    registry = async_get_registry(hass)
+    return {
+        "scheduler": registry.scheduler.diagnostics(),
+        "api": registry.api.diagnostics(),
+        "opendata": registry.opendata.diagnostics(),
+        "coordinators": len(registry),
+        "cached_payloads": len(registry.payload_cache),
+        "cached_areas": len(registry.areas),
+        "price_history": {"series": len(registry.history.history), "rows": registry.history.history.rows},
+        "long_term_statistics": registry.statistics.diagnostics() if registry.statistics else None,
+        "stations": [
+            {
+                "station_id": coordinator.station_id,
+                "subscribers": registry.subscribers(coordinator.station_id),
+                "mode": registry.mode(coordinator.station_id),
+                "interval": registry.interval(coordinator.station_id),
+                "adaptive": registry.is_adaptive(coordinator.station_id),
+                "update_pattern": coordinator.pattern.as_dict(),
+                "last_update_success": coordinator.last_update_success,
+                "cached_at": coordinator.cached_at.isoformat() if coordinator.is_cached else None,
+                "suppressed_writes": coordinator.suppressed_writes,
+                "fetches": coordinator.fetches,
+                "unchanged_fetches": coordinator.unchanged_fetches,
+                "hit_ratio": coordinator.hit_ratio,
+            }
+            for coordinator in registry.for_owner(entry.entry_id)
+        ],
+    }
@@ -0,0 +1,112 @@
+"""Elenco geografico degli impianti noti, per le ricerche per posizione.
+
+Raccoglie impianti da più fonti — tabella open data, risultati delle ricerche per
+area/zona, payload dei coordinator — in uno `SpatialIndex`. Per gli impianti della
+tabella open data le informazioni descrittive non vengono copiate: sono lette dalla
+tabella al momento della risposta.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .helpers import SpatialIndex, find_coordinates, format_address
+from .opendata import OpenDataTable
+from .route import Point, RouteMatch, stations_along_route
+
+
+def _station_id(payload: Dict[str, Any]) -> Optional[int]:
+    for key in ("id", "idImpianto", "Id"):
+        if payload.get(key) is not None:
+            try:
+                return int(payload[key])
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+class StationDirectory:
+    """Impianti noti con coordinate, interrogabili per raggio o per k più vicini."""
+
+    def __init__(self) -> None:
+        self.index = SpatialIndex()
+        self._info: Dict[int, Dict[str, Any]] = {}
+        self._table: Optional[OpenDataTable] = None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def add_payload(self, payload: Optional[Dict[str, Any]]) -> bool:
+        """Aggiunge un impianto da un payload `servicearea/{id}` o da una riga di ricerca."""
+        if not isinstance(payload, dict):
+            return False
+        station_id = _station_id(payload)
+        coords = find_coordinates(payload)
+        if station_id is None or coords is None:
+            return False
+        self._info[station_id] = {
+            "name": payload.get("name") or payload.get("description"),
+            "brand": payload.get("brand"),
+            "address": format_address(payload),
+        }
+        self.index.add(station_id, *coords)
+        return True
+
+    def add_rows(self, rows: Iterable[Any]) -> int:
+        """Aggiunge i risultati di `search/area` o `search/zone`; ritorna quanti ne sono stati indicizzati."""
+        return sum(1 for row in rows if self.add_payload(row))
+
+    def add_table(self, table: OpenDataTable) -> None:
+        """Indicizza tutti gli impianti della tabella open data (una volta per tabella)."""
+        if table is self._table:
+            return
+        self._table = table
+        for station_id, row in table.stations.items():
+            if row.latitude is not None and row.longitude is not None:
+                self.index.add(station_id, row.latitude, row.longitude)
+
+    def discard(self, station_id: int) -> None:
+        """Dimentica un impianto aggiunto da payload; resta indicizzato se è nella tabella open data."""
+        self._info.pop(station_id, None)
+        row = self._table.stations.get(station_id) if self._table is not None else None
+        if row is not None and row.latitude is not None and row.longitude is not None:
+            self.index.add(station_id, row.latitude, row.longitude)
+        else:
+            self.index.remove(station_id)
+
+    def describe(self, station_id: int) -> Dict[str, Any]:
+        info = self._info.get(station_id)
+        if info is None and self._table is not None:
+            row = self._table.stations.get(station_id)
+            if row is not None:
+                info = {
+                    "name": row.name,
+                    "brand": row.brand,
+                    "address": format_address({"address": row.address, "comune": row.town, "provincia": row.province}),
+                }
+        result: Dict[str, Any] = {"id": station_id}
+        result.update(info or {})
+        point = self.index.get(station_id)
+        if point is not None:
+            result["latitude"], result["longitude"] = point
+        return result
+
+    def _results(self, found: List[Tuple[float, int]]) -> List[Dict[str, Any]]:
+        results = []
+        for distance, station_id in found:
+            item = self.describe(station_id)
+            item["distance_km"] = round(distance, 3)
+            results.append(item)
+        return results
+
+    def within(self, lat: float, lon: float, radius_km: float, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Impianti entro `radius_km`, dal più vicino."""
+        found = self.index.within(lat, lon, radius_km)
+        return self._results(found[:limit] if limit else found)
+
+    def nearest(self, lat: float, lon: float, k: int, max_radius_km: float = 2000.0) -> List[Dict[str, Any]]:
+        """I `k` impianti più vicini."""
+        return self._results(self.index.nearest(lat, lon, k, max_radius_km))
+
+    def along_route(self, points: Sequence[Point], buffer_km: float) -> Dict[int, RouteMatch]:
+        """Impianti entro `buffer_km` dal percorso, con distanza dal percorso e progressiva."""
+        return stations_along_route(self.index, points, buffer_km)
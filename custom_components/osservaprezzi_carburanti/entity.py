@@ -0,0 +1,205 @@
+"""Entità base per l'integrazione Osservaprezzi Carburanti."""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_track_point_in_utc_time
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from homeassistant.util import dt as dt_util
+
+from .const import ENTITY_REMOVE_AFTER_UPDATES
+from .coordinator import StationDataUpdateCoordinator
+from .helpers import KeyPresence
+from .hours import OpeningHours
+
+_LOGGER = logging.getLogger(__name__)
+
+K = TypeVar("K")
+
+
+class OsservaprezziEntity(CoordinatorEntity[StationDataUpdateCoordinator]):
+    """Entità aggiornata dal coordinator che scrive lo stato solo se è cambiato.
+
+    I dati MIMIT cambiano poche volte al giorno: a ogni aggiornamento del coordinator
+    si confrontano disponibilità, stato e attributi con l'ultima scrittura e, se
+    identici, la scrittura viene saltata e conteggiata in `suppressed_writes`.
+    """
+
+    suppressed_writes = 0
+
+    def __init__(self, coordinator: StationDataUpdateCoordinator) -> None:
+        super().__init__(coordinator)
+        self._last_written: Optional[Tuple[Any, ...]] = None
+        # carburante/servizio assente dall'ultimo aggiornamento (vedi `EntityReconciler`)
+        self.missing = False
+
+    @property
+    def available(self) -> bool:
+        if self.missing:
+            return False
+        # con i dati della cache su disco l'entità resta disponibile anche se MIMIT non risponde
+        return super().available or self.coordinator.is_cached
+
+    @callback
+    def async_set_missing(self, missing: bool) -> None:
+        """Segna l'entità come assente dai dati (non disponibile) o di nuovo presente."""
+        if missing == self.missing:
+            return
+        self.missing = missing
+        if self.hass is not None:
+            self._handle_coordinator_update()
+
+    def _cache_attributes(self) -> Dict[str, Any]:
+        """Attributi `cached`/`cached_since` finché i dati vengono dalla cache su disco.
+
+        `cached_since` è fisso (istante del payload in cache): un'età in secondi
+        cambierebbe a ogni aggiornamento e annullerebbe la soppressione delle scritture.
+        """
+        if not self.coordinator.is_cached:
+            return {}
+        return {"cached": True, "cached_since": self.coordinator.cached_at.isoformat()}
+
+    def _state_fingerprint(self) -> Tuple[Any, ...]:
+        return (self.available, self.state, self.extra_state_attributes)
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        # la piattaforma scrive lo stato subito dopo questo metodo
+        self._last_written = self._state_fingerprint()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        fingerprint = self._state_fingerprint()
+        if fingerprint == self._last_written:
+            self.suppressed_writes += 1
+            self.coordinator.suppressed_writes += 1
+            return
+        self._last_written = fingerprint
+        self.async_write_ha_state()
+
+
+class OpeningHoursEntity(OsservaprezziEntity):
+    """Entità che dipende dagli orari di apertura compilati nello snapshot.
+
+    Invece di ricalcolare a intervalli fissi, tiene un solo timer sul prossimo cambio
+    aperto/chiuso, ripianificato quando cambiano gli orari o quando scatta.
+    """
+
+    def __init__(self, coordinator: StationDataUpdateCoordinator) -> None:
+        super().__init__(coordinator)
+        self._unsub_transition: Optional[Callable[[], None]] = None
+        self._scheduled_hours: Optional[OpeningHours] = None
+
+    @property
+    def opening_hours(self) -> Optional[OpeningHours]:
+        return self.coordinator.snapshot.opening_hours
+
+    def _opening_state(self) -> Tuple[Optional[bool], Optional[datetime], Optional[datetime]]:
+        """(aperto, prossima apertura, prossima chiusura); aperto è None senza orari."""
+        hours = self.opening_hours
+        if hours is None:
+            return None, None, None
+        return hours.state_at(dt_util.now())
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.async_on_remove(self._cancel_transition)
+        self._schedule_transition()
+
+    @callback
+    def _cancel_transition(self) -> None:
+        if self._unsub_transition is not None:
+            self._unsub_transition()
+            self._unsub_transition = None
+
+    @callback
+    def _schedule_transition(self) -> None:
+        self._cancel_transition()
+        hours = self._scheduled_hours = self.opening_hours
+        when = hours.next_transition(dt_util.now()) if hours is not None else None
+        if when is not None:
+            self._unsub_transition = async_track_point_in_utc_time(
+                self.hass, self._async_transition, dt_util.as_utc(when)
+            )
+
+    @callback
+    def _async_transition(self, _now: datetime) -> None:
+        self._unsub_transition = None
+        self._last_written = self._state_fingerprint()
+        self.async_write_ha_state()
+        self._schedule_transition()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        if self.opening_hours is not self._scheduled_hours:
+            # nuovo snapshot con orari ricompilati
+            self._schedule_transition()
+        super()._handle_coordinator_update()
+
+
+class EntityReconciler(Generic[K]):
+    """Allinea le entità di un coordinator alle chiavi presenti nei suoi dati.
+
+    Dopo ogni aggiornamento con dati confronta le chiavi (es. carburanti `(nome, self)`
+    o servizi) con quelle già create e aggiunge solo le entità nuove, senza ricaricare
+    la config entry. Una chiave assente rende l'entità non disponibile; solo dopo
+    `ENTITY_REMOVE_AFTER_UPDATES` aggiornamenti consecutivi senza di essa l'entità viene
+    tolta da Home Assistant, lasciando la voce del registro (entity_id, personalizzazioni
+    e storico restano se la chiave ricompare).
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        coordinator: StationDataUpdateCoordinator,
+        keys: Callable[[StationDataUpdateCoordinator], Iterable[K]],
+        factory: Callable[[K], Entity],
+        async_add_entities: Callable[[List[Entity]], None],
+        remove_after: int = ENTITY_REMOVE_AFTER_UPDATES,
+    ) -> None:
+        self.hass = hass
+        self.coordinator = coordinator
+        self._keys = keys
+        self._factory = factory
+        self._async_add_entities = async_add_entities
+        self.entities: Dict[K, Entity] = {}
+        self.presence: KeyPresence[K] = KeyPresence(remove_after)
+
+    @callback
+    def async_start(self) -> Callable[[], None]:
+        """Prima riconciliazione e sottoscrizione al coordinator; ritorna la funzione di rimozione."""
+        self.async_reconcile()
+        return self.coordinator.async_add_listener(self.async_reconcile)
+
+    @callback
+    def async_reconcile(self) -> None:
+        if self.coordinator.data is None:
+            # nessun dato ancora (o refresh iniziale fallito): si attende il prossimo aggiornamento
+            return
+        change = self.presence.update(self._keys(self.coordinator))
+
+        new_entities = []
+        for key in change.added:
+            entity = self.entities[key] = self._factory(key)
+            new_entities.append(entity)
+        if new_entities:
+            self._async_add_entities(new_entities)
+
+        for key, missing in [(key, True) for key in change.missing] + [(key, False) for key in change.returned]:
+            entity = self.entities.get(key)
+            if isinstance(entity, OsservaprezziEntity):
+                entity.async_set_missing(missing)
+
+        for key in change.removed:
+            entity = self.entities.pop(key)
+            if entity.hass is not None:
+                self.hass.async_create_task(entity.async_remove(force_remove=True))
+        if change.added or change.missing or change.removed:
+            _LOGGER.debug(
+                "Impianto %s: %s entità aggiunte, %s assenti, %s rimosse",
+                self.coordinator.station_id, len(change.added), len(change.missing), len(change.removed),
+            )
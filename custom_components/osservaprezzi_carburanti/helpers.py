@@ -5,15 +5,49 @@ Queste funzioni sono scritte in modo puramente Python e sono testabili senza Hom
 """
 from __future__ import annotations
 
-from typing import Any, Dict, Optional, Tuple
+import asyncio
+import base64
+import binascii
+import math
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    FrozenSet,
+    Generic,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+K = TypeVar("K", bound=Hashable)
+
+EARTH_RADIUS_KM = 6371.0088
 
 
 def find_coordinates(payload: Dict[str, Any]) -> Optional[Tuple[float, float]]:
     """Cerca latitudine e longitudine nel payload.
 
-    Supporta nomi di campo comuni usati da API diverse (lat, latitude, lng, longitude, ecc.).
+    Supporta nomi di campo comuni usati da API diverse (lat, latitude, lng, longitude, ecc.),
+    anche annidati in `location` come nelle risposte della ricerca per zona.
     Restituisce una tupla (lat, lon) se trovate, altrimenti None.
     """
+    location = payload.get("location")
+    if isinstance(location, dict):
+        coords = find_coordinates(location)
+        if coords:
+            return coords
+
     lat_keys = ("lat", "latitude", "geoLat", "geolat")
     lon_keys = ("lon", "lng", "longitude", "geoLon", "geolon")
     lat = None
@@ -37,6 +71,47 @@ def find_coordinates(payload: Dict[str, Any]) -> Optional[Tuple[float, float]]:
     return None
 
 
+def normalize_name(text: Optional[str]) -> str:
+    """Normalizza un nome (carburante, servizio) per usarlo in chiavi e unique_id."""
+    if not text:
+        return "unknown"
+    return "".join(c if c.isalnum() else "_" for c in text.lower())
+
+
+def format_address(data: Dict[str, Any]) -> str:
+    """Compone un indirizzo leggibile dal payload dell'impianto."""
+    # Tenta di estrarre un indirizzo leggibile e ben formattato
+    # Es. "Via Roma 10, 20100 Milano (MI)"
+    
+    # 1. Via e Civico
+    street = data.get("indirizzo") or data.get("address") or data.get("street") or ""
+    civic = data.get("civic") or ""
+    
+    address_part = street
+    if civic:
+        address_part = f"{street} {civic}" if street else civic
+
+    # 2. CAP, Comune, Provincia
+    zip_code = data.get("zip") or data.get("cap") or ""
+    town = data.get("city") or data.get("municipality") or data.get("comune") or ""
+    province = data.get("prov") or data.get("province") or data.get("provincia") or ""
+
+    location_part = ""
+    if zip_code:
+        location_part += f"{zip_code} "
+    if town:
+        location_part += town
+    if province:
+        location_part += f" ({province})"
+
+    # Combine
+    parts = [p.strip() for p in (address_part, location_part) if p.strip()]
+    if parts:
+        return ", ".join(parts)
+        
+    return data.get("name") or data.get("description") or ""
+
+
 def build_station_preview(payload: Dict[str, Any], sid: int, provided_name: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
     """Costruisce una riga di anteprima e un dizionario station_entry dal payload API.
 
@@ -73,3 +148,245 @@ def build_station_preview(payload: Dict[str, Any], sid: int, provided_name: Opti
 
     station_entry = {"id": int(sid), "name": provided_name or name, "company": company}
     return preview, station_entry
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distanza in km tra due punti (formula dell'emisenoverso)."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def group_by_proximity(
+    points: Mapping[int, Tuple[float, float]],
+    radius_km: float,
+) -> List[Tuple[Tuple[float, float], List[int]]]:
+    """Raggruppa gli impianti in cerchi di raggio `radius_km`.
+
+    Algoritmo greedy: gli impianti sono ordinati per latitudine, il primo non ancora
+    assegnato diventa il centro di un nuovo gruppo che raccoglie tutti gli impianti
+    entro il raggio. Ritorna una lista di (centro, [id impianti]).
+    """
+    ordered = sorted(points.items(), key=lambda item: item[1][0])
+    lat_span = math.degrees(radius_km / EARTH_RADIUS_KM)
+    assigned: set = set()
+    groups: List[Tuple[Tuple[float, float], List[int]]] = []
+    for i, (sid, (lat, lon)) in enumerate(ordered):
+        if sid in assigned:
+            continue
+        members = [sid]
+        assigned.add(sid)
+        for other_sid, (olat, olon) in ordered[i + 1:]:
+            if olat - lat > lat_span:
+                break
+            if other_sid in assigned:
+                continue
+            if haversine_km(lat, lon, olat, olon) <= radius_km:
+                members.append(other_sid)
+                assigned.add(other_sid)
+        groups.append(((lat, lon), members))
+    return groups
+
+
+class SpatialIndex:
+    """Indice a griglia di punti (impianti) per ricerche per raggio e k più vicini.
+
+    Il piano lat/lon è diviso in celle di circa `cell_km` di lato; una ricerca
+    visita solo le celle che intersecano il cerchio e calcola la distanza esatta
+    (haversine) sui soli candidati. Con ~25k impianti una ricerca di pochi km
+    costa qualche decina di microsecondi.
+    """
+
+    def __init__(self, cell_km: float = 5.0) -> None:
+        self.cell_deg = math.degrees(cell_km / EARTH_RADIUS_KM)
+        self._cells: Dict[Tuple[int, int], List[Tuple[int, float, float]]] = {}
+        self._points: Dict[int, Tuple[float, float]] = {}
+
+    @classmethod
+    def from_points(cls, points: Mapping[int, Tuple[float, float]], cell_km: float = 5.0) -> "SpatialIndex":
+        index = cls(cell_km)
+        for key, (lat, lon) in points.items():
+            index.add(key, lat, lon)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._points
+
+    def get(self, key: int) -> Optional[Tuple[float, float]]:
+        return self._points.get(key)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def add(self, key: int, lat: float, lon: float) -> None:
+        """Inserisce o sposta un punto."""
+        if key in self._points:
+            if self._points[key] == (lat, lon):
+                return
+            self.remove(key)
+        self._points[key] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), []).append((key, lat, lon))
+
+    def remove(self, key: int) -> None:
+        point = self._points.pop(key, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        bucket = [item for item in self._cells.get(cell, []) if item[0] != key]
+        if bucket:
+            self._cells[cell] = bucket
+        else:
+            self._cells.pop(cell, None)
+
+    def in_bbox(
+        self, min_lat: float, min_lon: float, max_lat: float, max_lon: float
+    ) -> Iterator[Tuple[int, float, float]]:
+        """Punti `(key, lat, lon)` nel rettangolo dato (estremi inclusi)."""
+        y0, x0 = self._cell(min_lat, min_lon)
+        y1, x1 = self._cell(max_lat, max_lon)
+        if (y1 - y0 + 1) * (x1 - x0 + 1) > len(self._cells):
+            # rettangolo più grande dell'indice: conviene scorrere le celle occupate
+            cells = (bucket for (y, x), bucket in self._cells.items() if y0 <= y <= y1 and x0 <= x <= x1)
+        else:
+            cells = (
+                self._cells[(y, x)]
+                for y in range(y0, y1 + 1)
+                for x in range(x0, x1 + 1)
+                if (y, x) in self._cells
+            )
+        for bucket in cells:
+            for key, lat, lon in bucket:
+                if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                    yield key, lat, lon
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, int]]:
+        """`(distanza_km, key)` dei punti entro `radius_km`, ordinati per distanza."""
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        coslat = max(math.cos(math.radians(lat)), 1e-6)
+        dlon = min(180.0, dlat / coslat)
+        found = []
+        for key, plat, plon in self.in_bbox(lat - dlat, lon - dlon, lat + dlat, lon + dlon):
+            distance = haversine_km(lat, lon, plat, plon)
+            if distance <= radius_km:
+                found.append((distance, key))
+        found.sort()
+        return found
+
+    def nearest(
+        self, lat: float, lon: float, k: int = 1, max_radius_km: float = 2000.0
+    ) -> List[Tuple[float, int]]:
+        """I `k` punti più vicini, come `(distanza_km, key)`, entro `max_radius_km`."""
+        if k <= 0 or not self._points:
+            return []
+        radius = math.radians(self.cell_deg) * EARTH_RADIUS_KM
+        while True:
+            # raggio esatto: se contiene almeno k punti, i k più vicini sono tra questi
+            found = self.within(lat, lon, min(radius, max_radius_km))
+            if len(found) >= k or radius >= max_radius_km:
+                return found[:k]
+            radius *= 2
+
+
+class PresenceChange(NamedTuple):
+    """Esito di `KeyPresence.update`."""
+
+    added: List[Any]
+    # assenti da questo aggiornamento (ma non ancora da rimuovere)
+    missing: List[Any]
+    # di nuovo presenti dopo una o più assenze
+    returned: List[Any]
+    # assenti per `remove_after` aggiornamenti consecutivi
+    removed: List[Any]
+
+
+class KeyPresence(Generic[K]):
+    """Chiavi presenti negli aggiornamenti successivi, con tolleranza alle assenze temporanee.
+
+    Una chiave che manca da un aggiornamento (es. riga per zona o open data senza un
+    carburante) resta nota e viene data come rimossa solo dopo `remove_after`
+    aggiornamenti consecutivi in cui è assente.
+    """
+
+    def __init__(self, remove_after: int) -> None:
+        self.remove_after = max(1, remove_after)
+        self.known: Dict[K, int] = {}
+
+    def is_missing(self, key: K) -> bool:
+        return self.known.get(key, 0) > 0
+
+    def update(self, keys: Iterable[K]) -> PresenceChange:
+        present: FrozenSet[K] = frozenset(keys)
+        change = PresenceChange([], [], [], [])
+        for key in present:
+            absences = self.known.get(key)
+            if absences is None:
+                change.added.append(key)
+            elif absences:
+                change.returned.append(key)
+            self.known[key] = 0
+        for key, absences in list(self.known.items()):
+            if key in present:
+                continue
+            absences += 1
+            if absences >= self.remove_after:
+                del self.known[key]
+                change.removed.append(key)
+            else:
+                self.known[key] = absences
+                if absences == 1:
+                    change.missing.append(key)
+        return change
+
+
+def decode_data_uri(uri: str) -> Optional[Tuple[str, bytes]]:
+    """Decodifica un data URI base64 in (content_type, bytes); None se non valido."""
+    if not uri or not uri.startswith("data:") or "," not in uri:
+        return None
+    header, _, payload = uri[5:].partition(",")
+    content_type = header.split(";", 1)[0] or "application/octet-stream"
+    if ";base64" not in header:
+        return None
+    try:
+        return content_type, base64.b64decode(payload, validate=False)
+    except (binascii.Error, ValueError):
+        return None
+
+
+async def async_run_bounded(
+    items: Iterable[T],
+    worker: Callable[[T], Awaitable[R]],
+    limit: int,
+) -> List[Union[R, BaseException]]:
+    """Esegue `worker` su tutti gli elementi, al massimo `limit` alla volta.
+
+    I risultati sono nell'ordine degli elementi; le eccezioni vengono ritornate
+    al posto del risultato invece di interrompere gli altri worker.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def _run(item: T) -> R:
+        async with semaphore:
+            return await worker(item)
+
+    return await asyncio.gather(*(_run(item) for item in items), return_exceptions=True)
+
+
+def compact_payload(value: Any) -> Any:
+    """Copia del payload senza valori `None` né liste/dizionari vuoti (per la cache su disco)."""
+    if isinstance(value, dict):
+        compact = {}
+        for key, item in value.items():
+            item = compact_payload(item)
+            if item is None or item == {} or item == []:
+                continue
+            compact[key] = item
+        return compact
+    if isinstance(value, list):
+        return [compact_payload(item) for item in value if item is not None]
+    return value
@@ -0,0 +1,231 @@
+"""Storico compatto dei prezzi, una riga per ogni cambio effettivo.
+
+Ogni serie (impianto, carburante, self) tiene due colonne `array`: istanti in
+secondi e prezzi in millesimi di euro. Un aggiornamento che non cambia il prezzo
+non aggiunge nulla; le interrogazioni per intervallo sono ricampionate lato
+server per giorno o per settimana (min, max, media pesata sul tempo, chiusura).
+"""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_right
+from datetime import datetime, time, timedelta, tzinfo
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .adaptive import mimit_timestamp
+from .helpers import normalize_name
+
+# (ID impianto, carburante normalizzato, self)
+SeriesKey = Tuple[int, str, bool]
+
+PERIOD_RAW = "raw"
+PERIOD_DAY = "day"
+PERIOD_WEEK = "week"
+PERIODS = (PERIOD_RAW, PERIOD_DAY, PERIOD_WEEK)
+STATISTIC_TYPES = ("min", "max", "mean", "close")
+
+
+def series_key(station_id: int, fuel: Optional[str], is_self: bool) -> SeriesKey:
+    return int(station_id), normalize_name(fuel), bool(is_self)
+
+
+def _milli(price: float) -> int:
+    return int(round(price * 1000))
+
+
+class PriceSeries:
+    """Prezzi di un carburante di un impianto: colonne di istanti e millesimi di euro."""
+
+    __slots__ = ("times", "prices")
+
+    def __init__(self, times: Iterable[int] = (), prices: Iterable[int] = ()) -> None:
+        self.times = array("q", times)
+        self.prices = array("l", prices)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def append(self, timestamp: float, price: float) -> bool:
+        """Registra il prezzo in vigore da `timestamp`; False se non è un cambio.
+
+        Un istante precedente all'ultimo cambio (dato arrivato in ritardo) viene
+        inserito al suo posto; uno già presente ne corregge il prezzo. Un cambio
+        successivo che diventa uguale al prezzo inserito viene scartato.
+        """
+        milli = _milli(price)
+        ts = int(timestamp)
+        times, prices = self.times, self.prices
+        index = bisect_right(times, ts)
+        if index and times[index - 1] == ts:
+            # correzione di un cambio già registrato nello stesso istante
+            index -= 1
+            if prices[index] == milli:
+                return False
+            if index and prices[index - 1] == milli:
+                del times[index]
+                del prices[index]
+                index -= 1
+            else:
+                prices[index] = milli
+        elif index and prices[index - 1] == milli:
+            return False
+        else:
+            times.insert(index, ts)
+            prices.insert(index, milli)
+        if index + 1 < len(times) and prices[index + 1] == milli:
+            del times[index + 1]
+            del prices[index + 1]
+        return True
+
+    def prune(self, before: float) -> None:
+        """Scarta i cambi precedenti a `before`, tenendo il prezzo in vigore in quell'istante."""
+        index = bisect_right(self.times, before) - 1
+        if index > 0:
+            del self.times[:index]
+            del self.prices[:index]
+
+    def value_at(self, timestamp: float) -> Optional[int]:
+        index = bisect_right(self.times, timestamp) - 1
+        return self.prices[index] if index >= 0 else None
+
+    def raw(self, start: float, end: float) -> Dict[str, List[Any]]:
+        """Cambi nell'intervallo, preceduti dal prezzo in vigore a `start`."""
+        lo = bisect_right(self.times, start) - 1
+        hi = bisect_right(self.times, end)
+        lo = max(lo, 0)
+        return {
+            "t": [max(t, int(start)) for t in self.times[lo:hi]],
+            "price": [p / 1000 for p in self.prices[lo:hi]],
+        }
+
+    def downsample(self, boundaries: List[float], types: Iterable[str] = STATISTIC_TYPES) -> Dict[str, List[Any]]:
+        """Min, max, media pesata sul tempo e chiusura per ogni intervallo `[b[i], b[i+1])`.
+
+        Ritorna solo le colonne richieste in `types`; gli istanti sono `boundaries[:-1]`.
+        """
+        times, prices = self.times, self.prices
+        columns: Dict[str, List[Any]] = {"min": [], "max": [], "mean": [], "close": []}
+        index = bisect_right(times, boundaries[0]) - 1
+        for start, end in zip(boundaries, boundaries[1:]):
+            while index + 1 < len(times) and times[index + 1] <= start:
+                index += 1
+            current = prices[index] if index >= 0 else None
+            low = high = current
+            weighted = 0.0
+            covered = 0.0
+            cursor = start
+            while index + 1 < len(times) and times[index + 1] < end:
+                index += 1
+                if current is not None:
+                    weighted += current * (times[index] - cursor)
+                    covered += times[index] - cursor
+                cursor = max(times[index], start)
+                current = prices[index]
+                low = current if low is None else min(low, current)
+                high = current if high is None else max(high, current)
+            if current is not None:
+                weighted += current * (end - cursor)
+                covered += end - cursor
+            columns["min"].append(low / 1000 if low is not None else None)
+            columns["max"].append(high / 1000 if high is not None else None)
+            columns["mean"].append(round(weighted / covered / 1000, 4) if covered else None)
+            columns["close"].append(current / 1000 if current is not None else None)
+        return {name: columns[name] for name in types if name in columns}
+
+    def encode(self) -> List[List[int]]:
+        """Colonne per il salvataggio: istanti come differenze dal precedente."""
+        deltas = [t - p for t, p in zip(self.times, [0] + list(self.times[:-1]))]
+        return [deltas, list(self.prices)]
+
+    @classmethod
+    def decode(cls, item: List[List[int]]) -> "PriceSeries":
+        times, total = [], 0
+        for delta in item[0]:
+            total += int(delta)
+            times.append(total)
+        return cls(times, (int(p) for p in item[1]))
+
+
+class PriceHistory:
+    """Tutte le serie di prezzi, alimentate dagli snapshot dei coordinator."""
+
+    def __init__(self) -> None:
+        self.series: Dict[SeriesKey, PriceSeries] = {}
+        # serie -> istante del cambio più vecchio registrato dall'ultimo `take_changes`
+        self.changes: Dict[SeriesKey, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.series)
+
+    @property
+    def rows(self) -> int:
+        return sum(len(series) for series in self.series.values())
+
+    def get(self, station_id: int, fuel: Optional[str], is_self: bool) -> Optional[PriceSeries]:
+        return self.series.get(series_key(station_id, fuel, is_self))
+
+    def record(self, station_id: int, snapshot: Any, now: float) -> int:
+        """Registra i prezzi di uno `StationSnapshot`; ritorna il numero di cambi."""
+        changes = 0
+        for (fuel, is_self), item in snapshot.fuels.items():
+            if item.price is None:
+                continue
+            key = (int(station_id), fuel, is_self)
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = PriceSeries()
+            changed_at = mimit_timestamp(item.validity_date)
+            if changed_at is None or changed_at > now:
+                changed_at = now
+            if series.append(changed_at, item.price):
+                changes += 1
+                self.changes[key] = min(int(changed_at), self.changes.get(key, int(changed_at)))
+        return changes
+
+    def take_changes(self, station_id: int) -> Dict[SeriesKey, int]:
+        """Cambi registrati per l'impianto dall'ultima chiamata (serie -> istante più vecchio)."""
+        taken = {key: ts for key, ts in self.changes.items() if key[0] == station_id}
+        for key in taken:
+            del self.changes[key]
+        return taken
+
+    def prune(self, before: float) -> None:
+        for series in self.series.values():
+            series.prune(before)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            f"{sid}|{fuel}|{int(is_self)}": series.encode()
+            for (sid, fuel, is_self), series in self.series.items()
+            if len(series)
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PriceHistory":
+        history = cls()
+        for key, item in (data or {}).items():
+            try:
+                sid, rest = key.split("|", 1)
+                fuel, is_self = rest.rsplit("|", 1)
+                history.series[(int(sid), fuel, is_self == "1")] = PriceSeries.decode(item)
+            except (AttributeError, TypeError, ValueError, IndexError):
+                continue
+        return history
+
+
+def bucket_boundaries(start: datetime, end: datetime, period: str, tz: tzinfo) -> List[float]:
+    """Inizi dei giorni (o delle settimane, dal lunedì) locali tra `start` ed `end`, più `end`."""
+    day = start.astimezone(tz).date()
+    if period == PERIOD_WEEK:
+        day -= timedelta(days=day.weekday())
+    step = timedelta(days=7 if period == PERIOD_WEEK else 1)
+    boundaries: List[float] = []
+    end_ts = end.timestamp()
+    while True:
+        ts = datetime.combine(day, time(), tzinfo=tz).timestamp()
+        if ts >= end_ts:
+            break
+        boundaries.append(ts)
+        day += step
+    boundaries.append(end_ts)
+    return boundaries
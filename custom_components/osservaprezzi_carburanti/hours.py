@@ -0,0 +1,196 @@
+"""Orari di apertura degli impianti (`orariapertura`) compilati in intervalli settimanali.
+
+Ogni riga MIMIT descrive un giorno (`giornoSettimanaId`, 1 = lunedì) con orario
+mattina/pomeriggio, orario continuato, H24 o chiusura; le righe per self e servito
+si sommano. `compile_hours` le trasforma una volta per aggiornamento in intervalli
+ordinati in minuti dall'inizio della settimana: "aperto adesso" e la prossima
+apertura/chiusura sono ricerche binarie. Gli orari sono in ora italiana e vanno
+valutati lì, qualunque sia il fuso dell'istante richiesto.
+"""
+from __future__ import annotations
+
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from .adaptive import MIMIT_TZ
+
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+DAY_NAMES = ("lun", "mar", "mer", "gio", "ven", "sab", "dom")
+
+Interval = Tuple[int, int]
+
+
+def _minutes(value: Any) -> Optional[int]:
+    """"HH:MM" (o "HH:MM:SS") in minuti dalla mezzanotte."""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        parts = value.strip().split(":")
+        hours, minutes = int(parts[0]), int(parts[1]) if len(parts) > 1 else 0
+    except (ValueError, IndexError):
+        return None
+    if not (0 <= hours <= 24 and 0 <= minutes < 60):
+        return None
+    return min(hours * 60 + minutes, DAY_MINUTES)
+
+
+def _day_intervals(row: Dict[str, Any]) -> List[Interval]:
+    """Intervalli del giorno (minuti dalla mezzanotte, fine anche oltre la mezzanotte)."""
+    if row.get("flagChiusura"):
+        return []
+    if row.get("flagH24"):
+        return [(0, DAY_MINUTES)]
+    if row.get("flagOrarioContinuato"):
+        pairs = [("oraAperturaOrarioContinuato", "oraChiusuraOrarioContinuato")]
+    else:
+        pairs = [
+            ("oraAperturaMattina", "oraChiusuraMattina"),
+            ("oraAperturaPomeriggio", "oraChiusuraPomeriggio"),
+        ]
+    intervals = []
+    for open_key, close_key in pairs:
+        start, end = _minutes(row.get(open_key)), _minutes(row.get(close_key))
+        if start is None or end is None or start == end:
+            continue
+        if end < start:
+            # chiusura dopo la mezzanotte
+            end += DAY_MINUTES
+        intervals.append((start, end))
+    return intervals
+
+
+def _merge(intervals: List[Interval]) -> List[Interval]:
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class OpeningHours:
+    """Intervalli di apertura settimanali ordinati e disgiunti, in minuti da lunedì 00:00."""
+
+    __slots__ = ("intervals", "_starts", "days")
+
+    def __init__(self, intervals: List[Interval], days: Optional[Dict[int, List[Interval]]] = None) -> None:
+        self.intervals = intervals
+        self._starts = [start for start, _ in intervals]
+        # giorno (0 = lunedì) -> intervalli come comunicati, per gli attributi
+        self.days = days or {}
+
+    @property
+    def always_open(self) -> bool:
+        return self.intervals == [(0, WEEK_MINUTES)]
+
+    @property
+    def never_open(self) -> bool:
+        return not self.intervals
+
+    def _locate(self, minute: int) -> Tuple[bool, int]:
+        """(aperto, indice dell'intervallo corrente o del precedente)."""
+        index = bisect_right(self._starts, minute) - 1
+        return index >= 0 and minute < self.intervals[index][1], index
+
+    def _span_end(self, index: int) -> int:
+        """Fine dell'apertura che contiene l'intervallo `index`, seguendo il passaggio di settimana."""
+        end = self.intervals[index][1]
+        if end == WEEK_MINUTES and self.intervals[0][0] == 0 and index != 0:
+            end += self.intervals[0][1]
+        return end
+
+    def state_at(self, moment: datetime) -> Tuple[bool, Optional[datetime], Optional[datetime]]:
+        """(aperto, prossima apertura, prossima chiusura) all'istante `moment`.
+
+        `moment` è convertito in ora italiana (se naive si assume già italiano);
+        aperture e chiusure sono datetime aware in `MIMIT_TZ`, corretti anche nelle
+        settimane con il cambio dell'ora.
+        """
+        if not self.intervals:
+            return False, None, None
+        if self.always_open:
+            return True, None, None
+        moment = moment.replace(tzinfo=MIMIT_TZ) if moment.tzinfo is None else moment.astimezone(MIMIT_TZ)
+        week_start = moment.date() - timedelta(days=moment.weekday())
+        minute = moment.weekday() * DAY_MINUTES + moment.hour * 60 + moment.minute
+        is_open, index = self._locate(minute)
+
+        def _at(offset: int) -> datetime:
+            day, rest = divmod(offset, DAY_MINUTES)
+            return datetime.combine(week_start + timedelta(days=day), time(rest // 60, rest % 60), MIMIT_TZ)
+
+        if is_open:
+            closing = self._span_end(index)
+            if closing > WEEK_MINUTES:
+                # apertura a cavallo della settimana: si riapre col secondo intervallo
+                opening = self.intervals[1][0] + WEEK_MINUTES
+            elif index + 1 < len(self.intervals):
+                opening = self.intervals[index + 1][0]
+            else:
+                opening = self.intervals[0][0] + WEEK_MINUTES
+            return True, _at(opening), _at(closing)
+
+        following = index + 1
+        if following < len(self.intervals):
+            opening = self.intervals[following][0]
+            closing = self._span_end(following)
+        else:
+            opening = self.intervals[0][0] + WEEK_MINUTES
+            closing = self.intervals[0][1] + WEEK_MINUTES
+        return False, _at(opening), _at(closing)
+
+    def next_transition(self, moment: datetime) -> Optional[datetime]:
+        """Prossimo cambio di stato (apertura o chiusura) dopo `moment`."""
+        is_open, opening, closing = self.state_at(moment)
+        return closing if is_open else opening
+
+    def describe(self) -> Dict[str, str]:
+        """Orari leggibili per giorno, es. {"lun": "07:00-12:30, 15:00-19:30"}."""
+        result = {}
+        for day, name in enumerate(DAY_NAMES):
+            intervals = self.days.get(day)
+            if intervals is None:
+                continue
+            if not intervals:
+                result[name] = "chiuso"
+            elif intervals == [(0, DAY_MINUTES)]:
+                result[name] = "24h"
+            else:
+                result[name] = ", ".join(
+                    f"{s // 60:02d}:{s % 60:02d}-{(e % DAY_MINUTES) // 60:02d}:{e % 60:02d}" for s, e in intervals
+                )
+        return result
+
+
+def compile_hours(rows: Any) -> Optional[OpeningHours]:
+    """`orariapertura` in `OpeningHours`; None se gli orari non sono comunicati."""
+    if not isinstance(rows, list):
+        return None
+    days: Dict[int, List[Interval]] = {}
+    for row in rows:
+        if not isinstance(row, dict) or row.get("flagNonComunicato"):
+            continue
+        try:
+            day = int(row.get("giornoSettimanaId")) - 1
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= day < 7:
+            continue
+        days[day] = _merge(days.get(day, []) + _day_intervals(row))
+    if not days:
+        return None
+
+    weekly: List[Interval] = []
+    for day, intervals in days.items():
+        for start, end in intervals:
+            start += day * DAY_MINUTES
+            end += day * DAY_MINUTES
+            if end > WEEK_MINUTES:
+                # domenica notte: la parte dopo la mezzanotte va all'inizio della settimana
+                weekly.append((0, end - WEEK_MINUTES))
+                end = WEEK_MINUTES
+            weekly.append((start, end))
+    return OpeningHours(_merge(weekly), days)
@@ -0,0 +1,177 @@
+"""Archivio in memoria dei loghi brand MIMIT.
+
+Ogni logo viene decodificato una sola volta e conservato come bytes, deduplicato per
+hash del contenuto; ID e nome del brand sono solo indici verso l'hash. Gli URL
+contengono l'hash, quindi possono essere messi in cache dal browser senza scadenza.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from .const import LOGO_URL_TEMPLATE
+from .helpers import decode_data_uri
+
+
+@dataclass(frozen=True)
+class Logo:
+    """Logo decodificato, identificato dall'hash del contenuto."""
+
+    digest: str
+    content_type: str
+    body: bytes
+
+    @property
+    def url(self) -> str:
+        return LOGO_URL_TEMPLATE.format(key=self.digest)
+
+
+# Tipi serviti dalla view (sottotipo o estensione MIMIT -> content type); SVG solo come
+# image/svg+xml, con CSP restrittiva lato view. Qualsiasi altro tipo viene scartato.
+IMAGE_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "jpg": "image/jpeg",
+    "pjpeg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+    "svg": "image/svg+xml",
+    "svg+xml": "image/svg+xml",
+}
+SVG_CONTENT_TYPE = "image/svg+xml"
+
+
+def image_content_type(value: Any) -> Optional[str]:
+    """Content type ammesso per `value` ("image/png", "jpg", ...); None se non è un'immagine consentita."""
+    if not isinstance(value, str):
+        return None
+    value = value.split(";", 1)[0].strip().lower()
+    if value.startswith("image/"):
+        value = value[len("image/"):]
+    elif "/" in value:
+        return None
+    return IMAGE_TYPES.get(value.lstrip("."))
+
+
+def _index_key(key: Any) -> str:
+    return str(key).strip().lower()
+
+
+class LogoStore:
+    """Loghi deduplicati per hash, indicizzati per ID e nome del brand."""
+
+    def __init__(self) -> None:
+        self._logos: Dict[str, Logo] = {}
+        self._index: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._logos)
+
+    def __iter__(self) -> Iterator[Logo]:
+        return iter(self._logos.values())
+
+    def add(self, keys: Iterable[Any], content_type: str, body: bytes) -> Optional[Logo]:
+        """Aggiunge un logo (se nuovo) e lo indicizza con le chiavi date.
+
+        Ritorna None, senza aggiungerlo, se il tipo non è un'immagine consentita.
+        """
+        content_type = image_content_type(content_type)
+        if content_type is None:
+            return None
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        logo = self._logos.get(digest)
+        if logo is None:
+            logo = self._logos[digest] = Logo(digest, content_type, body)
+        for key in keys:
+            if key is not None and str(key).strip():
+                self._index[_index_key(key)] = digest
+        return logo
+
+    def get(self, digest: str) -> Optional[Logo]:
+        return self._logos.get(digest)
+
+    def lookup(self, *keys: Any) -> Optional[Logo]:
+        """Primo logo trovato tra le chiavi date (ID brand, nome brand)."""
+        for key in keys:
+            if key is None:
+                continue
+            digest = self._index.get(_index_key(key))
+            if digest is not None:
+                return self._logos[digest]
+        return None
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Forma serializzabile in JSON (per la cache su disco)."""
+        return {
+            "logos": [
+                {
+                    "digest": logo.digest,
+                    "content_type": logo.content_type,
+                    "body": base64.b64encode(logo.body).decode("ascii"),
+                }
+                for logo in self._logos.values()
+            ],
+            "index": dict(self._index),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "LogoStore":
+        """Ricostruisce l'archivio da `as_dict`; ignora le voci non valide."""
+        store = cls()
+        if not isinstance(data, dict):
+            return store
+        for item in data.get("logos") or []:
+            try:
+                body = base64.b64decode(item["body"])
+            except (KeyError, TypeError, binascii.Error, ValueError):
+                continue
+            # l'hash viene ricalcolato: una voce corrotta resta senza indici e viene scartata
+            content_type = image_content_type(item.get("content_type") or "image/png")
+            if content_type is None:
+                continue
+            digest = hashlib.sha256(body).hexdigest()[:16]
+            store._logos[digest] = Logo(digest, content_type, body)
+        for key, digest in (data.get("index") or {}).items():
+            if digest in store._logos:
+                store._index[key] = digest
+        # rimuove i loghi non più raggiungibili da nessun indice
+        referenced = set(store._index.values())
+        store._logos = {d: logo for d, logo in store._logos.items() if d in referenced}
+        return store
+
+    @classmethod
+    def from_payload(cls, payload: Any) -> "LogoStore":
+        """Costruisce l'archivio dalla risposta di `registry/alllogos`.
+
+        Structure: { "loghi": [ { "bandieraId": 123, "bandiera": "Name", "logoMarkerList": [...] }, ... ] }
+        """
+        store = cls()
+        items = payload.get("loghi") if isinstance(payload, dict) else None
+        if not isinstance(items, list):
+            return store
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            markers = item.get("logoMarkerList")
+            if not isinstance(markers, list) or not markers or not isinstance(markers[0], dict):
+                continue
+            # Pick the first one
+            content = markers[0].get("content")
+            if not content:
+                continue
+            if content.startswith("data:"):
+                decoded = decode_data_uri(content)
+                if decoded is None:
+                    continue
+                content_type, body = decoded
+            else:
+                try:
+                    body = base64.b64decode(content)
+                except (binascii.Error, ValueError):
+                    continue
+                content_type = f"image/{markers[0].get('estensione') or 'png'}"
+            store.add((item.get("bandieraId"), item.get("bandiera")), content_type, body)
+        return store
@@ -0,0 +1,186 @@
+"""Prezzi come statistiche esterne a lungo termine del recorder.
+
+Con `long_term_statistics: true` (YAML) i prezzi di ogni impianto/carburante
+vengono importati come statistiche orarie (media pesata sul tempo, min, max)
+con ID `osservaprezzi_carburanti:<impianto>_<carburante>_<self|servito>`,
+calcolate dallo storico compatto (`history.PriceHistory`). Le ore concluse vengono
+esportate in blocco una volta all'ora; un cambio arrivato in ritardo su un'ora già
+esportata la fa reimportare al ciclo successivo. Alla prima esportazione di una
+serie viene importato tutto lo storico compatto disponibile; prezzi precedenti a
+quelli osservati dall'integrazione non vengono recuperati.
+"""
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set
+
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import async_add_external_statistics
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later, async_track_time_change
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util, slugify
+
+from .const import (
+    DOMAIN,
+    HISTORY_MAX_AGE,
+    STATISTICS_FLUSH_DELAY,
+    STATISTICS_STORAGE_KEY,
+    STORAGE_VERSION,
+)
+from .history import SeriesKey
+
+try:  # Home Assistant 2025.4+
+    from homeassistant.components.recorder.models import StatisticMeanType
+except ImportError:  # pragma: no cover - versioni precedenti
+    StatisticMeanType = None
+
+if TYPE_CHECKING:
+    from .coordinator import CoordinatorRegistry
+
+_LOGGER = logging.getLogger(__name__)
+
+HOUR = 3600
+
+
+def statistic_id(key: SeriesKey) -> str:
+    station_id, fuel, is_self = key
+    mode = "self" if is_self else "servito"
+    return f"{DOMAIN}:{slugify(f'{station_id}_{fuel}_{mode}')}"
+
+
+class LongTermStatistics:
+    """Esporta lo storico dei prezzi come statistiche orarie esterne, a blocchi."""
+
+    def __init__(self, hass: HomeAssistant, registry: "CoordinatorRegistry") -> None:
+        self.hass = hass
+        self.registry = registry
+        self._store: Store = Store(hass, STORAGE_VERSION, STATISTICS_STORAGE_KEY)
+        # serie -> fine dell'ultima ora esportata (epoch)
+        self._exported: Dict[str, float] = {}
+        self._pending: Set[int] = set()
+        self._unsubs: List[Callable[[], None]] = []
+        self._unsub_flush: Optional[Callable[[], None]] = None
+        self._unsub_stop: Optional[Callable[[], None]] = None
+        self.imports = 0
+        self.rows = 0
+
+    async def async_start(self) -> None:
+        if self._unsubs:
+            return
+        stored: Optional[Dict[str, Any]] = await self._store.async_load()
+        self._exported = {
+            key: float(value) for key, value in ((stored or {}).get("exported") or {}).items()
+            if isinstance(value, (int, float))
+        }
+        self._unsubs = [
+            self.registry.async_add_station_listener(self._async_station_updated),
+            # pochi minuti dopo l'ora: le ore appena concluse di tutte le serie in un solo ciclo
+            async_track_time_change(self.hass, self._async_hourly, minute=2, second=0),
+        ]
+        self._unsub_stop = self.hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_on_stop)
+        # backfill delle serie mai esportate (o rimaste indietro mentre HA era spento)
+        self._schedule_flush()
+
+    @callback
+    def async_stop(self) -> None:
+        for unsub in (*self._unsubs, self._unsub_flush, self._unsub_stop):
+            if unsub:
+                unsub()
+        self._unsubs = []
+        self._unsub_flush = self._unsub_stop = None
+
+    @callback
+    def _async_on_stop(self, event) -> None:
+        # il listener one-shot è già stato consumato dall'evento
+        self._unsub_stop = None
+        self.async_stop()
+
+    @staticmethod
+    def _key(key: SeriesKey) -> str:
+        station_id, fuel, is_self = key
+        return f"{station_id}|{fuel}|{int(is_self)}"
+
+    @callback
+    def _async_station_updated(self, station_id: int) -> None:
+        for key, changed_at in self.registry.history.history.take_changes(station_id).items():
+            exported = self._exported.get(self._key(key))
+            if exported is not None and changed_at < exported:
+                # cambio con validità in un'ora già esportata: la si reimporta
+                self._exported[self._key(key)] = changed_at // HOUR * HOUR
+                self._pending.add(station_id)
+        if self._pending:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._unsub_flush is None:
+            self._unsub_flush = async_call_later(self.hass, STATISTICS_FLUSH_DELAY, self._async_delayed_flush)
+
+    @callback
+    def _async_delayed_flush(self, _now) -> None:
+        self._unsub_flush = None
+        self.async_flush()
+
+    @callback
+    def _async_hourly(self, _now) -> None:
+        self.async_flush()
+
+    def _metadata(self, key: SeriesKey) -> StatisticMetaData:
+        station_id, fuel, is_self = key
+        coordinator = self.registry.get(station_id)
+        station = coordinator.snapshot.name if coordinator and coordinator.data else None
+        fuel_name = fuel
+        if coordinator is not None:
+            item = coordinator.snapshot.fuels.get((fuel, is_self))
+            if item is not None and item.name:
+                fuel_name = item.name
+        metadata: Dict[str, Any] = {
+            "has_sum": False,
+            "name": f"{station or f'Impianto {station_id}'} {fuel_name} ({'Self' if is_self else 'Servito'})",
+            "source": DOMAIN,
+            "statistic_id": statistic_id(key),
+            "unit_of_measurement": "€/l",
+        }
+        if StatisticMeanType is not None:
+            metadata["mean_type"] = StatisticMeanType.ARITHMETIC
+        else:
+            metadata["has_mean"] = True
+        return StatisticMetaData(**metadata)
+
+    @callback
+    def async_flush(self) -> None:
+        """Importa le ore concluse non ancora esportate delle serie degli impianti configurati."""
+        self._pending.clear()
+        now = dt_util.utcnow().timestamp()
+        last_hour = now // HOUR * HOUR
+        oldest = (now - HISTORY_MAX_AGE.total_seconds()) // HOUR * HOUR
+        imported = 0
+        for key, series in self.registry.history.history.series.items():
+            if key[0] not in self.registry or not len(series):
+                continue
+            name = self._key(key)
+            start = self._exported.get(name)
+            if start is None:
+                start = max(series.times[0] // HOUR * HOUR, oldest)
+            if start >= last_hour:
+                continue
+            boundaries = [float(ts) for ts in range(int(start), int(last_hour) + 1, HOUR)]
+            columns = series.downsample(boundaries, ("mean", "min", "max"))
+            stats = [
+                StatisticData(start=dt_util.utc_from_timestamp(ts), mean=mean, min=low, max=high)
+                for ts, mean, low, high in zip(boundaries, columns["mean"], columns["min"], columns["max"])
+                if mean is not None
+            ]
+            if stats:
+                async_add_external_statistics(self.hass, self._metadata(key), stats)
+                imported += 1
+                self.rows += len(stats)
+            self._exported[name] = last_hour
+        if imported:
+            self.imports += imported
+            _LOGGER.debug("Statistiche a lungo termine: %s serie importate", imported)
+        self._store.async_delay_save(lambda: {"exported": dict(self._exported)}, STATISTICS_FLUSH_DELAY)
+
+    def diagnostics(self) -> Dict[str, Any]:
+        return {"series": len(self._exported), "imports": self.imports, "rows": self.rows}
@@ -0,0 +1,104 @@
+"""Impianto più economico vicino a una posizione che si sposta.
+
+`CheapestNearby` tiene prezzo e coordinate degli impianti per un carburante e una
+modalità, e l'insieme dei candidati entro il raggio dalla posizione corrente. Un
+cambio di prezzo tocca un solo impianto; uno spostamento ricalcola i candidati con
+lo `SpatialIndex` e il minimo solo su di essi, senza riscandire tutti gli impianti.
+"""
+from __future__ import annotations
+
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from .helpers import SpatialIndex, haversine_km
+
+# Spostamenti più piccoli (km) non ricalcolano i candidati
+MIN_MOVE_KM = 0.05
+
+
+class NearbyResult(NamedTuple):
+    """Impianto più economico: a parità di prezzo vince il più vicino."""
+
+    price: float
+    distance_km: float
+    station_id: int
+
+
+class CheapestNearby:
+    """Minimo incrementale del prezzo tra gli impianti entro `radius_km` dalla posizione."""
+
+    def __init__(self, radius_km: float, min_move_km: float = MIN_MOVE_KM) -> None:
+        self.radius_km = radius_km
+        self.min_move_km = min_move_km
+        self.index = SpatialIndex(cell_km=max(radius_km, 1.0))
+        self.prices: Dict[int, float] = {}
+        self.location: Optional[Tuple[float, float]] = None
+        # impianti entro il raggio -> distanza in km
+        self.candidates: Dict[int, float] = {}
+        self.best: Optional[NearbyResult] = None
+
+    def _rescan(self) -> None:
+        best = None
+        for station_id, distance in self.candidates.items():
+            price = self.prices.get(station_id)
+            if price is None:
+                continue
+            item = NearbyResult(price, distance, station_id)
+            if best is None or item < best:
+                best = item
+        self.best = best
+
+    def update_station(
+        self, station_id: int, coordinates: Optional[Tuple[float, float]], price: Optional[float]
+    ) -> bool:
+        """Aggiorna un impianto; True se il risultato è cambiato."""
+        previous = self.best
+        if coordinates is None:
+            return self.remove_station(station_id)
+        self.index.add(station_id, *coordinates)
+        if price is None:
+            self.prices.pop(station_id, None)
+        else:
+            self.prices[station_id] = price
+
+        if self.location is not None:
+            distance = haversine_km(*self.location, *coordinates)
+            if distance <= self.radius_km:
+                self.candidates[station_id] = distance
+            else:
+                self.candidates.pop(station_id, None)
+
+        if previous is not None and previous.station_id == station_id:
+            # il migliore è cambiato (prezzo salito, uscito dal raggio): si riguarda tra i candidati
+            self._rescan()
+        elif station_id in self.candidates and price is not None:
+            item = NearbyResult(price, self.candidates[station_id], station_id)
+            if self.best is None or item < self.best:
+                self.best = item
+        return self.best != previous
+
+    def remove_station(self, station_id: int) -> bool:
+        previous = self.best
+        self.index.remove(station_id)
+        self.prices.pop(station_id, None)
+        if self.candidates.pop(station_id, None) is not None and previous and previous.station_id == station_id:
+            self._rescan()
+        return self.best != previous
+
+    def set_location(self, latitude: float, longitude: float) -> bool:
+        """Sposta la posizione; True se il risultato è cambiato."""
+        if self.location is not None and haversine_km(*self.location, latitude, longitude) < self.min_move_km:
+            return False
+        previous = self.best
+        self.location = (latitude, longitude)
+        self.candidates = {
+            station_id: distance for distance, station_id in self.index.within(latitude, longitude, self.radius_km)
+        }
+        self._rescan()
+        return self.best != previous
+
+    def clear_location(self) -> bool:
+        previous = self.best
+        self.location = None
+        self.candidates = {}
+        self.best = None
+        return previous is not None
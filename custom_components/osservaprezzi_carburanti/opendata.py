@@ -0,0 +1,455 @@
+"""Ingestione dei file open data MIMIT (`anagrafica_impianti_attivi.csv`, `prezzo_alle_8.csv`).
+
+Il Ministero pubblica ogni giorno l'anagrafica di tutti gli impianti attivi e i
+prezzi comunicati alle 08:00. I file vengono letti riga per riga (da disco o in
+streaming via HTTP, mai caricati interi in memoria) e trasformati in una tabella
+compatta di tuple, da cui ogni coordinator ottiene un payload con la stessa forma
+di `servicearea/{id}`.
+"""
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+import asyncio
+from collections import deque
+import csv
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, ClassVar, Deque, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional
+
+from .const import (
+    OPENDATA_MAX_AGE,
+    OPENDATA_PRICES_FILE,
+    OPENDATA_PRICES_URL,
+    OPENDATA_REGISTRY_FILE,
+    OPENDATA_REGISTRY_URL,
+    OPENDATA_RETRY_INTERVAL,
+    REQUEST_TIMEOUT,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Righe passate a csv.reader per ogni blocco letto dallo stream HTTP
+CHUNK_LINES = 2000
+
+
+class OpenDataError(Exception):
+    """File open data mancante o non riconosciuto."""
+
+
+class StationRow(NamedTuple):
+    """Riga di `anagrafica_impianti_attivi.csv`."""
+
+    company: str
+    brand: str
+    station_type: str
+    name: str
+    address: str
+    town: str
+    province: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+
+class PriceRow(NamedTuple):
+    """Riga di `prezzo_alle_8.csv`."""
+
+    fuel: str
+    price: Optional[float]
+    is_self: bool
+    # `dtComu` così come nel file (convertito in ISO solo in `payload`)
+    communicated_at: str
+
+
+def _float(value: str) -> Optional[float]:
+    try:
+        return float(value.replace(",", "."))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _iso(value: str) -> Optional[str]:
+    """`dd/mm/yyyy HH:MM:SS` (formato MIMIT) in ISO 8601."""
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%d/%m/%Y %H:%M:%S").isoformat()
+    except ValueError:
+        return value
+
+
+class OpenDataTable:
+    """Tabella compatta di impianti e prezzi, indicizzata per ID impianto."""
+
+    def __init__(self) -> None:
+        self.stations: Dict[int, StationRow] = {}
+        self.prices: Dict[int, List[PriceRow]] = {}
+        self.extracted: Dict[str, str] = {}
+        self.loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self.stations)
+
+    def __contains__(self, station_id: int) -> bool:
+        return station_id in self.stations or station_id in self.prices
+
+    @property
+    def price_rows(self) -> int:
+        return sum(len(rows) for rows in self.prices.values())
+
+    def payload(self, station_id: int) -> Optional[Dict[str, Any]]:
+        """Payload dell'impianto nella forma di `servicearea/{id}` (solo i campi presenti negli open data)."""
+        station = self.stations.get(station_id)
+        prices = self.prices.get(station_id)
+        if station is None and prices is None:
+            return None
+        data: Dict[str, Any] = {"id": station_id}
+        if station is not None:
+            data.update(
+                name=station.name,
+                company=station.company,
+                brand=station.brand,
+                stationType=station.station_type,
+                address=station.address,
+                comune=station.town,
+                provincia=station.province,
+            )
+            if station.latitude is not None and station.longitude is not None:
+                data["latitude"] = station.latitude
+                data["longitude"] = station.longitude
+        data["fuels"] = [
+            {"name": row.fuel, "price": row.price, "isSelf": row.is_self, "validityDate": _iso(row.communicated_at)}
+            for row in prices or []
+        ]
+        return data
+
+
+def merge_opendata(known: Optional[Dict[str, Any]], payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Aggiorna un payload `servicearea/{id}` già noto con i campi degli open data.
+
+    Servizi, orari e contatti non sono negli open data: restano quelli già noti.
+    """
+    if not known:
+        return payload
+    merged = dict(known)
+    merged.update(payload)
+    return merged
+
+
+class _NeedMoreLines(Exception):
+    """Le righe ricevute finora si fermano a metà di un record."""
+
+
+class _LineFeed:
+    """Iteratore di righe alimentato a blocchi, letto da un unico `csv.reader`.
+
+    Se le righe finiscono a metà di un record (un campo tra virgolette che va a capo)
+    solleva `_NeedMoreLines` e rimette da parte le righe già lette del record: il
+    reader lo rilegge per intero quando arriva il blocco successivo.
+    """
+
+    def __init__(self) -> None:
+        self._pending: Deque[Iterator[str]] = deque()
+        self._record: List[str] = []
+        self.closed = False
+
+    def extend(self, lines: Iterable[str]) -> None:
+        self._pending.append(iter(lines))
+
+    def commit(self) -> None:
+        """Il record letto è completo: le sue righe non servono più."""
+        self._record = []
+
+    def __iter__(self) -> "_LineFeed":
+        return self
+
+    def __next__(self) -> str:
+        while self._pending:
+            try:
+                line = next(self._pending[0])
+            except StopIteration:
+                self._pending.popleft()
+                continue
+            self._record.append(line)
+            return line
+        if self.closed:
+            raise StopIteration
+        if self._record:
+            self._pending.append(iter(self._record))
+            self._record = []
+        raise _NeedMoreLines
+
+
+class _CsvParser(ABC):
+    """Parser incrementale: riceve blocchi di righe e riconosce estrazione, intestazione e separatore.
+
+    I blocchi sono letti da un solo `csv.reader`, quindi un campo tra virgolette su più
+    righe resta intero anche se si trova a cavallo di due blocchi.
+    """
+
+    # chiave interna -> nome della colonna nell'intestazione (minuscolo)
+    columns: ClassVar[Mapping[str, str]]
+
+    def __init__(self, table: OpenDataTable, name: str) -> None:
+        self.table = table
+        self.name = name
+        self.rows = 0
+        self.skipped = 0
+        self._delimiter: Optional[str] = None
+        self._index: Dict[str, int] = {}
+        self._lines = _LineFeed()
+        self._reader: Optional[Iterator[List[str]]] = None
+
+    def feed(self, lines: Iterable[str]) -> None:
+        self._lines.extend(lines)
+        self._parse()
+
+    def close(self) -> None:
+        """Fine del file: un eventuale record incompleto viene letto così com'è."""
+        self._lines.closed = True
+        self._parse()
+
+    def _parse(self) -> None:
+        if self._reader is None:
+            try:
+                self._read_header()
+            except (_NeedMoreLines, StopIteration):
+                return
+            self._reader = csv.reader(self._lines, delimiter=self._delimiter)
+        while True:
+            try:
+                fields = next(self._reader)
+            except (_NeedMoreLines, StopIteration):
+                return
+            self._lines.commit()
+            if not fields:
+                continue
+            try:
+                self._row(fields)
+                self.rows += 1
+            except (IndexError, ValueError):
+                self.skipped += 1
+
+    def _read_header(self) -> None:
+        while True:
+            text = next(self._lines).strip().lstrip("\ufeff")
+            self._lines.commit()
+            if not text:
+                continue
+            if text.lower().startswith("estrazione"):
+                # es. "Estrazione del 2024-05-10"
+                self.table.extracted[self.name] = text.split()[-1]
+                continue
+            self._delimiter = "|" if "|" in text else ";"
+            header = [h.strip().lower() for h in next(csv.reader([text], delimiter=self._delimiter))]
+            try:
+                self._index = {key: header.index(column) for key, column in self.columns.items()}
+            except ValueError as err:
+                raise OpenDataError(f"{self.name}: intestazione non riconosciuta: {text}") from err
+            return
+
+    @abstractmethod
+    def _row(self, fields: List[str]) -> None:
+        """Aggiunge alla tabella una riga già suddivisa in campi."""
+
+
+class StationRegistryParser(_CsvParser):
+    """`anagrafica_impianti_attivi.csv`."""
+
+    columns = {
+        "id": "idimpianto",
+        "company": "gestore",
+        "brand": "bandiera",
+        "type": "tipo impianto",
+        "name": "nome impianto",
+        "address": "indirizzo",
+        "town": "comune",
+        "province": "provincia",
+        "lat": "latitudine",
+        "lon": "longitudine",
+    }
+
+    def _row(self, fields: List[str]) -> None:
+        i = self._index
+        self.table.stations[int(fields[i["id"]])] = StationRow(
+            fields[i["company"]].strip(),
+            sys.intern(fields[i["brand"]].strip()),
+            sys.intern(fields[i["type"]].strip()),
+            fields[i["name"]].strip(),
+            fields[i["address"]].strip(),
+            sys.intern(fields[i["town"]].strip()),
+            sys.intern(fields[i["province"]].strip()),
+            _float(fields[i["lat"]]),
+            _float(fields[i["lon"]]),
+        )
+
+
+class PriceParser(_CsvParser):
+    """`prezzo_alle_8.csv`."""
+
+    columns = {
+        "id": "idimpianto",
+        "fuel": "desccarburante",
+        "price": "prezzo",
+        "self": "isself",
+        "date": "dtcomu",
+    }
+
+    def _row(self, fields: List[str]) -> None:
+        i = self._index
+        self.table.prices.setdefault(int(fields[i["id"]]), []).append(
+            PriceRow(
+                sys.intern(fields[i["fuel"]].strip()),
+                _float(fields[i["price"]]),
+                fields[i["self"]].strip() == "1",
+                sys.intern(fields[i["date"]].strip()),
+            )
+        )
+
+
+def ingest_file(path: str, parser: _CsvParser) -> _CsvParser:
+    """Legge un file CSV locale riga per riga."""
+    with open(path, encoding="utf-8", errors="replace", newline="") as handle:
+        parser.feed(handle)
+        parser.close()
+    return parser
+
+
+def load_table(directory: str) -> OpenDataTable:
+    """Tabella dai due file open data presenti in `directory` (bloccante)."""
+    table = OpenDataTable()
+    for filename, parser_cls in ((OPENDATA_REGISTRY_FILE, StationRegistryParser), (OPENDATA_PRICES_FILE, PriceParser)):
+        path = os.path.join(directory, filename)
+        if not os.path.isfile(path):
+            raise OpenDataError(f"File open data mancante: {path}")
+        ingest_file(path, parser_cls(table, filename))
+    table.loaded_at = time.time()
+    return table
+
+
+async def async_ingest_url(
+    session: Any,
+    url: str,
+    parser: _CsvParser,
+    executor: Optional[Callable[..., Any]] = None,
+) -> _CsvParser:
+    """Scarica un file CSV in streaming e lo passa al parser a blocchi di righe.
+
+    Con `executor` ogni blocco viene analizzato fuori dall'event loop (un blocco alla
+    volta, quindi il parser non è mai usato da due thread insieme).
+    """
+    async def _feed(chunk: List[str]) -> None:
+        if executor is not None:
+            await executor(parser.feed, chunk)
+        else:
+            parser.feed(chunk)
+
+    async with session.get(url, timeout=REQUEST_TIMEOUT * 12) as resp:
+        if resp.status != 200:
+            raise OpenDataError(f"{url}: HTTP {resp.status}")
+        chunk: List[str] = []
+        async for raw in resp.content:
+            chunk.append(raw.decode("utf-8", errors="replace"))
+            if len(chunk) >= CHUNK_LINES:
+                await _feed(chunk)
+                chunk = []
+        if chunk:
+            await _feed(chunk)
+    parser.close()
+    return parser
+
+
+async def async_download_table(session: Any, executor: Optional[Callable[..., Any]] = None) -> OpenDataTable:
+    """Tabella dai file open data pubblicati sul sito MIMIT."""
+    table = OpenDataTable()
+    await async_ingest_url(
+        session, OPENDATA_REGISTRY_URL, StationRegistryParser(table, OPENDATA_REGISTRY_FILE), executor
+    )
+    await async_ingest_url(session, OPENDATA_PRICES_URL, PriceParser(table, OPENDATA_PRICES_FILE), executor)
+    table.loaded_at = time.time()
+    return table
+
+
+class OpenDataLoader:
+    """Tabella open data condivisa, ricaricata al più una volta ogni `OPENDATA_MAX_AGE`.
+
+    Con `path` i file vengono letti da una directory locale (es. fixture per i test
+    offline), altrimenti scaricati dal sito MIMIT. Un solo caricamento alla volta.
+    """
+
+    def __init__(
+        self,
+        session: Any,
+        path: Optional[str] = None,
+        executor: Optional[Callable[..., Any]] = None,
+    ) -> None:
+        self.session = session
+        self.path = path
+        # es. hass.async_add_executor_job: lettura e analisi dei CSV non devono bloccare l'event loop
+        self._executor = executor
+        self.table: Optional[OpenDataTable] = None
+        self.loads = 0
+        self.last_error: Optional[str] = None
+        self._last_attempt: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return (
+            self.table is None
+            or self.table.loaded_at is None
+            or time.time() - self.table.loaded_at > OPENDATA_MAX_AGE.total_seconds()
+        )
+
+    @property
+    def is_loading(self) -> bool:
+        return self._lock.locked()
+
+    async def async_get_table(self) -> OpenDataTable:
+        """Tabella corrente, ricaricata se scaduta; se il caricamento fallisce resta la precedente."""
+        async with self._lock:
+            if not self.is_stale:
+                return self.table
+            now = time.time()
+            if self._last_attempt and now - self._last_attempt < OPENDATA_RETRY_INTERVAL:
+                # anche senza tabella: dopo un errore non si riscaricano i file a ogni chiamata
+                if self.table is None:
+                    raise OpenDataError(f"Open data non disponibili: {self.last_error}")
+                return self.table
+            self._last_attempt = now
+            try:
+                if self.path:
+                    if self._executor is not None:
+                        table = await self._executor(load_table, self.path)
+                    else:
+                        table = load_table(self.path)
+                else:
+                    table = await async_download_table(self.session, self._executor)
+            except Exception as err:
+                self.last_error = str(err)
+                if self.table is None:
+                    raise OpenDataError(f"Open data non disponibili: {err}") from err
+                _LOGGER.warning("Aggiornamento open data fallito, uso i dati precedenti: %s", err)
+                return self.table
+            self.loads += 1
+            self.last_error = None
+            self.table = table
+            _LOGGER.debug(
+                "Open data caricati: %s impianti, %s prezzi (estrazione %s)",
+                len(table), table.price_rows, table.extracted,
+            )
+            return table
+
+    def diagnostics(self) -> Dict[str, Any]:
+        table = self.table
+        return {
+            "source": self.path or "mimit",
+            "loads": self.loads,
+            "stations": len(table) if table else 0,
+            "price_rows": table.price_rows if table else 0,
+            "extracted": dict(table.extracted) if table else {},
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,180 @@
+"""Classifica incrementale dei prezzi di un carburante tra tutti gli impianti.
+
+`PriceRanking` mantiene min, max, media, mediana e i primi k impianti con heap a
+cancellazione pigra: aggiornare o togliere il prezzo di un impianto costa O(log n)
+(ammortizzato), i primi k O(k log n), senza riscandire tutti gli impianti.
+"""
+from __future__ import annotations
+
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+# Ricostruisce un heap quando le voci scadute superano quelle valide (più questo margine)
+COMPACT_SLACK = 32
+
+
+class _LazyHeap:
+    """Min-heap di (chiave, impianto) con cancellazione pigra tramite versione."""
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[float, int, int]] = []
+        # impianto -> (chiave, versione) della voce valida
+        self.entries: Dict[int, Tuple[float, int]] = {}
+        self._version = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, station_id: int) -> bool:
+        return station_id in self.entries
+
+    def push(self, station_id: int, key: float) -> None:
+        self._version += 1
+        self.entries[station_id] = (key, self._version)
+        heapq.heappush(self._heap, (key, self._version, station_id))
+
+    def discard(self, station_id: int) -> None:
+        if self.entries.pop(station_id, None) is not None and len(self._heap) > 2 * len(self.entries) + COMPACT_SLACK:
+            self._heap = [(key, version, sid) for sid, (key, version) in self.entries.items()]
+            heapq.heapify(self._heap)
+
+    def _prune(self) -> None:
+        heap = self._heap
+        while heap and self.entries.get(heap[0][2]) != (heap[0][0], heap[0][1]):
+            heapq.heappop(heap)
+
+    def top(self) -> Optional[Tuple[float, int]]:
+        self._prune()
+        if not self._heap:
+            return None
+        key, _, station_id = self._heap[0]
+        return key, station_id
+
+    def pop(self) -> Tuple[float, int]:
+        self._prune()
+        key, _, station_id = heapq.heappop(self._heap)
+        del self.entries[station_id]
+        return key, station_id
+
+    def smallest(self, k: int) -> List[Tuple[float, int]]:
+        """Le prime `k` voci valide in O(k log n) ammortizzato.
+
+        Le voci valide estratte vengono reinserite con la loro versione, quindi voci
+        e ordine a parità di chiave non cambiano; quelle scadute incontrate sono scartate.
+        """
+        heap = self._heap
+        taken: List[Tuple[float, int, int]] = []
+        while len(taken) < k:
+            self._prune()
+            if not heap:
+                break
+            taken.append(heapq.heappop(heap))
+        for item in taken:
+            heapq.heappush(heap, item)
+        return [(key, station_id) for key, _, station_id in taken]
+
+
+class PriceRanking:
+    """Statistiche e classifica dei prezzi per impianto, aggiornate un impianto alla volta."""
+
+    def __init__(self) -> None:
+        self.prices: Dict[int, float] = {}
+        self.total = 0.0
+        self._min = _LazyHeap()
+        # prezzi negati: max-heap
+        self._max = _LazyHeap()
+        # mediana: metà inferiore (max-heap, negata) e metà superiore (min-heap)
+        self._lower = _LazyHeap()
+        self._upper = _LazyHeap()
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def update(self, station_id: int, price: Optional[float]) -> bool:
+        """Imposta (o con `None` toglie) il prezzo di un impianto; True se è cambiato."""
+        if price is None:
+            return self.remove(station_id)
+        if self.prices.get(station_id) == price:
+            return False
+        self._discard(station_id)
+        self.prices[station_id] = price
+        self.total += price
+        self._min.push(station_id, price)
+        self._max.push(station_id, -price)
+        lower = self._lower.top()
+        if lower is None or price <= -lower[0]:
+            self._lower.push(station_id, -price)
+        else:
+            self._upper.push(station_id, price)
+        self._rebalance()
+        return True
+
+    def remove(self, station_id: int) -> bool:
+        if station_id not in self.prices:
+            return False
+        self._discard(station_id)
+        self._rebalance()
+        return True
+
+    def _discard(self, station_id: int) -> None:
+        price = self.prices.pop(station_id, None)
+        if price is None:
+            return
+        self.total -= price
+        self._min.discard(station_id)
+        self._max.discard(station_id)
+        self._lower.discard(station_id)
+        self._upper.discard(station_id)
+        if not self.prices:
+            # azzera l'errore di arrotondamento accumulato
+            self.total = 0.0
+
+    def _rebalance(self) -> None:
+        while len(self._lower) > len(self._upper) + 1:
+            key, station_id = self._lower.pop()
+            self._upper.push(station_id, -key)
+        while len(self._upper) > len(self._lower):
+            key, station_id = self._upper.pop()
+            self._lower.push(station_id, -key)
+        # un impianto riprezzato può finire nella metà sbagliata: si scambiano le cime
+        while self._upper:
+            lower, upper = self._lower.top(), self._upper.top()
+            if -lower[0] <= upper[0]:
+                break
+            self._lower.pop()
+            self._upper.pop()
+            self._lower.push(upper[1], -upper[0])
+            self._upper.push(lower[1], -lower[0])
+
+    @property
+    def minimum(self) -> Optional[float]:
+        top = self._min.top()
+        return top[0] if top else None
+
+    @property
+    def maximum(self) -> Optional[float]:
+        top = self._max.top()
+        return -top[0] if top else None
+
+    @property
+    def average(self) -> Optional[float]:
+        return self.total / len(self.prices) if self.prices else None
+
+    @property
+    def median(self) -> Optional[float]:
+        lower = self._lower.top()
+        if lower is None:
+            return None
+        if len(self._lower) > len(self._upper):
+            return -lower[0]
+        return (-lower[0] + self._upper.top()[0]) / 2
+
+    @property
+    def spread(self) -> Optional[float]:
+        if not self.prices:
+            return None
+        return self.maximum - self.minimum
+
+    def top(self, k: int) -> List[Tuple[float, int]]:
+        """I `k` impianti più economici come (prezzo, impianto); a parità di prezzo il primo inserito."""
+        return self._min.smallest(k)
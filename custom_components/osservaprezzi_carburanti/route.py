@@ -0,0 +1,132 @@
+"""Impianti lungo un percorso (polilinea) entro una distanza.
+
+Il percorso può essere una lista di coordinate (coppie o dizionari con i campi
+riconosciuti da `find_coordinates`) o una polilinea codificata (formato Google,
+precisione 5). Per ogni segmento si interrogano solo le celle dello `SpatialIndex`
+nel suo riquadro allargato della distanza, poi si calcola la distanza esatta dal
+segmento.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterator, List, NamedTuple, Sequence, Tuple
+
+from .helpers import EARTH_RADIUS_KM, SpatialIndex, find_coordinates, haversine_km
+
+Point = Tuple[float, float]
+
+# km per grado di latitudine
+KM_PER_DEG = math.pi * EARTH_RADIUS_KM / 180
+# Lunghezza minima dei tratti in cui si spezzano i segmenti lunghi
+MIN_PIECE_KM = 10.0
+
+
+class RouteMatch(NamedTuple):
+    """Impianto vicino al percorso."""
+
+    # distanza dal percorso
+    distance_km: float
+    # km dall'inizio del percorso al punto più vicino all'impianto
+    route_km: float
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[Point]:
+    """Decodifica una polilinea nel formato Google Encoded Polyline."""
+    factor = 10 ** precision
+    points: List[Point] = []
+    index = lat = lon = 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                if index >= length:
+                    raise ValueError("Polilinea codificata troncata")
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append((lat / factor, lon / factor))
+    return points
+
+
+def parse_route(value: Any) -> List[Point]:
+    """Punti del percorso da una polilinea codificata o da una lista di coordinate."""
+    if isinstance(value, str):
+        points = decode_polyline(value.strip())
+    else:
+        points = []
+        for item in value or []:
+            if isinstance(item, dict):
+                coords = find_coordinates(item)
+            elif isinstance(item, (list, tuple)) and len(item) >= 2:
+                coords = (float(item[0]), float(item[1]))
+            else:
+                coords = None
+            if coords is None:
+                raise ValueError(f"Punto del percorso non valido: {item!r}")
+            points.append(coords)
+    for lat, lon in points:
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f"Coordinate fuori intervallo: {lat}, {lon}")
+    if len(points) < 2:
+        raise ValueError("Il percorso deve avere almeno due punti")
+    return points
+
+
+def _segment_distance(lat: float, lon: float, a: Point, b: Point, length_km: float) -> Tuple[float, float]:
+    """Distanza (km) del punto dal segmento a-b e km lungo il segmento del punto più vicino.
+
+    Proiezione equirettangolare locale: a queste distanze l'errore è trascurabile.
+    """
+    scale = math.cos(math.radians((a[0] + b[0]) / 2)) * KM_PER_DEG
+    ax, ay = 0.0, 0.0
+    bx, by = (b[1] - a[1]) * scale, (b[0] - a[0]) * KM_PER_DEG
+    px, py = (lon - a[1]) * scale, (lat - a[0]) * KM_PER_DEG
+    dx, dy = bx - ax, by - ay
+    seg2 = dx * dx + dy * dy
+    t = 0.0 if seg2 == 0 else max(0.0, min(1.0, (px * dx + py * dy) / seg2))
+    cx, cy = t * dx, t * dy
+    return math.hypot(px - cx, py - cy), t * length_km
+
+
+def _pieces(points: Sequence[Point], max_km: float) -> Iterator[Tuple[Point, Point, float]]:
+    """Segmenti del percorso, spezzando i più lunghi di `max_km`: un segmento lungo e
+    obliquo avrebbe un riquadro enorme rispetto alla fascia attorno al percorso."""
+    for a, b in zip(points, points[1:]):
+        length = haversine_km(*a, *b)
+        parts = max(1, math.ceil(length / max_km))
+        for i in range(parts):
+            start = (a[0] + (b[0] - a[0]) * i / parts, a[1] + (b[1] - a[1]) * i / parts)
+            end = (a[0] + (b[0] - a[0]) * (i + 1) / parts, a[1] + (b[1] - a[1]) * (i + 1) / parts)
+            yield start, end, length / parts
+
+
+def stations_along_route(index: SpatialIndex, points: Sequence[Point], buffer_km: float) -> Dict[int, RouteMatch]:
+    """Impianti dell'indice entro `buffer_km` dal percorso, con distanza e progressiva."""
+    found: Dict[int, RouteMatch] = {}
+    lat_pad = buffer_km / KM_PER_DEG
+    travelled = 0.0
+    for a, b, length in _pieces(points, max(4 * buffer_km, MIN_PIECE_KM)):
+        cos_lat = max(math.cos(math.radians(max(abs(a[0]), abs(b[0])) + lat_pad)), 1e-6)
+        lon_pad = lat_pad / cos_lat
+        for key, lat, lon in index.in_bbox(
+            min(a[0], b[0]) - lat_pad,
+            min(a[1], b[1]) - lon_pad,
+            max(a[0], b[0]) + lat_pad,
+            max(a[1], b[1]) + lon_pad,
+        ):
+            distance, along = _segment_distance(lat, lon, a, b, length)
+            if distance > buffer_km:
+                continue
+            previous = found.get(key)
+            if previous is None or distance < previous.distance_km:
+                found[key] = RouteMatch(distance, travelled + along)
+        travelled += length
+    return found
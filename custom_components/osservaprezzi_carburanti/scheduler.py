@@ -0,0 +1,270 @@
+"""Scheduler centrale degli aggiornamenti per l'integrazione Osservaprezzi Carburanti.
+
+Un solo scheduler per processo gestisce sia l'intervallo `scan_interval` di ogni
+impianto sia l'aggiornamento giornaliero delle 08:30. Gli aggiornamenti sono
+distribuiti con un jitter su una finestra configurabile e limitati da un tetto di
+concorrenza, così da non colpire l'API MIMIT con tutte le richieste nello stesso secondo.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_point_in_utc_time, async_track_time_change
+from homeassistant.helpers.update_coordinator import UpdateFailed
+from homeassistant.util import dt as dt_util
+
+from .batch import BatchRefreshEngine, BatchRefreshResult
+from .const import (
+    DAILY_REFRESH_TIME,
+    DEFAULT_REFRESH_CONCURRENCY,
+    DEFAULT_REFRESH_WINDOW,
+)
+
+if TYPE_CHECKING:
+    from .coordinator import CoordinatorRegistry, StationDataUpdateCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+# Gli impianti in scadenza entro questo margine partono con lo stesso timer
+DUE_GRACE = timedelta(seconds=1)
+
+
+async def async_batch_refresh(
+        engine: BatchRefreshEngine,
+        coordinators: List["StationDataUpdateCoordinator"],
+) -> BatchRefreshResult:
+    """Esegue un ciclo batch e distribuisce i risultati ai coordinator dei singoli impianti."""
+    known = {c.station_id: c.data for c in coordinators if c.data}
+    result = await engine.async_refresh([c.station_id for c in coordinators], known)
+    for coordinator in coordinators:
+        if coordinator.station_id in result.data:
+            coordinator.async_set_updated_data(result.data[coordinator.station_id])
+        elif coordinator.station_id in result.errors:
+            coordinator.async_set_update_error(UpdateFailed(result.errors[coordinator.station_id]))
+    _LOGGER.debug(
+        "Ciclo batch completato: %s impianti con %s richieste", len(coordinators), result.total_requests
+    )
+    return result
+
+
+class RefreshScheduler:
+    """Pianifica gli aggiornamenti di tutti i coordinator del registro."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        registry: "CoordinatorRegistry",
+        window: int = DEFAULT_REFRESH_WINDOW,
+        concurrency: int = DEFAULT_REFRESH_CONCURRENCY,
+    ) -> None:
+        self.hass = hass
+        self.registry = registry
+        self.window = window
+        self.concurrency = max(1, concurrency)
+        self.engine = BatchRefreshEngine(registry.api)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._due: Dict[int, datetime] = {}
+        self._queued: Set[int] = set()
+        self._running: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._unsub_timer: Optional[Callable[[], None]] = None
+        self._unsub_daily: Optional[Callable[[], None]] = None
+        self._unsub_stop: Optional[Callable[[], None]] = None
+        self._cycle_started: Optional[float] = None
+        self.last_cycle_duration: Optional[float] = None
+        self.last_cycle_end: Optional[datetime] = None
+        self.last_cycle_stations = 0
+        self.cycles = 0
+
+    def configure(self, window: Optional[int] = None, concurrency: Optional[int] = None) -> None:
+        """Aggiorna finestra di distribuzione e concorrenza (da YAML)."""
+        if window is not None:
+            self.window = max(0, int(window))
+        if concurrency is not None:
+            self.concurrency = max(1, int(concurrency))
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    @property
+    def queue_depth(self) -> int:
+        """Impianti in scadenza che attendono uno slot di concorrenza."""
+        return len(self._queued)
+
+    @callback
+    def async_start(self) -> None:
+        if self._unsub_daily is not None:
+            return
+        hour, minute = DAILY_REFRESH_TIME
+        self._unsub_daily = async_track_time_change(
+            self.hass, self._async_daily_slot, hour=hour, minute=minute, second=0
+        )
+        self._unsub_stop = self.hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_on_stop)
+
+    @callback
+    def async_stop(self) -> None:
+        """Cancella timer, listener e aggiornamenti in corso."""
+        for unsub in (self._unsub_timer, self._unsub_daily, self._unsub_stop):
+            if unsub:
+                unsub()
+        self._unsub_timer = self._unsub_daily = self._unsub_stop = None
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        self._due.clear()
+        self._queued.clear()
+        self._running.clear()
+
+    @callback
+    def _async_on_stop(self, event) -> None:
+        # il listener one-shot è già stato consumato dall'evento
+        self._unsub_stop = None
+        self.async_stop()
+
+    @callback
+    def async_track(self, station_id: int) -> None:
+        """Inserisce un impianto nella pianificazione con un jitter iniziale."""
+        if station_id in self._due:
+            return
+        self.async_start()
+        self._schedule_next(station_id, dt_util.utcnow(), spread=self.window)
+
+    @callback
+    def async_expedite(self, station_id: int, spread: float = 0) -> None:
+        """Anticipa il prossimo aggiornamento di un impianto (entro `spread` secondi)."""
+        if station_id not in self._due or station_id in self._queued or station_id in self._running:
+            return
+        due = dt_util.utcnow() + timedelta(seconds=random.uniform(0, spread) if spread else 0)
+        if due < self._due[station_id]:
+            self._due[station_id] = due
+            self._async_arm()
+
+    @callback
+    def async_untrack(self, station_id: int) -> None:
+        self._due.pop(station_id, None)
+        self._queued.discard(station_id)
+        if not self._due:
+            self.async_stop()
+        else:
+            self._async_arm()
+
+    @callback
+    def _schedule_next(self, station_id: int, now: datetime, spread: float = 0) -> None:
+        interval = self.registry.next_interval(station_id, now)
+        jitter = random.uniform(0, spread) if spread else 0
+        self._due[station_id] = now + timedelta(seconds=interval + jitter)
+        self._async_arm()
+
+    @callback
+    def _async_arm(self) -> None:
+        if self._unsub_timer:
+            self._unsub_timer()
+            self._unsub_timer = None
+        waiting = [t for sid, t in self._due.items() if sid not in self._queued and sid not in self._running]
+        if waiting:
+            self._unsub_timer = async_track_point_in_utc_time(self.hass, self._async_fire, min(waiting))
+
+    @callback
+    def _async_daily_slot(self, now: datetime) -> None:
+        """Alle 08:30 tutti gli impianti scadono, distribuiti sulla finestra."""
+        _LOGGER.debug("Aggiornamento programmato delle 08:30 per %s impianti", len(self._due))
+        utcnow = dt_util.utcnow()
+        for station_id in self._due:
+            self._due[station_id] = utcnow + timedelta(seconds=random.uniform(0, self.window))
+        self._async_arm()
+
+    @callback
+    def _async_fire(self, now: datetime) -> None:
+        self._unsub_timer = None
+        limit = now + DUE_GRACE
+        due = [
+            sid for sid, t in self._due.items()
+            if t <= limit and sid not in self._queued and sid not in self._running
+        ]
+        batch = [sid for sid in due if self.registry.is_batch(sid)]
+        if batch:
+            # gli impianti batch in scadenza entro la finestra partono insieme in un'unica ricerca
+            horizon = now + timedelta(seconds=self.window)
+            batch += [
+                sid for sid, t in self._due.items()
+                if sid not in due and t <= horizon and self.registry.is_batch(sid)
+                and sid not in self._queued and sid not in self._running
+            ]
+            self._spawn(batch, self._async_refresh_batch(batch))
+        for sid in due:
+            if sid not in batch:
+                self._spawn([sid], self._async_refresh_station(sid))
+        self._async_arm()
+
+    def _spawn(self, station_ids: List[int], coro) -> None:
+        if self._cycle_started is None:
+            self._cycle_started = time.monotonic()
+        self._queued.update(station_ids)
+        task = self.hass.async_create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _async_refresh_station(self, station_id: int) -> None:
+        async with self._semaphore:
+            self._queued.discard(station_id)
+            coordinator = self.registry.get(station_id)
+            if coordinator is None:
+                # impianto rilasciato nel frattempo: il ciclo va comunque chiuso
+                self._async_done([station_id])
+                return
+            self._running.add(station_id)
+            try:
+                await coordinator.async_refresh()
+            finally:
+                self._async_done([station_id])
+
+    async def _async_refresh_batch(self, station_ids: List[int]) -> None:
+        async with self._semaphore:
+            self._queued.difference_update(station_ids)
+            coordinators = [c for c in (self.registry.get(sid) for sid in station_ids) if c is not None]
+            self._running.update(station_ids)
+            try:
+                if coordinators:
+                    await async_batch_refresh(self.engine, coordinators)
+                    self.registry.logo_loader.async_ensure()
+            finally:
+                self._async_done(station_ids)
+
+    @callback
+    def _async_done(self, station_ids: List[int]) -> None:
+        now = dt_util.utcnow()
+        for sid in station_ids:
+            self._running.discard(sid)
+            if sid in self._due:
+                self._schedule_next(sid, now)
+        self.last_cycle_stations += len(station_ids)
+        if not self._queued and not self._running and self._cycle_started is not None:
+            self.last_cycle_duration = round(time.monotonic() - self._cycle_started, 3)
+            self.last_cycle_end = now
+            self._cycle_started = None
+            self.cycles += 1
+            _LOGGER.debug(
+                "Ciclo di aggiornamento completato: %s impianti in %.1fs",
+                self.last_cycle_stations, self.last_cycle_duration,
+            )
+            self.last_cycle_stations = 0
+        self._async_arm()
+
+    def diagnostics(self) -> Dict[str, Any]:
+        next_due = min(self._due.values()) if self._due else None
+        return {
+            "tracked_stations": len(self._due),
+            "queue_depth": self.queue_depth,
+            "running": len(self._running),
+            "window": self.window,
+            "concurrency": self.concurrency,
+            "cycles": self.cycles,
+            "last_cycle_duration": self.last_cycle_duration,
+            "last_cycle_end": self.last_cycle_end.isoformat() if self.last_cycle_end else None,
+            "next_due": next_due.isoformat() if next_due else None,
+        }
@@ -2,12 +2,13 @@
 
 Questo modulo crea sensori per ogni impianto e per tipo di carburante usando
 DataUpdateCoordinator per gestire il polling e la memorizzazione dei dati.
+I sensori non fanno polling: ricevono gli aggiornamenti dal coordinator e
+scrivono lo stato solo quando valore o attributi cambiano.
 """
 from __future__ import annotations
 
 import logging
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 from homeassistant.components.sensor import (
     SensorEntity,
@@ -15,117 +16,86 @@ from homeassistant.components.sensor import (
     SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import ATTR_ATTRIBUTION, CONF_NAME
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.const import ATTR_ATTRIBUTION, ATTR_LATITUDE, ATTR_LONGITUDE, CONF_NAME
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.event import async_track_state_change_event
 from homeassistant.helpers.typing import StateType
-from homeassistant.helpers.update_coordinator import (
-    DataUpdateCoordinator,
-    UpdateFailed,
-)
-from homeassistant.helpers.event import async_track_time_change
 
-from .api import OsservaprezziAPI
 from .const import (
-    BRAND_LOGOS,
-    DATA_COORDINATORS,
+    CONF_ADAPTIVE,
+    CONF_CHEAPEST_NEARBY,
+    CONF_FUEL_RANKINGS,
+    CONF_INCLUDE_RAW,
+    CONF_REFRESH_MODE,
+    CONF_SETUP_CONCURRENCY,
+    DEFAULT_ADAPTIVE,
     DEFAULT_ICON,
+    DEFAULT_INCLUDE_RAW,
+    DEFAULT_NEARBY_RADIUS_KM,
+    DEFAULT_RANKING_SIZE,
+    DEFAULT_REFRESH_MODE,
     DEFAULT_SCAN_INTERVAL,
+    DEFAULT_SETUP_CONCURRENCY,
     DOMAIN,
-    scan_interval_td,
 )
-from .helpers import find_coordinates
+from .coordinator import (
+    YAML_OWNER,
+    CoordinatorRegistry,
+    StationDataUpdateCoordinator,
+    async_get_registry,
+    entry_stations,
+)
+from .entity import EntityReconciler, OpeningHoursEntity, OsservaprezziEntity
+from .helpers import async_run_bounded, normalize_name
+from .nearby import CheapestNearby
+from .ranking import PriceRanking
+from .snapshot import FuelKey
 
 _LOGGER = logging.getLogger(__name__)
 
-DATA_LOGOS = f"{DOMAIN}_logos"
-
-
-def _normalize(text: Optional[str]) -> str:
-    if not text:
-        return "unknown"
-    return "".join(c if c.isalnum() else "_" for c in text.lower())
-
-
-def _format_address(data: Dict[str, Any]) -> str:
-    # Tenta di estrarre un indirizzo leggibile e ben formattato
-    # Es. "Via Roma 10, 20100 Milano (MI)"
-    
-    # 1. Via e Civico
-    street = data.get("indirizzo") or data.get("address") or data.get("street") or ""
-    civic = data.get("civic") or ""
-    
-    address_part = street
-    if civic:
-        address_part = f"{street} {civic}" if street else civic
-
-    # 2. CAP, Comune, Provincia
-    zip_code = data.get("zip") or data.get("cap") or ""
-    town = data.get("city") or data.get("municipality") or data.get("comune") or ""
-    province = data.get("prov") or data.get("province") or data.get("provincia") or ""
-
-    location_part = ""
-    if zip_code:
-        location_part += f"{zip_code} "
-    if town:
-        location_part += town
-    if province:
-        location_part += f" ({province})"
-
-    # Combine
-    parts = [p.strip() for p in (address_part, location_part) if p.strip()]
-    if parts:
-        return ", ".join(parts)
-        
-    return data.get("name") or data.get("description") or ""
 
+async def _async_first_refresh(coordinator: StationDataUpdateCoordinator) -> None:
+    # Coordinator condiviso: se un'altra entry (o YAML) lo ha già aggiornato non serve un nuovo fetch
+    if coordinator.data is None:
+        await coordinator.async_refresh()
+        if not coordinator.last_update_success:
+            _LOGGER.warning("Refresh iniziale fallito per l'impianto %s", coordinator.station_id)
 
-class StationDataUpdateCoordinator(DataUpdateCoordinator):
-    """Coordinator per ottenere i dati dell'impianto dall'API Osservaprezzi."""
 
-    def __init__(self, hass: HomeAssistant, api: OsservaprezziAPI, station_id: int, scan_interval: int):
-        self.api = api
-        self.station_id = station_id
-        super().__init__(
-            hass,
-            _LOGGER,
-            name=f"osservaprezzi_{station_id}",
-            update_interval=scan_interval_td(scan_interval),
-        )
-        
-        # Se l'intervallo è circa 1 giorno (default daily), forziamo l'aggiornamento alle 08:30
-        # Questo per rispettare la richiesta di "Scheduled Updates: ... default is daily at 08:30"
-        # Se l'utente ha impostato 3600s, questo refresh delle 08:30 sarà solo un "di più", male non fa.
-        async_track_time_change(hass, self._async_scheduled_update, hour=8, minute=30, second=0)
-
-    async def _async_scheduled_update(self, now):
-        """Force update at scheduled time."""
-        _LOGGER.debug("Esecuzione aggiornamento programmato delle 08:30")
-        await self.async_request_refresh()
-
-    async def _async_update_data(self) -> Dict[str, Any]:
-        """Recupera i dati dall'API e ritorna il JSON."""
-        try:
-            # Fetch station data
-            data = await self.api.get_station_details(self.station_id)
-            
-            # Ensure logos are loaded (once per session ideally, or refreshed if missing)
-            if DATA_LOGOS not in self.hass.data:
-                 self.hass.data[DATA_LOGOS] = {}
-            
-            # If the loaded logos map is empty, try fetching.
-            # We don't want to block every update if it fails, but we try initially.
-            if not self.hass.data.get(DATA_LOGOS):
-                 logos = await self.api.get_all_logos()
-                 if logos:
-                     self.hass.data[DATA_LOGOS] = logos
+def _log_setup_failures(stations: List[Dict[str, Any]], results: List[Any]) -> int:
+    """Registra gli impianti il cui setup è fallito; ritorna quanti sono."""
+    failures = 0
+    for station, result in zip(stations, results):
+        if isinstance(result, BaseException):
+            failures += 1
+            _LOGGER.error(
+                "Setup dei sensori fallito per l'impianto %s",
+                station.get("id"),
+                exc_info=(type(result), result, result.__traceback__),
+            )
+    return failures
+
+
+@callback
+def _async_track_fuels(
+        hass: HomeAssistant,
+        coordinator: StationDataUpdateCoordinator,
+        station_cfg: Dict[str, Any],
+        entry_id: str | None,
+        include_raw: bool,
+        async_add_entities,
+) -> Callable[[], None]:
+    """Sensori carburante allineati a ogni aggiornamento ai carburanti `(nome, self)` dell'impianto."""
 
-            _LOGGER.debug("Fetched data for %s: %s", self.station_id, data.keys())
-            return data
-        except Exception as err:
-            _LOGGER.exception("Errore recupero dati per impianto %s: %s", self.station_id, err)
-            raise UpdateFailed(err)
+    def _create(key: FuelKey) -> SensorEntity:
+        fuel = coordinator.snapshot.fuels[key]
+        return FuelPriceSensor(coordinator, station_cfg, fuel.name, fuel.is_self, entry_id, include_raw)
+
+    return EntityReconciler(
+        hass, coordinator, lambda c: c.snapshot.fuels.keys(), _create, async_add_entities
+    ).async_start()
 
 
 async def async_setup_platform(
@@ -138,121 +108,112 @@ async def async_setup_platform(
     yaml = hass.data.get(DOMAIN, {}).get("yaml_config", {}) or {}
     stations = yaml.get("stations", [])
     scan_interval = yaml.get("scan_interval", DEFAULT_SCAN_INTERVAL)
+    mode = yaml.get(CONF_REFRESH_MODE, DEFAULT_REFRESH_MODE)
+    adaptive = bool(yaml.get(CONF_ADAPTIVE, DEFAULT_ADAPTIVE))
+    include_raw = bool(yaml.get(CONF_INCLUDE_RAW, DEFAULT_INCLUDE_RAW))
+    concurrency = int(yaml.get(CONF_SETUP_CONCURRENCY, DEFAULT_SETUP_CONCURRENCY))
 
-    hass.data.setdefault(DATA_COORDINATORS, {})
-    session = async_get_clientsession(hass)
-    api = OsservaprezziAPI(session)
-
-    entities: List[SensorEntity] = []
+    registry = async_get_registry(hass)
 
-    for station in stations:
-        station_id = station.get("id")
-        if station_id is None:
-            continue
+    async def _async_setup_station(station: Dict[str, Any]) -> None:
         try:
-            station_id_int = int(station_id)
+            station_id_int = int(station.get("id"))
         except (TypeError, ValueError):
-            continue
-
-        coordinator = StationDataUpdateCoordinator(hass, api, station_id_int, scan_interval)
-        hass.data[DATA_COORDINATORS][station_id_int] = coordinator
-
-        await coordinator.async_request_refresh()
+            return
 
-        data = coordinator.data or {}
-        entities.append(StationMetaSensor(coordinator, station))
+        coordinator = registry.acquire(station_id_int, YAML_OWNER, scan_interval, mode, adaptive)
+        await _async_first_refresh(coordinator)
 
-        fuels = data.get("fuels") or data.get("carburanti") or []
-        if not isinstance(fuels, list):
-            fuels = []
+        # entità aggiunte appena i dati dell'impianto sono arrivati, senza attendere gli altri
+        async_add_entities([StationMetaSensor(coordinator, station, include_raw=include_raw)])
+        _async_track_fuels(hass, coordinator, station, None, include_raw, async_add_entities)
 
-        if fuels:
-            for fuel in fuels:
-                name = fuel.get("name") or fuel.get("fuel") or fuel.get("description")
-                is_self = bool(fuel.get("isSelf") or fuel.get("is_self") or False)
-                entities.append(FuelPriceSensor(coordinator, station, name, is_self))
-        else:
-            entities.append(FuelPriceSensor(coordinator, station, None, True))
+    _log_setup_failures(stations, await async_run_bounded(stations, _async_setup_station, concurrency))
 
-    if entities:
-        async_add_entities(entities, True)
+    extra: List[SensorEntity] = [
+        CheapestNearbySensor(
+            registry,
+            item["entity_id"],
+            item["fuel"],
+            bool(item.get("is_self", True)),
+            float(item.get("radius_km", DEFAULT_NEARBY_RADIUS_KM)),
+            item.get(CONF_NAME),
+        )
+        for item in yaml.get(CONF_CHEAPEST_NEARBY, [])
+        if item.get("entity_id") and item.get("fuel")
+    ]
+    extra.extend(
+        FuelRankingSensor(
+            registry,
+            item["fuel"],
+            bool(item.get("is_self", True)),
+            int(item.get("top", DEFAULT_RANKING_SIZE)),
+            item.get(CONF_NAME),
+        )
+        for item in yaml.get(CONF_FUEL_RANKINGS, [])
+        if item.get("fuel")
+    )
+    if extra:
+        async_add_entities(extra)
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities) -> None:
     """Configura i sensori per una config entry."""
     data = entry.data or {}
-    stations = data.get("stations")
-    scan_interval = data.get("scan_interval") or DEFAULT_SCAN_INTERVAL
-
-    if not stations:
-        station_id = data.get("station_id") or data.get("id")
-        if station_id is None:
-            return
-        stations = [{"id": int(station_id), "name": data.get("name") or ""}]
-
-    hass.data.setdefault(DATA_COORDINATORS, {})
-    session = async_get_clientsession(hass)
-    api = OsservaprezziAPI(session)
-
-    entities: List[SensorEntity] = []
+    include_raw = bool(data.get(CONF_INCLUDE_RAW, DEFAULT_INCLUDE_RAW))
+    yaml = hass.data.get(DOMAIN, {}).get("yaml_config", {}) or {}
+    concurrency = int(data.get(CONF_SETUP_CONCURRENCY) or yaml.get(CONF_SETUP_CONCURRENCY) or DEFAULT_SETUP_CONCURRENCY)
 
-    for st in stations:
-        try:
-            station_id_int = int(st.get("id"))
-        except (TypeError, ValueError):
-            continue
+    # I coordinator sono acquisiti dal registro in __init__.async_setup_entry
+    registry = async_get_registry(hass)
 
-        coordinator = StationDataUpdateCoordinator(hass, api, station_id_int, scan_interval)
-        hass.data[DATA_COORDINATORS][(entry.entry_id, station_id_int)] = coordinator
+    async def _async_setup_station(st: Dict[str, Any]) -> None:
+        coordinator = registry.get(st["id"])
+        if coordinator is None:
+            return
+        await _async_first_refresh(coordinator)
 
-        try:
-            await coordinator.async_config_entry_first_refresh()
-        except Exception as err:
-            _LOGGER.warning("Refresh iniziale fallito per l'impianto %s: %s", station_id_int, err)
-
-        entities.append(StationMetaSensor(coordinator, {"id": station_id_int, "name": st.get("name")}, entry.entry_id))
-
-        fuels = coordinator.data.get("fuels") or coordinator.data.get("carburanti") or []
-        if isinstance(fuels, list) and fuels:
-            for fuel in fuels:
-                fname = fuel.get("name") or fuel.get("fuel") or fuel.get("description")
-                is_self = bool(fuel.get("isSelf") or fuel.get("is_self") or False)
-                entities.append(FuelPriceSensor(coordinator, {"id": station_id_int, "name": st.get("name")}, fname, is_self, entry.entry_id))
-        else:
-            entities.append(FuelPriceSensor(coordinator, {"id": station_id_int, "name": st.get("name")}, None, True, entry.entry_id))
+        station_cfg = {"id": st["id"], "name": st.get("name")}
+        entities: List[SensorEntity] = [StationMetaSensor(coordinator, station_cfg, entry.entry_id, include_raw)]
 
         # Nuovi sensori aggiuntivi
-        entities.append(StationLocationSensor(coordinator, {"id": station_id_int, "name": st.get("name")}, entry.entry_id))
-        entities.append(StationOpeningStatusSensor(coordinator, {"id": station_id_int, "name": st.get("name")}, entry.entry_id))
-        
-        # Sensori contatti se disponibili nel dato (ma qui siamo in setup, potremmo non averli ancora se il refresh fallisce)
-        # Tuttavia il refresh è già stato tentato sopra.
+        entities.append(StationLocationSensor(coordinator, station_cfg, entry.entry_id))
+        entities.append(StationOpeningStatusSensor(coordinator, station_cfg, entry.entry_id))
+
         # Creiamo i sensori contatti genericamente, gestiranno loro se i dati mancano
         for contact_type in ["phone", "email", "website"]:
-             entities.append(StationContactSensor(coordinator, {"id": station_id_int, "name": st.get("name")}, contact_type, entry.entry_id))
-
-    if entities:
-        async_add_entities(entities, True)
+            entities.append(StationContactSensor(coordinator, station_cfg, contact_type, entry.entry_id))
 
+        # entità aggiunte appena i dati dell'impianto sono arrivati, senza attendere gli altri
+        async_add_entities(entities)
+        # carburanti aggiunti o tolti in seguito: solo le entità interessate, senza ricaricare la entry
+        entry.async_on_unload(
+            _async_track_fuels(hass, coordinator, station_cfg, entry.entry_id, include_raw, async_add_entities)
+        )
 
-async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    """Unload sensors for a config entry."""
-    coordinators = hass.data.get(DATA_COORDINATORS, {})
-    to_remove = [k for k in coordinators.keys() if isinstance(k, tuple) and k[0] == entry.entry_id]
-    for k in to_remove:
-        coordinators.pop(k, None)
-    return True
+    stations = entry_stations(data)
+    failures = _log_setup_failures(stations, await async_run_bounded(stations, _async_setup_station, concurrency))
+    if stations and failures == len(stations):
+        raise ConfigEntryNotReady(f"Setup dei sensori fallito per tutti i {failures} impianti")
 
 
-class StationMetaSensor(SensorEntity):
+class StationMetaSensor(OsservaprezziEntity, SensorEntity):
     """Sensore che espone i metadati dell'impianto come attributi."""
 
     _attr_icon = DEFAULT_ICON
+    _unrecorded_attributes = frozenset({"raw", "brand_logo", "cached_since"})
 
-    def __init__(self, coordinator: StationDataUpdateCoordinator, station_cfg: Dict[str, Any], entry_id: str | None = None):
-        self.coordinator = coordinator
+    def __init__(
+        self,
+        coordinator: StationDataUpdateCoordinator,
+        station_cfg: Dict[str, Any],
+        entry_id: str | None = None,
+        include_raw: bool = DEFAULT_INCLUDE_RAW,
+    ):
+        super().__init__(coordinator)
         self.station_cfg = station_cfg
         self.entry_id = entry_id
+        self.include_raw = include_raw
         self.station_id = int(station_cfg.get("id"))
         configured_name = station_cfg.get("name")
         self._name = configured_name or f"Osservaprezzi {self.station_id}"
@@ -280,70 +241,31 @@ class StationMetaSensor(SensorEntity):
     def unique_id(self) -> str:
         return self._unique_id
 
-    @property
-    def available(self) -> bool:
-        return self.coordinator.last_update_success
-
     @property
     def native_value(self) -> StateType:
         return str(self.station_id)
 
     @property
     def extra_state_attributes(self) -> Dict[str, Any]:
-        data = self.coordinator.data or {}
+        snap = self.coordinator.snapshot
         attrs: Dict[str, Any] = {}
-        attrs["company"] = data.get("company") or data.get("gestore")
-        attrs["name"] = data.get("name") or data.get("description") or self._name
-        attrs["address"] = _format_address(data)
-        
-        brand = data.get("brand")
-        attrs["brand"] = brand
-        
-        # Gestione logo dinamico
-        # Gestione logo dinamico
-        brand_id = data.get("brandId")
-        logos = self.coordinator.hass.data.get(DATA_LOGOS, {})
-        
-        # 1. Try by Brand ID
-        if brand_id is not None and str(brand_id) in logos:
-            attrs["brand_logo"] = logos[str(brand_id)]
-        
-        # 2. Try by Brand Name (if not found by ID)
-        if "brand_logo" not in attrs and brand:
-            # Try exact match
-            if brand in logos:
-                attrs["brand_logo"] = logos[brand]
-            # Try lower match
-            elif brand.lower() in logos:
-                attrs["brand_logo"] = logos[brand.lower()]
-        
-        # 3. Fallback to local static assets if not found dynamically
-        if "brand_logo" not in attrs and brand:
-            key = str(brand).lower()
-            logo = BRAND_LOGOS.get(key) or BRAND_LOGOS.get(key.split()[0]) or BRAND_LOGOS.get("others")
-            if logo:
-                 attrs["brand_logo"] = f"/local/custom_components/{DOMAIN}/assets/brands/{logo}"
-
-        attrs["station_type"] = data.get("stationType") or "Sconosciuto"
-        
-        # Data inserimento (utile per capire quanto è aggiornato il dato lato Ministero)
-        insert_date = data.get("insertDate")
-        if insert_date:
-            try:
-                if isinstance(insert_date, str):
-                    dt = datetime.fromisoformat(insert_date.replace("Z", "+00:00"))
-                    attrs["insert_date"] = dt.isoformat()
-                else:
-                    attrs["insert_date"] = str(insert_date)
-            except Exception:
-                attrs["insert_date"] = str(insert_date)
-
-        attrs["raw"] = data
-        coords = find_coordinates(data)
-        if coords:
-            attrs["latitude"] = coords[0]
-            attrs["longitude"] = coords[1]
-
+        attrs["company"] = snap.company
+        attrs["name"] = snap.name or self._name
+        attrs["address"] = snap.address
+        attrs["brand"] = snap.brand
+        if snap.logo:
+            attrs["brand_logo"] = snap.logo
+        attrs["station_type"] = snap.station_type or "Sconosciuto"
+        if snap.insert_date:
+            attrs["insert_date"] = snap.insert_date
+
+        if self.include_raw:
+            attrs["raw"] = self.coordinator.data or {}
+        if snap.coordinates:
+            attrs["latitude"] = snap.coordinates[0]
+            attrs["longitude"] = snap.coordinates[1]
+
+        attrs.update(self._cache_attributes())
         if not self.available:
             attrs["error"] = "unavailable"
         return attrs
@@ -366,10 +288,11 @@ class StationMetaSensor(SensorEntity):
         )
 
 
-class FuelPriceSensor(SensorEntity):
+class FuelPriceSensor(OsservaprezziEntity, SensorEntity):
     """Sensor exposing price for a fuel at a station in self/servito mode."""
 
     _attr_icon = DEFAULT_ICON
+    _unrecorded_attributes = frozenset({"raw_fuel", "brand_logo", "cached_since"})
 
     def __init__(
         self,
@@ -378,16 +301,18 @@ class FuelPriceSensor(SensorEntity):
         fuel_name: Optional[str],
         is_self: bool,
         entry_id: str | None = None,
+        include_raw: bool = DEFAULT_INCLUDE_RAW,
     ) -> None:
-        self.coordinator = coordinator
+        super().__init__(coordinator)
         self.station_cfg = station_cfg
         self.entry_id = entry_id
+        self.include_raw = include_raw
         self.station_id = int(station_cfg.get("id"))
         self.configured_name = station_cfg.get("name")
         self.fuel_name = fuel_name or "unknown"
         self.is_self = is_self
         mode = "self" if is_self else "attended"
-        normalized = _normalize(self.fuel_name)
+        normalized = normalize_name(self.fuel_name)
         if entry_id:
             self._unique_id = f"{DOMAIN}_{entry_id}_{self.station_id}_{normalized}_{mode}"
         else:
@@ -421,26 +346,10 @@ class FuelPriceSensor(SensorEntity):
     def unique_id(self) -> str:
         return self._unique_id
 
-    @property
-    def available(self) -> bool:
-        return self.coordinator.last_update_success
-
     @property
     def native_value(self) -> StateType:
-        data = self.coordinator.data or {}
-        fuels = data.get("fuels") or data.get("carburanti") or []
-        if not fuels:
-            return None
-        for f in fuels:
-            candidate = f.get("name") or f.get("fuel") or f.get("description")
-            candidate_is_self = bool(f.get("isSelf") or f.get("is_self") or False)
-            if str(candidate).lower() == str(self.fuel_name).lower() and candidate_is_self == self.is_self:
-                price = f.get("price") or f.get("prezzo")
-                try:
-                    return float(price) if price is not None else None
-                except (TypeError, ValueError):
-                    return None
-        return None
+        fuel = self.coordinator.snapshot.fuel(self.fuel_name, self.is_self)
+        return fuel.price if fuel else None
 
     @property
     def unit_of_measurement(self) -> Optional[str]:
@@ -452,58 +361,27 @@ class FuelPriceSensor(SensorEntity):
 
     @property
     def extra_state_attributes(self) -> Dict[str, Any]:
-        data = self.coordinator.data or {}
-        fuels = data.get("fuels") or data.get("carburanti") or []
+        snap = self.coordinator.snapshot
         attrs: Dict[str, Any] = {}
         attrs["station_id"] = self.station_id
         attrs["fuel_name"] = self.fuel_name
         attrs["is_self"] = self.is_self
-        attrs["company"] = data.get("company") or data.get("gestore")
-        attrs["name"] = data.get("name") or data.get("description")
-        attrs["address"] = _format_address(data)
-
-        for f in fuels:
-            candidate = f.get("name") or f.get("fuel") or f.get("description")
-            candidate_is_self = bool(f.get("isSelf") or f.get("is_self") or False)
-            if (not self.fuel_name or str(candidate).lower() == str(self.fuel_name).lower()) and candidate_is_self == self.is_self:
-                attrs["raw_fuel"] = f
-                validity = f.get("validityDate") or f.get("validity_date")
-                if validity:
-                    try:
-                        if isinstance(validity, (int, float)):
-                            dt = datetime.fromtimestamp(int(validity) / 1000)
-                        else:
-                            dt = datetime.fromisoformat(str(validity))
-                        attrs["validity_date"] = dt.isoformat()
-                    except Exception:
-                        attrs["validity_date"] = str(validity)
-                break
-
-        # Logo: copy logic from Meta Sensor for consistency directly on fuel sensors too if desired,
-        # otherwise users usually check the meta sensor or we duplicate.
-        # Let's simple duplicate the logic to ensure the price card has the logo directly.
-        brand = data.get("brand")
-        brand_id = data.get("brandId")
-        logos = self.coordinator.hass.data.get(DATA_LOGOS, {})
-        
-        # 1. Try by Brand ID
-        if brand_id is not None and str(brand_id) in logos:
-            attrs["brand_logo"] = logos[str(brand_id)]
-            
-        # 2. Try by Brand Name
-        if "brand_logo" not in attrs and brand:
-            if brand in logos:
-                attrs["brand_logo"] = logos[brand]
-            elif brand.lower() in logos:
-                attrs["brand_logo"] = logos[brand.lower()]
-        
-        # 3. Fallback
-        if "brand_logo" not in attrs and brand:
-            key = str(brand).lower()
-            logo = BRAND_LOGOS.get(key) or BRAND_LOGOS.get(key.split()[0]) or BRAND_LOGOS.get("others")
-            if logo:
-                attrs["brand_logo"] = f"/local/custom_components/{DOMAIN}/assets/brands/{logo}"
-        
+        attrs["company"] = snap.company
+        attrs["name"] = snap.name
+        attrs["address"] = snap.address
+
+        fuel = snap.fuel(self.fuel_name, self.is_self)
+        if fuel:
+            if self.include_raw:
+                attrs["raw_fuel"] = dict(fuel.raw)
+            if fuel.validity_date:
+                attrs["validity_date"] = fuel.validity_date
+
+        # Logo anche sui sensori carburante, così la card del prezzo lo trova direttamente
+        if snap.logo:
+            attrs["brand_logo"] = snap.logo
+
+        attrs.update(self._cache_attributes())
         if not self.available:
             attrs["error"] = "unavailable"
         attrs[ATTR_ATTRIBUTION] = "Dati da Osservaprezzi (MIMIT)"
@@ -530,11 +408,11 @@ class FuelPriceSensor(SensorEntity):
         )
 
 
-class StationContactSensor(SensorEntity):
+class StationContactSensor(OsservaprezziEntity, SensorEntity):
     """Sensore per informazioni di contatto (Telefono, Email, Sito)."""
 
     def __init__(self, coordinator, station_cfg, contact_type, entry_id=None):
-        self.coordinator = coordinator
+        super().__init__(coordinator)
         self.station_cfg = station_cfg
         self.entry_id = entry_id
         self.station_id = int(station_cfg.get("id"))
@@ -596,13 +474,13 @@ class StationContactSensor(SensorEntity):
         )
 
 
-class StationLocationSensor(SensorEntity):
+class StationLocationSensor(OsservaprezziEntity, SensorEntity):
     """Sensore di posizione per la stazione."""
 
     _attr_icon = "mdi:map-marker"
 
     def __init__(self, coordinator, station_cfg, entry_id=None):
-        self.coordinator = coordinator
+        super().__init__(coordinator)
         self.station_cfg = station_cfg
         self.entry_id = entry_id
         self.station_id = int(station_cfg.get("id"))
@@ -631,9 +509,8 @@ class StationLocationSensor(SensorEntity):
 
     @property
     def extra_state_attributes(self):
-        data = self.coordinator.data or {}
         attrs = {}
-        coords = find_coordinates(data)
+        coords = self.coordinator.snapshot.coordinates
         if coords:
             attrs["latitude"] = coords[0]
             attrs["longitude"] = coords[1]
@@ -654,13 +531,14 @@ class StationLocationSensor(SensorEntity):
         )
 
 
-class StationOpeningStatusSensor(SensorEntity):
+class StationOpeningStatusSensor(OpeningHoursEntity, SensorEntity):
     """Sensore stato apertura (Aperto/Chiuso)."""
 
     _attr_icon = "mdi:clock-outline"
+    _unrecorded_attributes = frozenset({"orari", "orari_mimit"})
 
     def __init__(self, coordinator, station_cfg, entry_id=None):
-        self.coordinator = coordinator
+        super().__init__(coordinator)
         self.station_cfg = station_cfg
         self.entry_id = entry_id
         self.station_id = int(station_cfg.get("id"))
@@ -684,21 +562,24 @@ class StationOpeningStatusSensor(SensorEntity):
 
     @property
     def native_value(self):
-        # Logica semplificata: se abbiamo orari, potremmo calcolare.
-        # Per ora ritorniamo "N/D" se non implementiamo il calcolo complesso, 
-        # o un placeholder se l'utente vuole solo vedere i dati grezzi.
-        # L'utente ha chiesto "sensori per open/closed status e next opening/closing time".
-        # Senza una libreria di orari complessa, è difficile. 
-        # Esporremo "Dati Orari" e metteremo il JSON negli attributi per ora.
-        data = self.coordinator.data or {}
-        if data.get("orariapertura"):
-             return "Vedi Attributi"
-        return "Non disponibile"
+        is_open, _, _ = self._opening_state()
+        if is_open is None:
+            return "Non disponibile"
+        return "Aperto" if is_open else "Chiuso"
 
     @property
     def extra_state_attributes(self):
-        data = self.coordinator.data or {}
-        return {"orari": data.get("orariapertura")}
+        hours = self.opening_hours
+        if hours is None:
+            return {"orari_mimit": (self.coordinator.data or {}).get("orariapertura")}
+        _, next_opening, next_closing = self._opening_state()
+        return {
+            "next_opening": next_opening.isoformat() if next_opening else None,
+            "next_closing": next_closing.isoformat() if next_closing else None,
+            "always_open": hours.always_open,
+            "orari": hours.describe(),
+            "orari_mimit": (self.coordinator.data or {}).get("orariapertura"),
+        }
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -714,3 +595,193 @@ class StationOpeningStatusSensor(SensorEntity):
             manufacturer="Osservaprezzi / MIMIT",
         )
 
+
+class CheapestNearbySensor(SensorEntity):
+    """Prezzo più basso di un carburante entro un raggio da una zona o un device_tracker.
+
+    Usa i dati dei coordinator già presenti: un aggiornamento di prezzo tocca solo
+    l'impianto interessato, uno spostamento ricalcola i soli impianti nel raggio.
+    """
+
+    _attr_icon = "mdi:map-marker-radius"
+    _attr_native_unit_of_measurement = "€/l"
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_should_poll = False
+    _unrecorded_attributes = frozenset({"candidates"})
+
+    def __init__(
+        self,
+        registry: CoordinatorRegistry,
+        tracked_entity_id: str,
+        fuel_name: str,
+        is_self: bool,
+        radius_km: float,
+        name: Optional[str] = None,
+    ) -> None:
+        self.registry = registry
+        self.tracked_entity_id = tracked_entity_id
+        self.fuel_name = fuel_name
+        self.is_self = is_self
+        self.tracker = CheapestNearby(radius_km)
+        mode = "self" if is_self else "servito"
+        self._attr_name = name or f"{fuel_name} ({mode}) vicino a {tracked_entity_id}"
+        self._attr_unique_id = (
+            f"{DOMAIN}_nearby_{normalize_name(tracked_entity_id)}_{normalize_name(fuel_name)}_{mode}_{radius_km:g}"
+        )
+
+    async def async_added_to_hass(self) -> None:
+        for coordinator in self.registry.coordinators():
+            self._update_station(coordinator.station_id)
+        self._update_location()
+        self.async_on_remove(self.registry.async_add_station_listener(self._async_station_updated))
+        self.async_on_remove(
+            async_track_state_change_event(self.hass, [self.tracked_entity_id], self._async_location_changed)
+        )
+
+    def _update_station(self, station_id: int) -> bool:
+        coordinator = self.registry.get(station_id)
+        if coordinator is None:
+            return self.tracker.remove_station(station_id)
+        snap = coordinator.snapshot
+        fuel = snap.fuel(self.fuel_name, self.is_self)
+        return self.tracker.update_station(station_id, snap.coordinates, fuel.price if fuel else None)
+
+    def _update_location(self) -> bool:
+        state = self.hass.states.get(self.tracked_entity_id)
+        if state is None or ATTR_LATITUDE not in state.attributes or ATTR_LONGITUDE not in state.attributes:
+            return self.tracker.clear_location()
+        try:
+            return self.tracker.set_location(
+                float(state.attributes[ATTR_LATITUDE]), float(state.attributes[ATTR_LONGITUDE])
+            )
+        except (TypeError, ValueError):
+            return self.tracker.clear_location()
+
+    @callback
+    def _async_station_updated(self, station_id: int) -> None:
+        if self._update_station(station_id):
+            self.async_write_ha_state()
+
+    @callback
+    def _async_location_changed(self, event: Event) -> None:
+        if self._update_location():
+            self.async_write_ha_state()
+
+    @property
+    def native_value(self) -> StateType:
+        best = self.tracker.best
+        return best.price if best else None
+
+    @property
+    def extra_state_attributes(self) -> Dict[str, Any]:
+        attrs: Dict[str, Any] = {
+            "tracked_entity": self.tracked_entity_id,
+            "fuel_name": self.fuel_name,
+            "is_self": self.is_self,
+            "radius_km": self.tracker.radius_km,
+            "candidates": len(self.tracker.candidates),
+        }
+        best = self.tracker.best
+        if best is None:
+            return attrs
+        coordinator = self.registry.get(best.station_id)
+        snap = coordinator.snapshot if coordinator else None
+        attrs["station_id"] = best.station_id
+        attrs["distance_km"] = round(best.distance_km, 2)
+        if snap is not None:
+            attrs["station_name"] = snap.name
+            attrs["brand"] = snap.brand
+            attrs["address"] = snap.address
+            fuel = snap.fuel(self.fuel_name, self.is_self)
+            if fuel and fuel.validity_date:
+                attrs["validity_date"] = fuel.validity_date
+        return attrs
+
+
+class FuelRankingSensor(SensorEntity):
+    """Classifica di un carburante/modalità su tutti gli impianti configurati.
+
+    Lo stato è il prezzo minimo; ogni aggiornamento di un coordinator tocca solo
+    l'impianto interessato (`PriceRanking`), senza riscandire gli altri sensori.
+    """
+
+    _attr_icon = "mdi:podium"
+    _attr_native_unit_of_measurement = "€/l"
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_should_poll = False
+    _unrecorded_attributes = frozenset({"ranking"})
+
+    def __init__(
+        self,
+        registry: CoordinatorRegistry,
+        fuel_name: str,
+        is_self: bool,
+        size: int = DEFAULT_RANKING_SIZE,
+        name: Optional[str] = None,
+    ) -> None:
+        self.registry = registry
+        self.fuel_name = fuel_name
+        self.is_self = is_self
+        self.size = max(1, size)
+        self.ranking = PriceRanking()
+        mode = "self" if is_self else "servito"
+        self._attr_name = name or f"{fuel_name} ({mode}) più economico"
+        # carburante, modalità e dimensione (e nome, se dato) distinguono più classifiche
+        unique_id = f"{DOMAIN}_ranking_{normalize_name(fuel_name)}_{mode}_top{self.size}"
+        if name:
+            unique_id += f"_{normalize_name(name)}"
+        self._attr_unique_id = unique_id
+
+    async def async_added_to_hass(self) -> None:
+        for coordinator in self.registry.coordinators():
+            self._update_station(coordinator.station_id)
+        self.async_on_remove(self.registry.async_add_station_listener(self._async_station_updated))
+
+    def _update_station(self, station_id: int) -> bool:
+        coordinator = self.registry.get(station_id)
+        if coordinator is None:
+            return self.ranking.remove(station_id)
+        fuel = coordinator.snapshot.fuel(self.fuel_name, self.is_self)
+        return self.ranking.update(station_id, fuel.price if fuel else None)
+
+    @callback
+    def _async_station_updated(self, station_id: int) -> None:
+        if self._update_station(station_id):
+            self.async_write_ha_state()
+
+    @property
+    def native_value(self) -> StateType:
+        return self.ranking.minimum
+
+    @property
+    def extra_state_attributes(self) -> Dict[str, Any]:
+        ranking = self.ranking
+
+        def _round(value: Optional[float]) -> Optional[float]:
+            return round(value, 3) if value is not None else None
+
+        entries = []
+        for position, (price, station_id) in enumerate(ranking.top(self.size), start=1):
+            coordinator = self.registry.get(station_id)
+            snap = coordinator.snapshot if coordinator else None
+            entries.append(
+                {
+                    "position": position,
+                    "station_id": station_id,
+                    "station_name": snap.name if snap else None,
+                    "brand": snap.brand if snap else None,
+                    "address": snap.address if snap else None,
+                    "price": price,
+                }
+            )
+        return {
+            "fuel_name": self.fuel_name,
+            "is_self": self.is_self,
+            "stations": len(ranking),
+            "min": _round(ranking.minimum),
+            "max": _round(ranking.maximum),
+            "average": _round(ranking.average),
+            "median": _round(ranking.median),
+            "spread": _round(ranking.spread),
+            "ranking": entries,
+        }
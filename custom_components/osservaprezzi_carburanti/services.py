@@ -0,0 +1,135 @@
+"""Servizi dell'integrazione Osservaprezzi Carburanti."""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import voluptuous as vol
+
+from homeassistant.const import ATTR_ENTITY_ID, ATTR_LATITUDE, ATTR_LONGITUDE
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import ServiceValidationError
+import homeassistant.helpers.config_validation as cv
+
+from .const import DOMAIN, SERVICE_FIND_ALONG_ROUTE, SERVICE_FIND_STATIONS
+from .coordinator import CoordinatorRegistry, async_get_registry
+from .route import parse_route
+from .snapshot import FuelSnapshot, build_snapshot
+
+ATTR_RADIUS_KM = "radius_km"
+ATTR_COUNT = "count"
+ATTR_USE_OPENDATA = "use_opendata"
+ATTR_ROUTE = "route"
+ATTR_FUEL = "fuel"
+ATTR_IS_SELF = "is_self"
+ATTR_BUFFER_KM = "buffer_km"
+
+FIND_STATIONS_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_ENTITY_ID): cv.entity_id,
+        vol.Inclusive(ATTR_LATITUDE, "coordinates"): cv.latitude,
+        vol.Inclusive(ATTR_LONGITUDE, "coordinates"): cv.longitude,
+        vol.Optional(ATTR_RADIUS_KM): vol.All(vol.Coerce(float), vol.Range(min=0.1, max=500)),
+        vol.Optional(ATTR_COUNT, default=10): vol.All(vol.Coerce(int), vol.Range(min=1, max=500)),
+        vol.Optional(ATTR_USE_OPENDATA, default=True): cv.boolean,
+    }
+)
+
+FIND_ALONG_ROUTE_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_ROUTE): vol.Any(cv.string, list),
+        vol.Required(ATTR_FUEL): cv.string,
+        vol.Optional(ATTR_IS_SELF, default=True): cv.boolean,
+        vol.Optional(ATTR_BUFFER_KM, default=2.0): vol.All(vol.Coerce(float), vol.Range(min=0.1, max=50)),
+        vol.Optional(ATTR_COUNT, default=10): vol.All(vol.Coerce(int), vol.Range(min=1, max=500)),
+        vol.Optional(ATTR_USE_OPENDATA, default=True): cv.boolean,
+    }
+)
+
+
+def resolve_location(hass: HomeAssistant, data: Dict[str, Any]) -> Tuple[float, float]:
+    """Coordinate dal servizio: `latitude`/`longitude` oppure un'entità zone/device_tracker/person."""
+    if ATTR_LATITUDE in data:
+        return data[ATTR_LATITUDE], data[ATTR_LONGITUDE]
+    entity_id: Optional[str] = data.get(ATTR_ENTITY_ID)
+    state = hass.states.get(entity_id) if entity_id else hass.states.get("zone.home")
+    if state is None or ATTR_LATITUDE not in state.attributes or ATTR_LONGITUDE not in state.attributes:
+        raise ServiceValidationError(f"Nessuna posizione disponibile per {entity_id or 'zone.home'}")
+    return float(state.attributes[ATTR_LATITUDE]), float(state.attributes[ATTR_LONGITUDE])
+
+
+async def _async_find_stations(call: ServiceCall) -> ServiceResponse:
+    hass = call.hass
+    lat, lon = resolve_location(hass, call.data)
+    directory = await async_get_registry(hass).async_get_directory(call.data[ATTR_USE_OPENDATA])
+    count = call.data[ATTR_COUNT]
+    if ATTR_RADIUS_KM in call.data:
+        stations = directory.within(lat, lon, call.data[ATTR_RADIUS_KM], count)
+    else:
+        stations = directory.nearest(lat, lon, count)
+    return {"latitude": lat, "longitude": lon, "indexed": len(directory), "stations": stations}
+
+
+def _station_fuel(registry: CoordinatorRegistry, station_id: int, fuel: str, is_self: bool) -> Optional[FuelSnapshot]:
+    """Prezzo dal coordinator dell'impianto se configurato, altrimenti dagli open data."""
+    coordinator = registry.get(station_id)
+    if coordinator is not None and coordinator.data:
+        return coordinator.snapshot.fuel(fuel, is_self)
+    table = registry.opendata.table
+    if table is not None and station_id in table:
+        return build_snapshot(table.payload(station_id)).fuel(fuel, is_self)
+    return None
+
+
+async def _async_find_along_route(call: ServiceCall) -> ServiceResponse:
+    try:
+        points = parse_route(call.data[ATTR_ROUTE])
+    except (TypeError, ValueError) as err:
+        raise ServiceValidationError(f"Percorso non valido: {err}") from err
+    registry = async_get_registry(call.hass)
+    # la tabella open data già caricata, senza attendere un download (MIMIT lento o giù)
+    directory = await registry.async_get_directory(call.data[ATTR_USE_OPENDATA], wait=False)
+    fuel, is_self = call.data[ATTR_FUEL], call.data[ATTR_IS_SELF]
+
+    matches = directory.along_route(points, call.data[ATTR_BUFFER_KM])
+    ranked: List[Tuple[float, float, int, FuelSnapshot]] = []
+    for station_id, match in matches.items():
+        price = _station_fuel(registry, station_id, fuel, is_self)
+        if price is not None and price.price is not None:
+            ranked.append((price.price, match.route_km, station_id, price))
+    ranked.sort(key=lambda item: item[:3])
+
+    stations = []
+    for price, route_km, station_id, snap in ranked[: call.data[ATTR_COUNT]]:
+        item = directory.describe(station_id)
+        item["price"] = price
+        item["validity_date"] = snap.validity_date
+        item["distance_km"] = round(matches[station_id].distance_km, 3)
+        item["route_km"] = round(route_km, 1)
+        stations.append(item)
+    return {
+        "points": len(points),
+        "indexed": len(directory),
+        "near_route": len(matches),
+        "with_price": len(ranked),
+        "stations": stations,
+    }
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Registra i servizi del dominio (una sola volta)."""
+    if hass.services.has_service(DOMAIN, SERVICE_FIND_STATIONS):
+        return
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_FIND_STATIONS,
+        _async_find_stations,
+        schema=FIND_STATIONS_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_FIND_ALONG_ROUTE,
+        _async_find_along_route,
+        schema=FIND_ALONG_ROUTE_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
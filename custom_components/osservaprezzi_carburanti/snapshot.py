@@ -0,0 +1,173 @@
+"""Snapshot immutabile dei dati di un impianto.
+
+Il coordinator costruisce uno snapshot per ogni aggiornamento: carburanti indicizzati
+per `(nome normalizzato, self)`, date già convertite, indirizzo formattato e logo
+risolto. Le entità leggono da qui in O(1) invece di riscandire il payload a ogni
+accesso.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from .adaptive import MIMIT_TZ
+from .const import BRAND_LOGOS, DOMAIN
+from .helpers import find_coordinates, format_address, normalize_name
+from .hours import OpeningHours, compile_hours
+from .logos import LogoStore
+
+FuelKey = Tuple[str, bool]
+
+_EMPTY: Mapping[Any, Any] = MappingProxyType({})
+
+
+def _empty() -> Mapping[Any, Any]:
+    return _EMPTY
+
+
+@dataclass(frozen=True)
+class FuelSnapshot:
+    """Prezzo di un carburante in modalità self o servito."""
+
+    name: Optional[str]
+    is_self: bool
+    price: Optional[float]
+    validity_date: Optional[str]
+    raw: Mapping[str, Any] = field(default_factory=_empty, compare=False)
+
+
+@dataclass(frozen=True)
+class StationSnapshot:
+    """Dati di un impianto pronti per le entità."""
+
+    name: Optional[str] = None
+    company: Optional[str] = None
+    brand: Optional[str] = None
+    address: str = ""
+    station_type: Optional[str] = None
+    insert_date: Optional[str] = None
+    coordinates: Optional[Tuple[float, float]] = None
+    logo: Optional[str] = None
+    fuels: Mapping[FuelKey, FuelSnapshot] = field(default_factory=_empty)
+    # servizi: nome normalizzato -> nome come comunicato da MIMIT
+    services: Mapping[str, str] = field(default_factory=_empty)
+    # `orariapertura` compilati; None se non comunicati
+    opening_hours: Optional[OpeningHours] = field(default=None, compare=False)
+    raw: Mapping[str, Any] = field(default_factory=_empty, compare=False)
+
+    def fuel(self, name: Optional[str], is_self: bool) -> Optional[FuelSnapshot]:
+        return self.fuels.get((normalize_name(name), bool(is_self)))
+
+
+def fuel_key(fuel: Dict[str, Any]) -> FuelKey:
+    name = fuel.get("name") or fuel.get("fuel") or fuel.get("description")
+    return normalize_name(name), bool(fuel.get("isSelf") or fuel.get("is_self") or False)
+
+
+def _parse_price(fuel: Dict[str, Any]) -> Optional[float]:
+    price = fuel.get("price") or fuel.get("prezzo")
+    try:
+        return float(price) if price is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_validity(fuel: Dict[str, Any]) -> Optional[str]:
+    validity = fuel.get("validityDate") or fuel.get("validity_date")
+    if not validity:
+        return None
+    try:
+        if isinstance(validity, (int, float)):
+            # epoch in ms: ora di Roma con offset esplicito, indipendente dal fuso dell'host
+            dt = datetime.fromtimestamp(int(validity) / 1000, tz=MIMIT_TZ)
+        else:
+            dt = datetime.fromisoformat(str(validity))
+        return dt.isoformat()
+    except Exception:
+        return str(validity)
+
+
+def _parse_services(data: Dict[str, Any]) -> Dict[str, str]:
+    # lista di stringhe o di oggetti con `name`/`description`
+    services: Dict[str, str] = {}
+    raw = data.get("services") or []
+    if not isinstance(raw, list):
+        return services
+    for service in raw:
+        name = service if isinstance(service, str) else (
+            service.get("name") or service.get("description") if isinstance(service, dict) else None
+        )
+        if name:
+            services.setdefault(normalize_name(name), name)
+    return services
+
+
+def _parse_insert_date(data: Dict[str, Any]) -> Optional[str]:
+    # Data inserimento (utile per capire quanto è aggiornato il dato lato Ministero)
+    insert_date = data.get("insertDate")
+    if not insert_date:
+        return None
+    try:
+        if isinstance(insert_date, str):
+            return datetime.fromisoformat(insert_date.replace("Z", "+00:00")).isoformat()
+        return str(insert_date)
+    except Exception:
+        return str(insert_date)
+
+
+def resolve_logo(brand: Optional[str], brand_id: Any, logos: Optional[LogoStore]) -> Optional[str]:
+    """URL del logo del brand: per ID, poi per nome, infine asset statico locale."""
+    # 1./2. Logo MIMIT per ID o per nome, servito dalla view locale con URL basato sull'hash
+    logo = logos.lookup(brand_id, brand) if logos else None
+    if logo is not None:
+        return logo.url
+    if not brand:
+        return None
+    # 3. Fallback to local static assets if not found dynamically
+    key = str(brand).lower()
+    filename = BRAND_LOGOS.get(key) or BRAND_LOGOS.get(key.split()[0]) or BRAND_LOGOS.get("others")
+    if filename:
+        return f"/local/custom_components/{DOMAIN}/assets/brands/{filename}"
+    return None
+
+
+def build_snapshot(data: Optional[Dict[str, Any]], logos: Optional[LogoStore] = None) -> StationSnapshot:
+    """Costruisce lo snapshot di un impianto dal payload `servicearea/{id}`."""
+    if not data:
+        return StationSnapshot()
+
+    fuels: Dict[FuelKey, FuelSnapshot] = {}
+    raw_fuels = data.get("fuels") or data.get("carburanti") or []
+    if isinstance(raw_fuels, list):
+        for f in raw_fuels:
+            if not isinstance(f, dict):
+                continue
+            key = fuel_key(f)
+            # a parità di chiave vince la prima riga, come nella scansione lineare originale
+            if key in fuels:
+                continue
+            fuels[key] = FuelSnapshot(
+                name=f.get("name") or f.get("fuel") or f.get("description"),
+                is_self=key[1],
+                price=_parse_price(f),
+                validity_date=_parse_validity(f),
+                raw=f,
+            )
+
+    brand = data.get("brand")
+    return StationSnapshot(
+        name=data.get("name") or data.get("description"),
+        company=data.get("company") or data.get("gestore"),
+        brand=brand,
+        address=format_address(data),
+        station_type=data.get("stationType"),
+        insert_date=_parse_insert_date(data),
+        coordinates=find_coordinates(data),
+        logo=resolve_logo(brand, data.get("brandId"), logos),
+        fuels=MappingProxyType(fuels),
+        services=MappingProxyType(_parse_services(data)),
+        opening_hours=compile_hours(data.get("orariapertura")),
+        raw=data,
+    )
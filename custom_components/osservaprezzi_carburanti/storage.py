@@ -0,0 +1,322 @@
+"""Cache persistenti su disco per l'integrazione Osservaprezzi Carburanti.
+
+Basate su `homeassistant.helpers.storage.Store`: i dati sopravvivono ai riavvii e
+vengono aggiornati in background, senza bloccare l'avvio.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .api import OsservaprezziAPI
+from .const import (
+    AREA_CACHE_TTL,
+    AREA_SAVE_DELAY,
+    AREA_STORAGE_KEY,
+    DATA_LOGOS,
+    HISTORY_MAX_AGE,
+    HISTORY_SAVE_DELAY,
+    HISTORY_STORAGE_KEY,
+    LOGO_CACHE_TTL,
+    LOGO_STORAGE_KEY,
+    PAYLOAD_CACHE_MAX_AGE,
+    PAYLOAD_SAVE_DELAY,
+    PAYLOAD_STORAGE_KEY,
+    STORAGE_VERSION,
+)
+from .helpers import compact_payload
+from .history import PriceHistory
+from .logos import LogoStore
+
+_LOGGER = logging.getLogger(__name__)
+
+# Dopo un download fallito non si riprova prima di questo intervallo
+LOGO_RETRY_INTERVAL = timedelta(hours=1)
+
+
+class LogoLoader:
+    """Carica i loghi brand con una sola richiesta in volo e cache su disco con TTL.
+
+    All'avvio i loghi vengono letti dal disco (se presenti); il download di
+    `alllogos` avviene in background solo se la cache manca o è scaduta.
+    """
+
+    def __init__(self, hass: HomeAssistant, api: OsservaprezziAPI) -> None:
+        self.hass = hass
+        self.api = api
+        self._store: Store = Store(hass, STORAGE_VERSION, LOGO_STORAGE_KEY)
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[], None]] = []
+        self.fetched_at: Optional[datetime] = None
+        self._last_attempt: Optional[datetime] = None
+        self.downloads = 0
+
+    @callback
+    def async_add_listener(self, update_callback: Callable[[], None]) -> None:
+        """Richiamato quando arriva un nuovo set di loghi."""
+        self._listeners.append(update_callback)
+
+    @property
+    def is_stale(self) -> bool:
+        return self.fetched_at is None or dt_util.utcnow() - self.fetched_at > LOGO_CACHE_TTL
+
+    async def async_load(self) -> None:
+        """Legge la cache su disco e avvia un aggiornamento se manca o è scaduta."""
+        try:
+            stored: Optional[Dict[str, Any]] = await self._store.async_load()
+        except Exception as err:
+            _LOGGER.debug("Cache loghi illeggibile, verrà riscaricata: %s", err)
+            stored = None
+        if stored:
+            logos = LogoStore.from_dict(stored.get("logos"))
+            fetched_at = dt_util.parse_datetime(stored.get("fetched_at") or "")
+            if logos and not self.hass.data.get(DATA_LOGOS):
+                self.fetched_at = fetched_at
+                self._async_publish(logos)
+        self.async_ensure()
+
+    @callback
+    def async_ensure(self) -> Optional[asyncio.Task]:
+        """Avvia il download in background se serve; mai più di uno alla volta."""
+        if self._task is not None and not self._task.done():
+            return self._task
+        if self.hass.data.get(DATA_LOGOS) and not self.is_stale:
+            return None
+        now = dt_util.utcnow()
+        if self._last_attempt is not None and now - self._last_attempt < LOGO_RETRY_INTERVAL:
+            return None
+        self._last_attempt = now
+        self._task = self.hass.async_create_task(self._async_download())
+        return self._task
+
+    async def _async_download(self) -> None:
+        self.downloads += 1
+        logos = await self.api.get_all_logos()
+        if not logos:
+            return
+        self.fetched_at = dt_util.utcnow()
+        self._async_publish(logos)
+        await self._store.async_save({"fetched_at": self.fetched_at.isoformat(), "logos": logos.as_dict()})
+
+    @callback
+    def _async_publish(self, logos: LogoStore) -> None:
+        self.hass.data[DATA_LOGOS] = logos
+        for update_callback in self._listeners:
+            update_callback()
+
+
+class PayloadCache:
+    """Ultimo payload `servicearea/{id}` valido di ogni impianto, persistito su disco.
+
+    Le scritture sono raggruppate con `Store.async_delay_save`: un ciclo di
+    aggiornamento di molti impianti produce una sola scrittura. Sul disco ogni voce
+    è `[timestamp, payload compatto, istanti dei cambi]` (questi ultimi per il polling
+    adattivo); le voci più vecchie di `PAYLOAD_CACHE_MAX_AGE` vengono scartate al caricamento
+    e a ogni salvataggio, così gli impianti non più configurati escono dalla cache.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._store: Store = Store(hass, STORAGE_VERSION, PAYLOAD_STORAGE_KEY)
+        self._entries: Dict[int, Tuple[datetime, Dict[str, Any]]] = {}
+        self._changes: Dict[int, List[float]] = {}
+        self._loaded = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def async_load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            stored: Optional[Dict[str, Any]] = await self._store.async_load()
+        except Exception as err:
+            _LOGGER.debug("Cache payload illeggibile, verrà ricostruita: %s", err)
+            stored = None
+        oldest = dt_util.utcnow() - PAYLOAD_CACHE_MAX_AGE
+        for key, item in ((stored or {}).get("stations") or {}).items():
+            try:
+                station_id = int(key)
+                fetched_at = dt_util.utc_from_timestamp(float(item[0]))
+                payload = item[1]
+            except (TypeError, ValueError, IndexError, KeyError):
+                continue
+            if isinstance(payload, dict) and fetched_at >= oldest:
+                self._entries[station_id] = (fetched_at, payload)
+                if len(item) > 2 and isinstance(item[2], list):
+                    self._changes[station_id] = [float(ts) for ts in item[2] if isinstance(ts, (int, float))]
+
+    def get(self, station_id: int) -> Optional[Tuple[datetime, Dict[str, Any]]]:
+        """`(fetched_at, payload)` dell'impianto, se presente in cache."""
+        return self._entries.get(station_id)
+
+    def changes(self, station_id: int) -> List[float]:
+        """Istanti dei cambi noti dell'impianto (epoch, crescenti)."""
+        return list(self._changes.get(station_id, []))
+
+    @callback
+    def async_put(self, station_id: int, payload: Dict[str, Any], changes: Optional[List[float]] = None) -> None:
+        if not isinstance(payload, dict):
+            return
+        self._entries[station_id] = (dt_util.utcnow(), payload)
+        if changes is not None:
+            self._changes[station_id] = list(changes)
+        self._store.async_delay_save(self._data_to_save, PAYLOAD_SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> Dict[str, Any]:
+        oldest = dt_util.utcnow() - PAYLOAD_CACHE_MAX_AGE
+        for station_id in [key for key, (fetched_at, _) in self._entries.items() if fetched_at < oldest]:
+            del self._entries[station_id]
+            self._changes.pop(station_id, None)
+        return {
+            "stations": {
+                str(station_id): [
+                    round(fetched_at.timestamp()),
+                    compact_payload(payload),
+                    [round(ts) for ts in self._changes.get(station_id, [])],
+                ]
+                for station_id, (fetched_at, payload) in self._entries.items()
+            }
+        }
+
+
+class AreaCache:
+    """Regioni, province e comuni dell'API con cache su disco e TTL, condivisi tra i flow.
+
+    Caricata al primo uso; una voce scaduta viene riscaricata, ma se la richiesta
+    fallisce (o ritorna un elenco vuoto) si usa quella in cache, così la ricerca
+    funziona anche offline. Richieste uguali concorrenti ne fanno una sola.
+    Sul disco ogni voce è `[timestamp, [[id, nome], ...]]`.
+    """
+
+    def __init__(self, hass: HomeAssistant, api: OsservaprezziAPI) -> None:
+        self.hass = hass
+        self.api = api
+        self._store: Store = Store(hass, STORAGE_VERSION, AREA_STORAGE_KEY)
+        self._entries: Dict[str, Tuple[datetime, List[Tuple[Any, str]]]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._load_lock = asyncio.Lock()
+        self._loaded = False
+        self.downloads = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def async_load(self) -> None:
+        async with self._load_lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                stored: Optional[Dict[str, Any]] = await self._store.async_load()
+            except Exception as err:
+                _LOGGER.debug("Cache aree illeggibile, verrà ricostruita: %s", err)
+                stored = None
+            for key, item in ((stored or {}).get("areas") or {}).items():
+                try:
+                    fetched_at = dt_util.utc_from_timestamp(float(item[0]))
+                    rows = [(row[0], str(row[1])) for row in item[1]]
+                except (TypeError, ValueError, IndexError, KeyError):
+                    continue
+                self._entries[key] = (fetched_at, rows)
+
+    async def async_regions(self) -> List[Dict[str, Any]]:
+        return await self._async_get("regions", self.api.get_regions)
+
+    async def async_provinces(self, region_id: int) -> List[Dict[str, Any]]:
+        return await self._async_get(f"provinces:{region_id}", lambda: self.api.get_provinces(region_id))
+
+    async def async_towns(self, province_id: str) -> List[Dict[str, Any]]:
+        return await self._async_get(f"towns:{province_id}", lambda: self.api.get_towns(province_id))
+
+    async def _async_get(self, key: str, fetch: Callable[[], Any]) -> List[Dict[str, Any]]:
+        """Elenco `[{"id", "description"}]` della voce, dalla cache se ancora valida."""
+        await self.async_load()
+        entry = self._entries.get(key)
+        if entry is None or dt_util.utcnow() - entry[0] > AREA_CACHE_TTL:
+            task = self._tasks.get(key)
+            if task is None:
+                task = self._tasks[key] = self.hass.async_create_task(self._async_download(key, fetch))
+                task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            try:
+                await asyncio.shield(task)
+            except Exception as err:  # noqa: BLE001 - si ripiega sulla cache
+                _LOGGER.debug("Aggiornamento elenco %s non riuscito: %s", key, err)
+            entry = self._entries.get(key)
+        if entry is None:
+            return []
+        return [{"id": area_id, "description": name} for area_id, name in entry[1]]
+
+    async def _async_download(self, key: str, fetch: Callable[[], Any]) -> None:
+        self.downloads += 1
+        rows = [
+            (item["id"], str(item.get("description") or item.get("name") or item["id"]))
+            for item in await fetch()
+            if isinstance(item, dict) and item.get("id") is not None
+        ]
+        if not rows:
+            # API non raggiungibile: resta la voce in cache (anche se scaduta)
+            _LOGGER.debug("Elenco %s non disponibile, uso la cache", key)
+            return
+        self._entries[key] = (dt_util.utcnow(), rows)
+        self._store.async_delay_save(self._data_to_save, AREA_SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> Dict[str, Any]:
+        return {
+            "areas": {
+                key: [round(fetched_at.timestamp()), [list(row) for row in rows]]
+                for key, (fetched_at, rows) in self._entries.items()
+            }
+        }
+
+
+class PriceHistoryStore:
+    """`PriceHistory` persistito su disco, alimentato a ogni aggiornamento dei coordinator.
+
+    Solo i cambi di prezzo aggiungono righe e solo allora viene pianificata una
+    scrittura (raggruppata con `async_delay_save`); i cambi più vecchi di
+    `HISTORY_MAX_AGE` vengono scartati al caricamento.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._store: Store = Store(hass, STORAGE_VERSION, HISTORY_STORAGE_KEY)
+        self.history = PriceHistory()
+        self._loaded = False
+
+    async def async_load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            stored: Optional[Dict[str, Any]] = await self._store.async_load()
+        except Exception as err:
+            _LOGGER.debug("Storico prezzi illeggibile, verrà ricostruito: %s", err)
+            stored = None
+        history = PriceHistory.from_dict((stored or {}).get("series") or {})
+        history.prune((dt_util.utcnow() - HISTORY_MAX_AGE).timestamp())
+        # eventuali cambi registrati prima del caricamento restano
+        history.series.update(self.history.series)
+        history.changes.update(self.history.changes)
+        self.history = history
+
+    @callback
+    def async_record(self, station_id: int, snapshot: Any) -> int:
+        """Registra i prezzi dello snapshot; ritorna il numero di cambi."""
+        changes = self.history.record(station_id, snapshot, dt_util.utcnow().timestamp())
+        if changes:
+            self._store.async_delay_save(self._data_to_save, HISTORY_SAVE_DELAY)
+        return changes
+
+    @callback
+    def _data_to_save(self) -> Dict[str, Any]:
+        return {"series": self.history.to_dict()}
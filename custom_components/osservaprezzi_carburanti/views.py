@@ -0,0 +1,49 @@
+"""View HTTP dell'integrazione Osservaprezzi Carburanti."""
+from __future__ import annotations
+
+from aiohttp import web
+
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.core import HomeAssistant
+
+from .const import DATA_LOGOS, DOMAIN, LOGO_URL_TEMPLATE
+from .logos import SVG_CONTENT_TYPE, image_content_type
+
+# L'URL contiene l'hash del contenuto: la risposta non cambia mai
+LOGO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Un SVG aperto direttamente non deve poter eseguire script né caricare risorse
+SVG_CSP = "default-src 'none'; style-src 'unsafe-inline'; sandbox"
+
+
+class BrandLogoView(HomeAssistantView):
+    """Serve i loghi brand del `LogoStore` come immagini, una volta per hash.
+
+    Senza autenticazione perché i loghi sono pubblici e vengono caricati da tag <img>:
+    per questo si servono solo i tipi immagine ammessi, sempre con `nosniff`.
+    """
+
+    url = LOGO_URL_TEMPLATE
+    name = f"api:{DOMAIN}:logo"
+    requires_auth = False
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+
+    async def get(self, request: web.Request, key: str) -> web.Response:
+        store = self.hass.data.get(DATA_LOGOS)
+        logo = store.get(key) if store else None
+        content_type = image_content_type(logo.content_type) if logo else None
+        if content_type is None:
+            return web.Response(status=404)
+
+        etag = f'"{logo.digest}"'
+        headers = {
+            "Cache-Control": LOGO_CACHE_CONTROL,
+            "ETag": etag,
+            "X-Content-Type-Options": "nosniff",
+        }
+        if content_type == SVG_CONTENT_TYPE:
+            headers["Content-Security-Policy"] = SVG_CSP
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=logo.body, content_type=content_type, headers=headers)
@@ -0,0 +1,95 @@
+"""Comandi websocket dell'integrazione Osservaprezzi Carburanti."""
+from __future__ import annotations
+
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+import voluptuous as vol
+
+from homeassistant.components import websocket_api
+from homeassistant.core import HomeAssistant, callback
+import homeassistant.helpers.config_validation as cv
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN
+from .coordinator import async_get_registry
+from .history import (
+    PERIOD_DAY,
+    PERIOD_RAW,
+    PERIODS,
+    STATISTIC_TYPES,
+    SeriesKey,
+    bucket_boundaries,
+    series_key,
+)
+
+# Intervallo massimo di una singola richiesta
+MAX_RANGE = timedelta(days=800)
+
+
+def _series_key(hass: HomeAssistant, entity_id: str) -> Optional[SeriesKey]:
+    """Serie di un sensore carburante dai suoi attributi (station_id, fuel_name, is_self)."""
+    state = hass.states.get(entity_id)
+    if state is None:
+        return None
+    attrs = state.attributes
+    if attrs.get("station_id") is None or attrs.get("fuel_name") is None:
+        return None
+    try:
+        return series_key(int(attrs["station_id"]), attrs["fuel_name"], bool(attrs.get("is_self")))
+    except (TypeError, ValueError):
+        return None
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): f"{DOMAIN}/price_history",
+        vol.Required("entity_ids"): vol.All(cv.ensure_list, [cv.entity_id]),
+        vol.Required("start_time"): cv.datetime,
+        vol.Optional("end_time"): cv.datetime,
+        vol.Optional("period", default=PERIOD_DAY): vol.In(PERIODS),
+        vol.Optional("types", default=list(STATISTIC_TYPES)): vol.All(
+            cv.ensure_list, [vol.In(STATISTIC_TYPES)]
+        ),
+    }
+)
+@callback
+def ws_price_history(hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: Dict[str, Any]) -> None:
+    """Storico dei prezzi di più sensori, ricampionato per giorno o settimana lato server.
+
+    Con `period: raw` ritorna i soli cambi; altrimenti gli istanti (`t`, epoch) sono
+    comuni a tutte le serie e per ogni sensore vengono restituite le colonne di `types`.
+    """
+    start = dt_util.as_utc(msg["start_time"])
+    end = dt_util.as_utc(msg["end_time"]) if msg.get("end_time") else dt_util.utcnow()
+    if end <= start or end - start > MAX_RANGE:
+        connection.send_error(msg["id"], websocket_api.ERR_INVALID_FORMAT, "Intervallo non valido")
+        return
+
+    history = async_get_registry(hass).history.history
+    period = msg["period"]
+    boundaries: List[float] = []
+    if period != PERIOD_RAW:
+        boundaries = bucket_boundaries(start, end, period, dt_util.get_default_time_zone())
+
+    series: Dict[str, Any] = {}
+    for entity_id in msg["entity_ids"]:
+        key = _series_key(hass, entity_id)
+        item = history.series.get(key) if key else None
+        if item is None:
+            series[entity_id] = None
+        elif period == PERIOD_RAW:
+            series[entity_id] = item.raw(start.timestamp(), end.timestamp())
+        else:
+            series[entity_id] = item.downsample(boundaries, msg["types"])
+
+    result: Dict[str, Any] = {"period": period, "series": series}
+    if period != PERIOD_RAW:
+        result["t"] = [int(ts) for ts in boundaries[:-1]]
+    connection.send_result(msg["id"], result)
+
+
+@callback
+def async_setup_websocket(hass: HomeAssistant) -> None:
+    """Registra i comandi websocket del dominio."""
+    websocket_api.async_register_command(hass, ws_price_history)
@@ -146,7 +146,8 @@ class OsservaprezziCard extends HTMLElement {
     const price = entity ? entity.state : 'unavailable';
 
     if (logo) {
-      this._logo.src = logo;
+      // brand_logo è un URL con hash del contenuto: reimpostarlo a ogni stato è inutile
+      if (this._logo.getAttribute('src') !== logo) this._logo.src = logo;
       this._logoWrap.style.display = 'flex';
     } else {
       this._logoWrap.style.display = 'none';
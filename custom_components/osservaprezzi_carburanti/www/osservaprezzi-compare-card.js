@@ -146,6 +146,7 @@ class OsservaprezziCompareCard extends HTMLElement {
       throw new Error('Please define entities list');
     }
     this._config = config;
+    this._historyLoaded = null;
   }
 
   _update() {
@@ -196,31 +197,54 @@ class OsservaprezziCompareCard extends HTMLElement {
   }
 
   async _drawHistories(entities) {
-    const end = new Date();
-    const start = new Date(Date.now() - 14 * 24 * 3600 * 1000);
+    // _update gira a ogni cambio di stato: lo storico giornaliero si ricarica al più ogni 10 minuti
+    if (this._historyLoaded && Date.now() - this._historyLoaded < 10 * 60 * 1000) return;
+    this._historyLoaded = Date.now();
+    // Storico ricampionato lato server (un punto per giorno/settimana), una sola risposta per tutte le stazioni
+    const days = this._config.history_days || 14;
+    const period = this._config.history_period || 'day';
+    const start = new Date(Date.now() - days * 24 * 3600 * 1000);
     try {
-      const history = await this._hass.callWS({
-        type: 'history/period',
-        start: start.toISOString(),
-        end: end.toISOString(),
-        filter_entity_id: entities,
+      let history;
+      try {
+        history = await this._hass.callWS({
+          type: 'osservaprezzi_carburanti/price_history',
+          entity_ids: entities,
+          start_time: start.toISOString(),
+          period,
+          types: ['close'],
+        });
+      } catch (e) {
+        // backend senza il comando (integrazione non ancora aggiornata): solo recorder
+        console.warn(e);
+        history = { t: this._bucketStarts(start, period), series: {} };
+      }
+
+      // Sensori senza storico compatto (es. subito dopo l'aggiornamento): si ripiega sul recorder
+      const missing = entities.filter(eid => {
+        const series = history.series[eid];
+        return !series || !(series.close || []).some(v => v !== null && v !== undefined);
       });
+      if (missing.length) {
+        const closes = await this._recorderCloses(missing, start, history.t || []);
+        missing.forEach(eid => { history.series[eid] = { close: closes[eid] }; });
+      }
 
+      const labels = (history.t || []).map(ts => {
+        const d = new Date(ts * 1000);
+        return `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}-${String(d.getDate()).padStart(2, '0')}`;
+      });
       const datasets = [];
       // Colors from Material Design
       const colors = ['#2196f3', '#f44336', '#4caf50', '#ff9800', '#9c27b0', '#00bcd4', '#795548'];
 
       entities.forEach((eid, i) => {
-        const series = history[i] || [];
-        const pts = series.map(s => ({ x: new Date(s.last_changed).toISOString().split('T')[0], y: parseFloat(s.state) })).filter(p => !isNaN(p.y));
-
-        // Basic aggregation (last price per day for simplicity in chart)
-        const distinctDays = {};
-        pts.forEach(p => distinctDays[p.x] = p.y);
+        const series = history.series[eid];
+        const values = series ? series.close : [];
 
         datasets.push({
           label: this._hass.states[eid]?.attributes?.name || eid,
-          data: Object.keys(distinctDays).sort().map(d => ({ x: d, y: distinctDays[d] })),
+          data: labels.map((x, j) => ({ x, y: values[j] ?? null })).filter(p => p.y !== null),
           borderColor: colors[i % colors.length],
           backgroundColor: 'transparent',
           tension: 0.3,
@@ -247,10 +271,49 @@ class OsservaprezziCompareCard extends HTMLElement {
       }
 
     } catch (e) {
+      this._historyLoaded = null;
       console.error(e);
     }
   }
 
+  _bucketStarts(start, period) {
+    // Inizi dei giorni (o delle settimane, dal lunedì) locali da `start` a oggi, in epoch
+    const day = new Date(start.getFullYear(), start.getMonth(), start.getDate());
+    if (period === 'week') day.setDate(day.getDate() - ((day.getDay() + 6) % 7));
+    const starts = [];
+    while (day.getTime() < Date.now()) {
+      starts.push(day.getTime() / 1000);
+      day.setDate(day.getDate() + (period === 'week' ? 7 : 1));
+    }
+    return starts;
+  }
+
+  async _recorderCloses(entityIds, start, bucketStarts) {
+    // Ultimo stato registrato in ogni intervallo, dalla history del recorder
+    const history = await this._hass.callWS({
+      type: 'history/history_during_period',
+      start_time: start.toISOString(),
+      entity_ids: entityIds,
+      minimal_response: true,
+      no_attributes: true,
+      significant_changes_only: false,
+    });
+    const closes = {};
+    entityIds.forEach(eid => {
+      const states = (history[eid] || [])
+        .map(s => ({ t: s.lu, y: parseFloat(s.s) }))
+        .filter(p => !isNaN(p.y));
+      let k = 0;
+      let current = null;
+      closes[eid] = bucketStarts.map((_, j) => {
+        const end = j + 1 < bucketStarts.length ? bucketStarts[j + 1] : Infinity;
+        while (k < states.length && states[k].t < end) current = states[k++].y;
+        return current;
+      });
+    });
+    return closes;
+  }
+
   _ensureChart() {
     return new Promise((resolve, reject) => {
       if (window.Chart) return resolve();
@@ -0,0 +1,5 @@
+"""I test importano i moduli puri dell'integrazione tramite `tools/_integration.load`."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tools"))
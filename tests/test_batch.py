@@ -0,0 +1,77 @@
+"""Test di `batch.BatchRefreshEngine` contro un server aiohttp locale che imita MIMIT."""
+import asyncio
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web  # noqa: E402
+
+from _integration import load  # noqa: E402
+
+api_module = load("api")
+batch = load("batch")
+
+# 1 e 2 vicini (una ricerca per zona), 3 isolato; 2 manca dalla risposta per zona
+KNOWN = {
+    1: {"id": 1, "lat": 45.0700, "lng": 7.6800, "services": ["Bar"], "fuels": []},
+    2: {"id": 2, "lat": 45.0710, "lng": 7.6810, "fuels": []},
+    3: {"id": 3, "lat": 41.9000, "lng": 12.5000, "fuels": []},
+    4: {"id": 4, "lat": 45.0705, "lng": 7.6805, "fuels": []},
+}
+ZONE_FUELS = [{"name": "Benzina", "price": 1.799, "isSelf": True}]
+
+
+def _app(calls):
+    async def zone(request):
+        calls.append(("zone", await request.json()))
+        return web.json_response(
+            {"results": [{"id": 1, "fuels": ZONE_FUELS, "insertDate": "2024-05-10T08:00:00"}, {"id": 4, "fuels": []}]}
+        )
+
+    async def servicearea(request):
+        sid = int(request.match_info["id"])
+        calls.append(("servicearea", sid))
+        if sid == 3:
+            return web.json_response({"message": "not found"}, status=404)
+        return web.json_response({"id": sid, "fuels": [], "services": []})
+
+    app = web.Application()
+    app.router.add_post("/ospzApi/search/zone", zone)
+    app.router.add_get("/ospzApi/registry/servicearea/{id}", servicearea)
+    return app
+
+
+async def _refresh(calls):
+    runner = web.AppRunner(_app(calls))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        async with aiohttp.ClientSession() as session:
+            api = api_module.OsservaprezziAPI(session, base_url=f"http://127.0.0.1:{port}/ospzApi", max_retries=0)
+            engine = batch.BatchRefreshEngine(api, radius_km=5)
+            return await engine.async_refresh(KNOWN, KNOWN)
+    finally:
+        await runner.cleanup()
+
+
+def test_batch_refresh_against_local_server():
+    calls = []
+    result = asyncio.run(_refresh(calls))
+
+    assert result.zone_requests == 1
+    # 2 non coperto dalla zona, 3 isolato (404)
+    assert sorted(sid for kind, sid in calls if kind == "servicearea") == [2, 3]
+    assert result.detail_requests == 2
+    assert set(result.data) == {1, 2, 4}
+    assert isinstance(result.errors[3], api_module.OsservaprezziHTTPError)
+    # la riga per zona aggiorna i prezzi ma conserva i servizi dell'ultimo payload completo
+    assert result.data[1]["fuels"] == ZONE_FUELS
+    assert result.data[1]["services"] == ["Bar"]
+
+
+def test_merge_zone_result_keeps_details():
+    merged = batch.merge_zone_result({"id": 1, "services": ["Bar"], "fuels": []}, {"id": 1, "fuels": ZONE_FUELS})
+    assert merged == {"id": 1, "services": ["Bar"], "fuels": ZONE_FUELS}
+    assert batch.merge_zone_result(None, {"id": 1}) == {"id": 1}
@@ -0,0 +1,26 @@
+"""Test dell'elenco geografico degli impianti (`directory`)."""
+from _integration import load
+
+directory = load("directory")
+opendata = load("opendata")
+
+
+def test_discard_keeps_open_data_stations():
+    table = opendata.OpenDataTable()
+    opendata.StationRegistryParser(table, "anagrafica").feed([
+        "idImpianto|Gestore|Bandiera|Tipo Impianto|Nome Impianto|Indirizzo|Comune|Provincia|Latitudine|Longitudine\n",
+        "1|G|Ener Coop|Stradale|Tabella|VIA ROMA 1|TORINO|TO|45.07|7.68\n",
+    ])
+    stations = directory.StationDirectory()
+    stations.add_table(table)
+    stations.add_payload({"id": 1, "name": "Payload", "latitude": 45.08, "longitude": 7.69})
+    stations.add_payload({"id": 2, "name": "Solo payload", "latitude": 45.1, "longitude": 7.7})
+    assert len(stations) == 2
+
+    stations.discard(1)
+    stations.discard(2)
+    assert len(stations) == 1
+    # l'impianto della tabella torna alle coordinate e alla descrizione open data
+    assert stations.describe(1)["name"] == "Tabella"
+    assert stations.describe(1)["latitude"] == 45.07
+    assert stations.describe(2) == {"id": 2}
@@ -0,0 +1,29 @@
+"""Test delle utilità pure (`helpers`)."""
+from _integration import load
+
+helpers = load("helpers")
+
+
+def test_key_presence_tolerates_transient_absence():
+    presence = helpers.KeyPresence(remove_after=3)
+    assert sorted(presence.update(["benzina", "gasolio"]).added) == ["benzina", "gasolio"]
+
+    # una riga parziale (es. ricerca per zona) senza gasolio: assente, non rimosso
+    change = presence.update(["benzina"])
+    assert change.missing == ["gasolio"] and not change.removed
+    assert presence.is_missing("gasolio")
+
+    # ricompare al refresh successivo: nessuna nuova entità, torna disponibile
+    change = presence.update(["benzina", "gasolio"])
+    assert change.returned == ["gasolio"] and not change.added
+    assert not presence.is_missing("gasolio")
+
+
+def test_key_presence_removes_after_consecutive_absences():
+    presence = helpers.KeyPresence(remove_after=3)
+    presence.update(["benzina", "gpl"])
+    assert presence.update(["benzina"]).missing == ["gpl"]
+    assert presence.update(["benzina"]).removed == []
+    assert presence.update(["benzina"]).removed == ["gpl"]
+    # se ricompare dopo la rimozione è di nuovo una chiave nuova
+    assert presence.update(["benzina", "gpl"]).added == ["gpl"]
@@ -0,0 +1,67 @@
+"""Test dello storico compatto dei prezzi (`history`)."""
+import time
+
+from _integration import load
+
+history = load("history")
+snapshot = load("snapshot")
+
+
+def test_record_uses_validity_instant_regardless_of_host_timezone(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        validity_ms = 1_760_000_000_000
+        snap = snapshot.build_snapshot(
+            {"fuels": [{"name": "Benzina", "isSelf": True, "price": 1.799, "validityDate": validity_ms}]}
+        )
+        prices = history.PriceHistory()
+        assert prices.record(1, snap, now=validity_ms / 1000 + 3600) == 1
+        series = prices.get(1, "Benzina", True)
+        assert list(series.times) == [validity_ms // 1000]
+    finally:
+        monkeypatch.delenv("TZ")
+        time.tzset()
+
+
+def test_downsample_close_and_mean():
+    series = history.PriceSeries()
+    series.append(0, 1.8)
+    series.append(50, 2.0)
+    columns = series.downsample([0.0, 100.0, 200.0])
+    assert columns["close"] == [2.0, 2.0]
+    assert columns["mean"] == [1.9, 2.0]
+    assert columns["min"] == [1.8, 2.0]
+    assert columns["max"] == [2.0, 2.0]
+
+
+def test_out_of_order_points_are_inserted_in_place():
+    series = history.PriceSeries()
+    assert series.append(100, 1.8)
+    assert series.append(300, 2.0)
+    # cambio arrivato in ritardo: va tra i due, senza toccare il prezzo attuale
+    assert series.append(200, 1.9)
+    assert list(series.times) == [100, 200, 300]
+    assert series.value_at(250) == 1900 and series.value_at(400) == 2000
+    # uguale al prezzo già in vigore in quell'istante: non è un cambio
+    assert not series.append(150, 1.8)
+    # il cambio successivo diventa ridondante e viene scartato
+    assert series.append(250, 2.0)
+    assert list(series.times) == [100, 200, 250]
+    # correzione nello stesso istante
+    assert series.append(250, 2.1)
+    assert list(series.prices) == [1800, 1900, 2100]
+
+
+def test_take_changes_reports_oldest_change():
+    snap_old = snapshot.build_snapshot(
+        {"fuels": [{"name": "Benzina", "isSelf": True, "price": 1.8, "validityDate": 2_000_000}]}
+    )
+    snap_late = snapshot.build_snapshot(
+        {"fuels": [{"name": "Benzina", "isSelf": True, "price": 1.7, "validityDate": 1_000_000}]}
+    )
+    prices = history.PriceHistory()
+    prices.record(1, snap_old, now=5000)
+    prices.record(1, snap_late, now=5000)
+    assert prices.take_changes(1) == {(1, "benzina", True): 1000}
+    assert prices.take_changes(1) == {}
@@ -0,0 +1,76 @@
+"""Test della compilazione degli orari di apertura (`hours`)."""
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from _integration import load
+
+hours = load("hours")
+
+ROME = ZoneInfo("Europe/Rome")
+
+
+def _day(day, **fields):
+    return {"giornoSettimanaId": day, **fields}
+
+
+def test_morning_afternoon_and_closed_day():
+    rows = [
+        _day(d, oraAperturaMattina="07:00", oraChiusuraMattina="12:30",
+             oraAperturaPomeriggio="15:00", oraChiusuraPomeriggio="19:30")
+        for d in range(1, 7)
+    ] + [_day(7, flagChiusura=True)]
+    compiled = hours.compile_hours(rows)
+    assert compiled.describe()["lun"] == "07:00-12:30, 15:00-19:30"
+    assert compiled.describe()["dom"] == "chiuso"
+
+    # lunedì 13:00: chiuso, riapre alle 15:00 e richiude alle 19:30
+    is_open, opening, closing = compiled.state_at(datetime(2024, 5, 6, 13, 0, tzinfo=ROME))
+    assert not is_open
+    assert opening == datetime(2024, 5, 6, 15, 0, tzinfo=ROME)
+    assert closing == datetime(2024, 5, 6, 19, 30, tzinfo=ROME)
+
+    # sabato 20:00: la prossima apertura è lunedì
+    assert compiled.next_transition(datetime(2024, 5, 11, 20, 0, tzinfo=ROME)) == datetime(2024, 5, 13, 7, 0, tzinfo=ROME)
+
+
+def test_always_open_and_overnight():
+    always = hours.compile_hours([_day(d, flagH24=True) for d in range(1, 8)])
+    assert always.always_open
+    assert always.state_at(datetime(2024, 5, 6, 3, 0, tzinfo=ROME)) == (True, None, None)
+
+    # domenica 22:00 - 02:00: la parte dopo la mezzanotte è lunedì mattina
+    overnight = hours.compile_hours(
+        [_day(7, flagOrarioContinuato=True, oraAperturaOrarioContinuato="22:00", oraChiusuraOrarioContinuato="02:00")]
+    )
+    is_open, _, closing = overnight.state_at(datetime(2024, 5, 6, 1, 0, tzinfo=ROME))
+    assert is_open
+    assert closing == datetime(2024, 5, 6, 2, 0, tzinfo=ROME)
+
+
+def test_not_communicated():
+    assert hours.compile_hours(None) is None
+    assert hours.compile_hours([_day(1, flagNonComunicato=True)]) is None
+
+
+def test_moment_in_another_timezone_is_evaluated_in_rome():
+    rows = [
+        _day(d, oraAperturaMattina="07:00", oraChiusuraMattina="12:30",
+             oraAperturaPomeriggio="15:00", oraChiusuraPomeriggio="19:30")
+        for d in range(1, 8)
+    ]
+    compiled = hours.compile_hours(rows)
+
+    # lunedì 11:30 UTC sono le 13:30 a Roma: chiuso, anche se in UTC sarebbe aperto
+    is_open, opening, closing = compiled.state_at(datetime(2024, 5, 6, 11, 30, tzinfo=timezone.utc))
+    assert not is_open
+    assert opening == datetime(2024, 5, 6, 15, 0, tzinfo=ROME)
+    assert opening.tzinfo is not None and opening.utcoffset() == timedelta(hours=2)
+
+    # settimana del passaggio all'ora legale (domenica 31 marzo 2024)
+    saturday = datetime(2024, 3, 30, 19, 0, tzinfo=timezone.utc)  # 20:00 a Roma, ora solare
+    assert compiled.next_transition(saturday) == datetime(2024, 3, 31, 5, 0, tzinfo=timezone.utc)  # 07:00 ora legale
+    sunday = datetime(2024, 3, 31, 11, 0, tzinfo=timezone.utc)  # 13:00 a Roma, ora legale
+    is_open, opening, closing = compiled.state_at(sunday)
+    assert not is_open
+    assert opening == datetime(2024, 3, 31, 13, 0, tzinfo=timezone.utc)
+    assert closing.utcoffset() == timedelta(hours=2)
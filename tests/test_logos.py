@@ -0,0 +1,31 @@
+"""Test dei tipi ammessi per i loghi brand (`logos`)."""
+import base64
+
+from _integration import load
+
+logos = load("logos")
+
+
+def test_image_content_type_allowlist():
+    assert logos.image_content_type("image/png") == "image/png"
+    assert logos.image_content_type("jpg") == "image/jpeg"
+    assert logos.image_content_type("svg") == "image/svg+xml"
+    assert logos.image_content_type("image/svg+xml; charset=utf-8") == "image/svg+xml"
+    assert logos.image_content_type("text/html") is None
+    assert logos.image_content_type("image/x-icon") is None
+    assert logos.image_content_type(None) is None
+
+
+def test_payload_skips_disallowed_types():
+    html = base64.b64encode(b"<script>alert(1)</script>").decode()
+    png = base64.b64encode(b"\x89PNG").decode()
+    store = logos.LogoStore.from_payload(
+        {
+            "loghi": [
+                {"bandieraId": 1, "logoMarkerList": [{"content": f"data:text/html;base64,{html}"}]},
+                {"bandieraId": 2, "logoMarkerList": [{"content": png, "estensione": "svg"}]},
+            ]
+        }
+    )
+    assert store.lookup(1) is None
+    assert store.lookup(2).content_type == "image/svg+xml"
@@ -0,0 +1,74 @@
+"""Test dei parser e del caricatore open data (`opendata`)."""
+import asyncio
+
+import pytest
+
+from _integration import load
+
+opendata = load("opendata")
+
+REGISTRY = [
+    "Estrazione del 2024-05-10\n",
+    "idImpianto|Gestore|Bandiera|Tipo Impianto|Nome Impianto|Indirizzo|Comune|Provincia|Latitudine|Longitudine\n",
+    "48524|ENERCOOP|Ener Coop|Stradale|Distributore|VIA ROMA 1|TORINO|TO|45.07|7.68\n",
+    "48525|X|Y|Stradale|Z|VIA|TORINO|TO|non-numero|7.6\n",
+]
+PRICES = [
+    "Estrazione del 2024-05-10\n",
+    "idImpianto|descCarburante|prezzo|isSelf|dtComu\n",
+    "48524|Benzina|1.829|1|10/05/2024 07:00:00\n",
+    "48524|Gasolio|1.729|0|10/05/2024 07:00:00\n",
+]
+
+
+def test_parsers_build_table():
+    table = opendata.OpenDataTable()
+    registry = opendata.StationRegistryParser(table, "anagrafica")
+    registry.feed(REGISTRY)
+    opendata.PriceParser(table, "prezzi").feed(PRICES)
+    assert table.extracted["anagrafica"] == "2024-05-10"
+    assert table.stations[48524].brand == "Ener Coop"
+    assert table.stations[48524].latitude == 45.07
+    assert [row.fuel for row in table.prices[48524]] == ["Benzina", "Gasolio"]
+    assert table.stations[48525].latitude is None
+    assert table.prices[48524][0].is_self and not table.prices[48524][1].is_self
+
+
+def test_quoted_multiline_field_across_chunks():
+    table = opendata.OpenDataTable()
+    parser = opendata.StationRegistryParser(table, "anagrafica")
+    parser.feed(REGISTRY[:2] + ['48526|G|Q8|Stradale|"Area di servizio\n'])
+    parser.feed(['Nord"|VIA ROMA 2|MILANO|MI|45.46|9.19\n', REGISTRY[2]])
+    parser.close()
+    assert table.stations[48526].name == "Area di servizio\nNord"
+    assert table.stations[48526].longitude == 9.19
+    assert table.stations[48524].brand == "Ener Coop"
+    assert parser.skipped == 0
+
+
+def test_unknown_header_is_rejected():
+    with pytest.raises(opendata.OpenDataError):
+        opendata.PriceParser(opendata.OpenDataTable(), "prezzi").feed(["a|b|c\n"])
+
+
+class _FailingSession:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        raise OSError("MIMIT non raggiungibile")
+
+
+def test_failed_first_load_is_throttled():
+    session = _FailingSession()
+    loader = opendata.OpenDataLoader(session)
+
+    async def _run():
+        for _ in range(3):
+            with pytest.raises(opendata.OpenDataError):
+                await loader.async_get_table()
+
+    asyncio.run(_run())
+    assert session.calls == 1
+    assert "non raggiungibile" in loader.last_error
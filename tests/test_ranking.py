@@ -0,0 +1,54 @@
+"""Test di `ranking.PriceRanking`."""
+import random
+import statistics
+
+from _integration import load
+
+ranking = load("ranking")
+
+
+def test_median_after_reprice():
+    prices = ranking.PriceRanking()
+    for station_id, price in ((4, 1.268), (1, 1.139), (1, 1.924), (6, 1.903)):
+        prices.update(station_id, price)
+    assert prices.median == 1.903
+
+
+def test_random_updates_match_full_recompute():
+    rng = random.Random(0)
+    for _ in range(50):
+        prices = ranking.PriceRanking()
+        expected = {}
+        for _ in range(200):
+            station_id = rng.randrange(6)
+            if rng.random() < 0.15:
+                prices.update(station_id, None)
+                expected.pop(station_id, None)
+            else:
+                price = round(rng.uniform(1.6, 2.1), 3)
+                prices.update(station_id, price)
+                expected[station_id] = price
+            values = list(expected.values())
+            if not values:
+                assert prices.median is None
+                continue
+            assert prices.median == statistics.median(values)
+            assert prices.minimum == min(values)
+            assert prices.maximum == max(values)
+            assert abs(prices.average - statistics.mean(values)) < 1e-9
+            assert [p for p, _ in prices.top(5)] == sorted(values)[:5]
+
+
+def test_top_does_not_change_state():
+    prices = ranking.PriceRanking()
+    for station_id, price in ((1, 1.9), (2, 1.8), (3, 1.8), (4, 2.0)):
+        prices.update(station_id, price)
+    first = prices.top(3)
+    assert first == [(1.8, 2), (1.8, 3), (1.9, 1)]
+    assert prices.top(3) == first
+    assert prices.top(10) == first + [(2.0, 4)]
+    assert prices.median == 1.85
+    # un impianto riprezzato al valore di prima finisce dopo quelli già a pari prezzo
+    prices.update(2, 1.85)
+    prices.update(2, 1.8)
+    assert prices.top(2) == [(1.8, 3), (1.8, 2)]
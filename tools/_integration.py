@@ -0,0 +1,27 @@
+"""Import dei moduli "puri" dell'integrazione dagli script in tools/.
+
+Il pacchetto `__init__` importa Home Assistant: qui il pacchetto viene registrato
+come namespace vuoto così da poter importare i moduli che non ne dipendono
+(helpers, snapshot, batch, ...) anche senza Home Assistant installato.
+
+Gli script in tools/ e i test in tests/ usano solo questi moduli: non devono
+importare `homeassistant`, nemmeno indirettamente tramite altri moduli del pacchetto.
+"""
+from __future__ import annotations
+
+import importlib
+import sys
+import types
+from pathlib import Path
+
+PACKAGE = "osservaprezzi_carburanti"
+PACKAGE_DIR = Path(__file__).resolve().parent.parent / "custom_components" / PACKAGE
+
+
+def load(module: str):
+    """Importa `osservaprezzi_carburanti.<module>` senza eseguire il pacchetto `__init__`."""
+    if PACKAGE not in sys.modules:
+        pkg = types.ModuleType(PACKAGE)
+        pkg.__path__ = [str(PACKAGE_DIR)]
+        sys.modules[PACKAGE] = pkg
+    return importlib.import_module(f"{PACKAGE}.{module}")
@@ -0,0 +1,75 @@
+"""Benchmark: richieste e ritardo medio con polling fisso e adattivo.
+
+Simula una flotta di impianti che cambiano prezzo a orari tipici del mattino con
+periodi diversi (da giornaliero a settimanale) e confronta, su N giorni, il numero
+di richieste `servicearea/{id}` e il ritardo medio tra cambio e fetch.
+
+    python tools/bench_adaptive.py [--stations 50] [--days 30] [--interval 3600]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+from datetime import datetime, timezone
+
+from _integration import load
+
+adaptive = load("adaptive")
+
+DAY = 86400
+
+
+def _changes(start: float, days: int, rng: random.Random) -> list:
+    period = rng.choice([1, 1, 2, 3, 7, 7])
+    hour = rng.uniform(6, 9)
+    changes = []
+    day = rng.randrange(period)
+    while day < days:
+        changes.append(start + day * DAY + hour * 3600 + rng.uniform(-900, 900))
+        day += period
+    return changes
+
+
+def _simulate(changes: list, start: float, days: int, interval: float, use_adaptive: bool):
+    pattern = adaptive.UpdatePattern()
+    now, end = start, start + days * DAY
+    requests, delays, seen = 0, [], 0
+    while now < end:
+        requests += 1
+        visible = [c for c in changes if c <= now]
+        if len(visible) > seen:
+            delays.extend(now - c for c in visible[seen:])
+            seen = len(visible)
+        latest = visible[-1] if visible else None
+        ms = int(latest * 1000) if latest is not None else None
+        pattern.observe({"fuels": [{"validityDate": ms}]} if ms else {})
+        now += pattern.next_interval(now, interval) if use_adaptive else interval
+    return requests, delays
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=50)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--interval", type=int, default=3600)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    start = datetime(2024, 5, 1, tzinfo=timezone.utc).timestamp()
+    totals = {False: [0, []], True: [0, []]}
+    for _ in range(args.stations):
+        changes = _changes(start, args.days, rng)
+        for mode in totals:
+            requests, delays = _simulate(changes, start, args.days, args.interval, mode)
+            totals[mode][0] += requests
+            totals[mode][1].extend(delays)
+
+    print(f"{args.stations} impianti, {args.days} giorni, scan_interval {args.interval}s")
+    for mode, label in ((False, "fisso"), (True, "adattivo")):
+        requests, delays = totals[mode]
+        avg = sum(delays) / len(delays) / 60 if delays else 0
+        print(f"{label:>9}: {requests:>7} richieste, ritardo medio {avg:6.1f} min")
+
+
+if __name__ == "__main__":
+    main()
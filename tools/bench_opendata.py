@@ -0,0 +1,80 @@
+"""Benchmark: ingestione dei file open data MIMIT (righe/s e picco di memoria).
+
+Senza argomenti genera in una directory temporanea due CSV sintetici con la stessa
+struttura di `anagrafica_impianti_attivi.csv` e `prezzo_alle_8.csv` (default 22000
+impianti, come il dataset nazionale); con `--dir` usa i file reali già scaricati.
+
+    python tools/bench_opendata.py [--stations 22000] [--dir PATH]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from _integration import load
+
+const = load("const")
+opendata = load("opendata")
+
+FUELS = ["Benzina", "Gasolio", "GPL", "Metano", "HVO", "Blue Diesel"]
+
+
+def _generate(directory: str, stations: int) -> None:
+    rng = random.Random(1)
+    with open(os.path.join(directory, const.OPENDATA_REGISTRY_FILE), "w", encoding="utf-8") as handle:
+        handle.write("Estrazione del 2024-05-10\n")
+        handle.write("idImpianto|Gestore|Bandiera|Tipo Impianto|Nome Impianto|Indirizzo|Comune|Provincia|Latitudine|Longitudine\n")
+        for sid in range(1, stations + 1):
+            handle.write(
+                f"{sid}|GESTORE {sid} S.R.L.|{rng.choice(['Agip Eni', 'Q8', 'IP', 'Pompe Bianche'])}|Stradale|"
+                f"Impianto {sid}|VIA ROMA {sid}|MILANO|MI|{rng.uniform(36, 47):.6f}|{rng.uniform(6, 18):.6f}\n"
+            )
+    with open(os.path.join(directory, const.OPENDATA_PRICES_FILE), "w", encoding="utf-8") as handle:
+        handle.write("Estrazione del 2024-05-10\n")
+        handle.write("idImpianto|descCarburante|prezzo|isSelf|dtComu\n")
+        for sid in range(1, stations + 1):
+            for fuel in rng.sample(FUELS, 3):
+                for is_self in (1, 0):
+                    handle.write(f"{sid}|{fuel}|{rng.uniform(1.6, 2.1):.3f}|{is_self}|10/05/2024 07:{rng.randrange(60):02d}:00\n")
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux in KiB, macOS in byte
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=22000)
+    parser.add_argument("--dir", help="directory con i file open data reali")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.dir or tmp
+        if not args.dir:
+            _generate(directory, args.stations)
+        size = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in (const.OPENDATA_REGISTRY_FILE, const.OPENDATA_PRICES_FILE)
+        )
+        baseline = _peak_rss_mb()
+        start = time.perf_counter()
+        table = opendata.load_table(directory)
+        elapsed = time.perf_counter() - start
+
+    rows = len(table) + table.price_rows
+    print(f"file: {size / 1e6:.1f} MB, {len(table)} impianti, {table.price_rows} prezzi")
+    print(f"tempo: {elapsed:.2f}s, {rows / elapsed:,.0f} righe/s")
+    print(f"picco RSS: {_peak_rss_mb():.1f} MB (prima dell'ingestione {baseline:.1f} MB)")
+    sample = next(iter(table.stations))
+    print(f"payload impianto {sample}: {len(table.payload(sample)['fuels'])} carburanti")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark: classifica incrementale (`ranking.PriceRanking`) contro ricalcolo completo.
+
+Simula N impianti e una sequenza di cambi di prezzo; per ogni cambio misura il
+costo di aggiornare min/media/mediana/spread e i primi k, confrontandolo con
+l'ordinamento di tutti i prezzi (come fa un template che itera sui sensori).
+
+    python tools/bench_ranking.py [--stations 2000] [--updates 20000] [--k 5]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import time
+
+from _integration import load
+
+ranking = load("ranking")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=2000)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    prices = {sid: round(rng.uniform(1.6, 2.1), 3) for sid in range(args.stations)}
+    updates = [(rng.randrange(args.stations), round(rng.uniform(1.6, 2.1), 3)) for _ in range(args.updates)]
+
+    rank = ranking.PriceRanking()
+    for sid, price in prices.items():
+        rank.update(sid, price)
+    start = time.perf_counter()
+    for sid, price in updates:
+        rank.update(sid, price)
+        rank.top(args.k)
+        (rank.minimum, rank.average, rank.median, rank.spread)
+    incremental = (time.perf_counter() - start) / len(updates) * 1e6
+
+    current = dict(prices)
+    start = time.perf_counter()
+    for sid, price in updates:
+        current[sid] = price
+        ordered = sorted((p, s) for s, p in current.items())
+        values = [p for p, _ in ordered]
+        (ordered[: args.k], values[0], sum(values) / len(values), statistics.median(values), values[-1] - values[0])
+    full = (time.perf_counter() - start) / len(updates) * 1e6
+
+    print(f"{args.stations} impianti, {args.updates} cambi di prezzo, top {args.k}")
+    print(f"incrementale: {incremental:8.1f} µs/cambio")
+    print(f" ricalcolo:   {full:8.1f} µs/cambio ({full / incremental:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
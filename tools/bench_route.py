@@ -0,0 +1,68 @@
+"""Benchmark: impianti lungo un percorso (`route.stations_along_route`).
+
+Indicizza N impianti casuali nel riquadro dell'Italia e cerca quelli entro
+`--buffer` km da un percorso Milano-Bologna-Firenze-Roma (circa 500 km) reso
+con `--points` punti; con `--compare` confronta con il controllo di ogni impianto
+contro ogni segmento (lento: usare pochi punti).
+
+    python tools/bench_route.py [--stations 25000] [--points 5000] [--buffer 2] [--compare]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from _integration import load
+
+helpers = load("helpers")
+route = load("route")
+
+CITIES = [(45.4642, 9.19), (44.4949, 11.3426), (43.7696, 11.2558), (41.9028, 12.4964)]
+
+
+def _polyline(points: int) -> list:
+    per_leg = max(1, points // (len(CITIES) - 1))
+    result = []
+    for a, b in zip(CITIES, CITIES[1:]):
+        result.extend((a[0] + (b[0] - a[0]) * i / per_leg, a[1] + (b[1] - a[1]) * i / per_leg) for i in range(per_leg))
+    result.append(CITIES[-1])
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=25000)
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--buffer", type=float, default=2.0)
+    parser.add_argument("--compare", action="store_true")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    points = {i: (rng.uniform(36.6, 47.1), rng.uniform(6.6, 18.5)) for i in range(args.stations)}
+    index = helpers.SpatialIndex.from_points(points)
+    polyline = _polyline(args.points)
+
+    start = time.perf_counter()
+    found = route.stations_along_route(index, polyline, args.buffer)
+    indexed = time.perf_counter() - start
+
+    print(f"{args.stations} impianti, percorso di {len(polyline)} punti, fascia {args.buffer} km")
+    print(f"   indice: {indexed * 1000:8.1f} ms, {len(found)} impianti")
+    if not args.compare:
+        return
+
+    # riferimento: ogni impianto contro ogni segmento, senza indice
+    start = time.perf_counter()
+    segments = list(zip(polyline, polyline[1:]))
+    linear = set()
+    for key, (lat, lon) in points.items():
+        if any(route._segment_distance(lat, lon, a, b, 0.0)[0] <= args.buffer for a, b in segments):
+            linear.add(key)
+    full = time.perf_counter() - start
+
+    print(f"scansione: {full * 1000:8.1f} ms, {len(linear)} impianti")
+
+
+if __name__ == "__main__":
+    main()
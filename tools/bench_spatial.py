@@ -0,0 +1,55 @@
+"""Benchmark: ricerche per raggio e k più vicini su `helpers.SpatialIndex`.
+
+Indicizza N impianti casuali nel riquadro dell'Italia e misura il tempo medio per
+ricerca, confrontandolo con la scansione lineare di tutti gli impianti.
+
+    python tools/bench_spatial.py [--stations 25000] [--queries 2000] [--radius 5] [--k 10]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from _integration import load
+
+helpers = load("helpers")
+
+
+def _timed(fn, queries) -> float:
+    start = time.perf_counter()
+    for lat, lon in queries:
+        fn(lat, lon)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=25000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--radius", type=float, default=5.0)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    points = {i: (rng.uniform(36.6, 47.1), rng.uniform(6.6, 18.5)) for i in range(args.stations)}
+    queries = [(rng.uniform(37, 46), rng.uniform(7, 18)) for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    index = helpers.SpatialIndex.from_points(points)
+    build = time.perf_counter() - start
+
+    def linear(lat, lon):
+        return sorted(
+            (d, i) for i, (plat, plon) in points.items()
+            if (d := helpers.haversine_km(lat, lon, plat, plon)) <= args.radius
+        )
+
+    print(f"{args.stations} impianti, indice costruito in {build * 1000:.1f} ms")
+    print(f"raggio {args.radius} km: {_timed(lambda a, b: index.within(a, b, args.radius), queries):8.1f} µs/ricerca")
+    print(f"{args.k} più vicini:   {_timed(lambda a, b: index.nearest(a, b, args.k), queries):8.1f} µs/ricerca")
+    print(f"scansione lineare: {_timed(linear, queries[:50]):8.1f} µs/ricerca")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark: tempo di avvio con refresh iniziali sequenziali o paralleli.
+
+Simula un'API MIMIT con latenza fissa per richiesta e misura il tempo necessario
+a completare il primo refresh di 1, 50 e 500 impianti, prima in sequenza (come
+nel setup originale) e poi con `async_run_bounded` al limite di concorrenza dato.
+
+    python tools/bench_startup.py [--latency 0.05] [--concurrency 8] [--stations 1 50 500]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+from _integration import load
+
+helpers = load("helpers")
+
+
+class FakeAPI:
+    """API finta: ogni dettaglio impianto costa `latency` secondi."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.in_flight = 0
+        self.peak = 0
+
+    async def get_station_details(self, station_id: int) -> dict:
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return {"id": station_id, "fuels": []}
+        finally:
+            self.in_flight -= 1
+
+
+async def _sequential(api: FakeAPI, stations: list) -> None:
+    for sid in stations:
+        await api.get_station_details(sid)
+
+
+async def _bounded(api: FakeAPI, stations: list, concurrency: int) -> None:
+    await helpers.async_run_bounded(stations, api.get_station_details, concurrency)
+
+
+def _measure(coro_factory) -> float:
+    start = time.perf_counter()
+    asyncio.run(coro_factory())
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stations", type=int, nargs="+", default=[1, 50, 500])
+    args = parser.parse_args()
+
+    print(f"latenza {args.latency * 1000:.0f} ms, concorrenza {args.concurrency}")
+    print(f"{'impianti':>9} {'sequenziale':>12} {'parallelo':>10} {'picco':>6} {'speedup':>8}")
+    for count in args.stations:
+        stations = list(range(count))
+        seq = _measure(lambda: _sequential(FakeAPI(args.latency), stations))
+        api = FakeAPI(args.latency)
+        par = _measure(lambda: _bounded(api, stations, args.concurrency))
+        print(f"{count:>9} {seq:>11.2f}s {par:>9.2f}s {api.peak:>6} {seq / par:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
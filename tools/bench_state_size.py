@@ -0,0 +1,137 @@
+"""Benchmark: byte registrati dal recorder per ogni scrittura di stato.
+
+Confronta gli attributi dei sensori meta e carburante prima (logo base64 inline,
+`raw` registrato) e dopo (URL del logo, attributi pesanti esclusi dal recorder,
+opzione `include_raw` disattivata).
+
+    python tools/bench_state_size.py [--fuels 12] [--logo-kb 8]
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import dataclasses
+import json
+import os
+
+from _integration import load
+
+snapshot = load("snapshot")
+logos = load("logos")
+
+META_UNRECORDED = {"raw", "brand_logo"}
+FUEL_UNRECORDED = {"raw_fuel", "brand_logo"}
+
+
+def _payload(fuels: int) -> dict:
+    names = ["Benzina", "Gasolio", "GPL", "Metano", "HVO", "Blue Diesel", "Hi-Q Diesel"]
+    return {
+        "id": 48524,
+        "name": "Distributore Ener Coop",
+        "company": "Coop Lombardia",
+        "brand": "Enercoop",
+        "brandId": 99,
+        "address": "Via Roma 10",
+        "latitude": 45.46,
+        "longitude": 9.19,
+        "insertDate": "2024-05-10T08:00:00Z",
+        "phoneNumber": "021234567",
+        "services": [{"id": i, "description": f"Servizio {i}"} for i in range(8)],
+        "orariapertura": [{"giornoSettimanaId": d, "oraAperturaMattina": "07:00"} for d in range(1, 8)],
+        "fuels": [
+            {
+                "id": i,
+                "name": names[i % len(names)] + ("" if i < len(names) * 2 else f" {i}"),
+                "isSelf": bool(i % 2),
+                "price": 1.7 + i / 100,
+                "fuelId": i,
+                "serviceAreaId": 48524,
+                "insertDate": "2024-05-10T08:00:00Z",
+                "validityDate": 1715328000000,
+            }
+            for i in range(fuels)
+        ],
+    }
+
+
+def _meta_attrs(snap, data, include_raw: bool) -> dict:
+    attrs = {
+        "company": snap.company,
+        "name": snap.name,
+        "address": snap.address,
+        "brand": snap.brand,
+        "brand_logo": snap.logo,
+        "station_type": snap.station_type or "Sconosciuto",
+        "insert_date": snap.insert_date,
+        "latitude": snap.coordinates[0],
+        "longitude": snap.coordinates[1],
+    }
+    if include_raw:
+        attrs["raw"] = data
+    return attrs
+
+
+def _fuel_attrs(snap, fuel, include_raw: bool) -> dict:
+    attrs = {
+        "station_id": 48524,
+        "fuel_name": fuel.name,
+        "is_self": fuel.is_self,
+        "company": snap.company,
+        "name": snap.name,
+        "address": snap.address,
+        "validity_date": fuel.validity_date,
+        "brand_logo": snap.logo,
+        "attribution": "Dati da Osservaprezzi (MIMIT)",
+    }
+    if include_raw:
+        attrs["raw_fuel"] = dict(fuel.raw)
+    return attrs
+
+
+def _recorded_bytes(attrs: dict, unrecorded: set) -> int:
+    recorded = {k: v for k, v in attrs.items() if k not in unrecorded}
+    return len(json.dumps(recorded, separators=(",", ":"), default=str).encode())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fuels", type=int, default=12)
+    parser.add_argument("--logo-kb", type=int, default=8)
+    args = parser.parse_args()
+
+    data = _payload(args.fuels)
+    body = os.urandom(args.logo_kb * 1024)
+    logo = "data:image/png;base64," + base64.b64encode(body).decode()
+    store = logos.LogoStore()
+    store.add((99, "Enercoop"), "image/png", body)
+
+    before = snapshot.build_snapshot(data, {})
+    # prima: il logo era il data URI stesso e tutti gli attributi finivano nel recorder
+    before = dataclasses.replace(before, logo=logo)
+    after = snapshot.build_snapshot(data, store)
+
+    rows = [
+        ("meta, prima", _recorded_bytes(_meta_attrs(before, data, True), set())),
+        ("meta, dopo", _recorded_bytes(_meta_attrs(after, data, True), META_UNRECORDED)),
+        ("meta, dopo (include_raw: false)", _recorded_bytes(_meta_attrs(after, data, False), META_UNRECORDED)),
+    ]
+    fuel_before = sum(_recorded_bytes(_fuel_attrs(before, f, True), set()) for f in before.fuels.values())
+    fuel_after = sum(_recorded_bytes(_fuel_attrs(after, f, True), FUEL_UNRECORDED) for f in after.fuels.values())
+    n = max(1, len(after.fuels))
+    rows += [
+        ("carburante, prima (media)", fuel_before // n),
+        ("carburante, dopo (media)", fuel_after // n),
+    ]
+    total_before = rows[0][1] + fuel_before
+    total_after = rows[1][1] + fuel_after
+
+    print(f"logo brand: {len(logo)} byte come data URI, URL: {after.logo}")
+    for label, size in rows:
+        print(f"{label:<36} {size:>8} byte/scrittura")
+    print(f"{'impianto completo, prima':<36} {total_before:>8} byte/ciclo")
+    print(f"{'impianto completo, dopo':<36} {total_after:>8} byte/ciclo")
+    print(f"riduzione: {100 * (1 - total_after / total_before):.1f}%")
+
+
+if __name__ == "__main__":
+    main()